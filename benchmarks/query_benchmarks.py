@@ -0,0 +1,121 @@
+"""
+Gab Tidy Data query benchmarks
+
+Loads generated Garc data (see gab_tidy_data.synthetic_data) without any query indexes,
+times a set of representative research queries, builds the query indexes (see
+gab_to_sqlite.query_indexes) and times the same queries again.
+
+Run with "nox -s query_benchmark", or directly:
+
+    python benchmarks/query_benchmarks.py --lines 100000
+"""
+
+import sqlite3
+import tempfile
+import time
+from contextlib import closing
+from pathlib import Path
+
+import click
+
+import gab_tidy_data.gab_to_sqlite as gts
+from gab_tidy_data.synthetic_data import write_jsonl
+
+# Name: (SQL, parameters)
+queries = {
+    "gabs in one day": (
+        """
+        select count(*) from gab
+        where created_at_parsed
+            between julianday('2021-01-02') and julianday('2021-01-03')
+        """,
+        [],
+    ),
+    "gabs by an account": ("select * from gab where account_id = ?", ["7"]),
+    "latest gabs by an account": (
+        "select * from gab_unique where account_id = ? order by created_at_parsed",
+        ["7"],
+    ),
+    "gabs in a group": ("select count(*) from gab where group_id = ?", ["3"]),
+    "quotes of a gab": (
+        "select * from gab where quote_of_id = ?",
+        ["100000000000000100"],
+    ),
+    "replies to a gab": (
+        "select * from gab where in_reply_to_id = ?",
+        ["100000000000000100"],
+    ),
+    "gabs with a tag": (
+        """
+        select gab_unique.* from gab_tag
+        join gab_unique on gab_unique.id = gab_tag.gab_id
+        where gab_tag.name = ?
+        """,
+        ["tag42"],
+    ),
+    "mentions of an account": (
+        "select gab_id from gab_mention where account_id = ?",
+        ["7"],
+    ),
+    "media of an account's gabs": (
+        """
+        select media_attachment.* from gab_unique
+        join gab_media_attachment on gab_media_attachment.gab_id = gab_unique.id
+        join media_attachment
+            on media_attachment.id = gab_media_attachment.media_attachment_id
+        where gab_unique.account_id = ?
+        """,
+        ["7"],
+    ),
+}
+
+
+def time_queries(db_connection: sqlite3.Connection, repeats: int) -> dict:
+    """Fastest time of each query over repeats runs, in seconds"""
+    timings = {}
+    for name, (sql, parameters) in queries.items():
+        fastest = None
+        for _ in range(repeats):
+            started = time.perf_counter()
+            db_connection.execute(sql, parameters).fetchall()
+            elapsed = time.perf_counter() - started
+            fastest = elapsed if fastest is None else min(fastest, elapsed)
+        timings[name] = fastest
+
+    return timings
+
+
+@click.command()
+@click.option("--lines", type=click.IntRange(min=1), default=50_000, show_default=True)
+@click.option("--seed", type=int, default=0, show_default=True)
+@click.option("--repeats", type=click.IntRange(min=1), default=3, show_default=True)
+def main(lines, seed, repeats):
+    """Times research queries before and after building the query indexes"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        json_path = Path(work_dir) / "synthetic.jsonl"
+        write_jsonl(json_path, lines, seed)
+
+        with closing(sqlite3.connect(Path(work_dir) / "benchmark.db")) as db_connection:
+            gts.initialise_empty_database(db_connection)
+            with open(json_path, "rb") as json_fh:
+                gts.load_file_to_sqlite(json_fh, db_connection)
+
+            before = time_queries(db_connection, repeats)
+
+            started = time.perf_counter()
+            gts.create_query_indexes(db_connection)
+            click.echo(f"Built query indexes in {time.perf_counter() - started:.2f}s")
+
+            after = time_queries(db_connection, repeats)
+
+    click.echo(f"{'query':<28} {'before':>10} {'after':>10} {'speedup':>9}")
+    for name in queries:
+        speedup = before[name] / after[name] if after[name] else float("inf")
+        click.echo(
+            f"{name:<28} {before[name] * 1000:8.2f}ms {after[name] * 1000:8.2f}ms "
+            f"{speedup:8.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""
+Gab Tidy Data loading benchmarks
+
+Loads generated Garc data (see gab_tidy_data.synthetic_data) with the gab_tidy_data
+command in several configurations, timing each load end to end and by stage (using
+--metrics-out), and compares the throughput and the time taken by each stage with the
+baselines in baselines.json.
+
+Run with "nox -s benchmark", or directly:
+
+    python benchmarks/run_benchmarks.py --lines 100000
+
+Baselines depend heavily on the machine they were recorded on. Record baselines for
+your machine with --update-baselines before comparing against them.
+"""
+
+import json
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import click
+
+from gab_tidy_data.synthetic_data import write_jsonl
+
+baselines_path = Path(__file__).parent.resolve() / "baselines.json"
+
+# Stages which take a fraction of a second vary by more than the tolerance from run to
+# run, so a stage also has to be at least this many seconds slower than its baseline to
+# count as slower
+min_stage_slowdown = 0.1
+
+# Name: (input file suffix, extra gab_tidy_data options)
+scenarios = {
+    "serial": (".jsonl", []),
+    "workers": (".jsonl", ["--workers", "4"]),
+    "bulk_load": (".jsonl", ["--bulk-load"]),
+    "gzip": (".jsonl.gz", []),
+    # Transaction sizes (see --commit-every), compared with the default of 100000 lines
+    # in "serial"
+    "commit_1k": (".jsonl", ["--commit-every", "1000"]),
+    "commit_16MB": (".jsonl", ["--commit-every", "16MB"]),
+    "commit_end": (".jsonl", ["--commit-every", "0"]),
+}
+
+
+def run_scenario(input_path: Path, options, work_dir: Path) -> dict:
+    """Loads input_path into a new database, returning the load metrics"""
+    db_path = work_dir / "benchmark.db"
+    metrics_path = work_dir / "metrics.json"
+    db_path.unlink(missing_ok=True)
+
+    started = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "-m", "gab_tidy_data", str(input_path), str(db_path)]
+        + options
+        + ["--no-progress", "--metrics-out", str(metrics_path)],
+        check=True,
+        cwd=work_dir,
+        stdout=subprocess.DEVNULL,
+    )
+    elapsed = time.perf_counter() - started
+
+    metrics = json.loads(metrics_path.read_text())
+    metrics["end_to_end_seconds"] = elapsed
+    metrics["end_to_end_lines_per_second"] = metrics["lines_read"] / elapsed
+    return metrics
+
+
+def format_result(name: str, metrics: dict, baseline: dict) -> str:
+    rate = metrics["end_to_end_lines_per_second"]
+    baseline_rate = baseline.get("lines_per_second")
+    baseline_stages = baseline.get("stage_seconds", {})
+
+    stages = []
+    for stage, stage_metrics in metrics["stages"].items():
+        seconds = stage_metrics["seconds"]
+        baseline_seconds = baseline_stages.get(stage)
+        stage_comparison = (
+            f" ({seconds / baseline_seconds - 1:+.0%})" if baseline_seconds else ""
+        )
+        stages.append(f"{stage} {seconds:.2f}s{stage_comparison}")
+
+    comparison = (
+        f" ({rate / baseline_rate - 1:+.0%} vs baseline)" if baseline_rate else ""
+    )
+    return (
+        f"{name:<12} {metrics['end_to_end_seconds']:7.2f}s {rate:9.0f} lines/s"
+        f"{comparison}\n             {', '.join(stages)}"
+    )
+
+
+def find_regressions(metrics: dict, baseline: dict, tolerance: float) -> list:
+    """
+    What was slower than the baseline by more than tolerance: "lines/s" for the end to
+    end throughput, and the name of each stage which took longer (by at least
+    min_stage_slowdown seconds)
+    """
+    regressions = []
+
+    baseline_rate = baseline.get("lines_per_second")
+    rate = metrics["end_to_end_lines_per_second"]
+    if baseline_rate and rate < baseline_rate * (1 - tolerance):
+        regressions.append("lines/s")
+
+    baseline_stages = baseline.get("stage_seconds", {})
+    for stage, stage_metrics in metrics["stages"].items():
+        baseline_seconds = baseline_stages.get(stage)
+        if baseline_seconds is None:
+            continue
+        seconds = stage_metrics["seconds"]
+        if (
+            seconds > baseline_seconds * (1 + tolerance)
+            and seconds - baseline_seconds >= min_stage_slowdown
+        ):
+            regressions.append(stage)
+
+    return regressions
+
+
+@click.command()
+@click.option("--lines", type=click.IntRange(min=1), default=20_000, show_default=True)
+@click.option("--seed", type=int, default=0, show_default=True)
+@click.option(
+    "--scenario",
+    "selected",
+    type=click.Choice(list(scenarios)),
+    multiple=True,
+    help="Scenarios to run. Defaults to all of them.",
+)
+@click.option(
+    "--tolerance",
+    type=click.FloatRange(0, 1),
+    default=0.2,
+    show_default=True,
+    help=(
+        "How much slower than the baseline a scenario, or any stage of it, can be "
+        "before it fails."
+    ),
+)
+@click.option(
+    "--update-baselines",
+    is_flag=True,
+    help="Record the results as the new baselines.",
+)
+def main(lines, seed, selected, tolerance, update_baselines):
+    """Benchmarks loading generated data, comparing against stored baselines"""
+    baselines = (
+        json.loads(baselines_path.read_text()) if baselines_path.exists() else {}
+    )
+    regressions = []
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        work_dir = Path(work_dir)
+        inputs = {}
+
+        for name in selected or scenarios:
+            suffix, options = scenarios[name]
+            if suffix not in inputs:
+                inputs[suffix] = work_dir / f"synthetic{suffix}"
+                write_jsonl(inputs[suffix], lines, seed)
+
+            metrics = run_scenario(inputs[suffix], options, work_dir)
+            key = f"{name}@{lines}"
+            baseline = baselines.get(key, {})
+            click.echo(format_result(name, metrics, baseline))
+
+            slower = find_regressions(metrics, baseline, tolerance)
+            if slower:
+                regressions.append(f"{name} ({', '.join(slower)})")
+            if update_baselines:
+                baselines[key] = {
+                    "lines_per_second": round(metrics["end_to_end_lines_per_second"]),
+                    "stage_seconds": {
+                        stage: round(stage_metrics["seconds"], 3)
+                        for stage, stage_metrics in metrics["stages"].items()
+                    },
+                }
+
+    if update_baselines:
+        baselines_path.write_text(
+            json.dumps(baselines, indent=2, sort_keys=True) + "\n"
+        )
+        click.echo(f"Baselines written to {baselines_path}")
+    elif regressions:
+        raise click.ClickException(
+            f"Slower than baseline by more than {tolerance:.0%}: "
+            + ", ".join(regressions)
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,75 +1,749 @@
 import click
 import logging
+import re
 import sqlite3
+import sys
 from os import path
 import datetime as dt
+from contextlib import closing, nullcontext
 
 import gab_tidy_data.gab_to_sqlite as gts
+import gab_tidy_data.input_files as input_files
+import gab_tidy_data.full_text as full_text
+from gab_tidy_data.export import export_formats, export_table, format_from_filename
+from gab_tidy_data.follow import follow_files
+from gab_tidy_data.merge import merge_database
+from gab_tidy_data.metrics import IngestMetrics
+from gab_tidy_data.quarantine import Quarantine
+from gab_tidy_data.row_cache import WrittenRowCache
+from gab_tidy_data.shards import load_files_sharded
 
 logging.basicConfig(filename="gab_tidy_data.log", level=logging.INFO)
 
 logger = logging.getLogger(__name__)
 
+log_level_option = click.option(
+    "--log_level", type=click.Choice(["warning", "info", "debug"], case_sensitive=False)
+)
 
-@click.command()
-@click.argument("json_files", type=click.File("r"), nargs=-1)
-@click.argument(
-    "database_filename", type=click.Path(dir_okay=False, writable=True), required=True
+quarantine_option = click.option(
+    "--quarantine",
+    "quarantine_path",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Write lines which fail to parse or map, with their line numbers and errors, "
+    "to this gzip compressed JSON lines file. Added to if it already exists.",
 )
-@click.option(
-    "--log_level", type=click.Choice(["warning", "info", "debug"], case_sensitive=False)
+
+
+def parse_index_names(ctx, param, value):
+    if value == "all":
+        return list(gts.query_indexes)
+    elif value == "none":
+        return []
+
+    index_names = [name.strip() for name in value.split(",") if name.strip()]
+    unknown = [name for name in index_names if name not in gts.query_indexes]
+    if unknown:
+        raise click.BadParameter(f"unknown indexes {', '.join(unknown)}")
+
+    return index_names
+
+
+indexes_option = click.option(
+    "--indexes",
+    default="all",
+    show_default=True,
+    callback=parse_index_names,
+    help="Indexes to build for faster queries: all, none, or a comma separated list "
+    f"of index names from: {', '.join(gts.query_indexes)}.",
 )
-def gab_tidy_data(json_files, database_filename, log_level):
+
+
+# Number of bytes in each unit --commit-every can be given in
+size_units = {
+    "b": 1,
+    "kb": 1000,
+    "mb": 1000**2,
+    "gb": 1000**3,
+    "kib": 1024,
+    "mib": 1024**2,
+    "gib": 1024**3,
+}
+
+
+def parse_commit_interval(ctx, param, value):
+    """
+    Parses an interval between commits, given as a number of lines ("100000" or
+    "100000lines") or a size of input ("256MB"), into (lines, bytes), one of which is
+    None.
+    """
+    match = re.fullmatch(r"(\d+)\s*([a-z]*)", value.strip().lower())
+    if match is None or match[2] not in ("", "lines", *size_units):
+        raise click.BadParameter(
+            f"{value!r} is not a number of lines (e.g. 100000) or a size (e.g. 256MB)"
+        )
+
+    number, unit = int(match[1]), match[2]
+    if unit in ("", "lines"):
+        return number, None
+    return None, number * size_units[unit]
+
+
+class DefaultCommandGroup(click.Group):
+    """
+    Command group which runs default_command if no other command is named, so that
+    "gab_tidy_data data_file.jsonl database.db" still loads files.
+    """
+
+    default_command = "load"
+
+    def parse_args(self, ctx, args):
+        if not args or (args[0] not in self.commands and args[0] != "--help"):
+            args.insert(0, self.default_command)
+
+        return super().parse_args(ctx, args)
+
+
+@click.group(cls=DefaultCommandGroup)
+def gab_tidy_data():
+    """
+    Loads Gab data from Garc into an SQLite database. Running gab_tidy_data without a
+    command runs the load command.
+    """
+
+
+def set_log_level(log_level):
     if log_level == "warning":
         logger.setLevel(logging.WARNING)
     elif log_level == "debug":
         logger.setLevel(logging.DEBUG)
         logger.debug("debug logging mode")
 
+
+def schema_mismatch(database_filename) -> click.ClickException:
+    return click.ClickException(
+        f"Database {database_filename} already exists, and uses a database schema that "
+        "is a different version from the schema in the version of Gab Tidy Data you "
+        "are currently using. Databases from before the gab_unique, account_unique "
+        "and gab_group_unique tables were added can be upgraded with "
+        f"'gab_tidy_data rebuild-unique {database_filename}'. Otherwise, you will need "
+        "to reload your data (including any files previously loaded into "
+        f"{database_filename}) into a new database file."
+    )
+
+
+@gab_tidy_data.command()
+@click.argument("json_files", type=click.File("rb"), nargs=-1)
+@click.argument(
+    "database_filename", type=click.Path(dir_okay=False, writable=True), required=True
+)
+@log_level_option
+@click.option(
+    "--workers",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Number of processes to use for parsing the JSON files. The database is "
+    "always written to by a single process.",
+)
+@click.option(
+    "--batch-size",
+    type=click.IntRange(min=1),
+    default=5000,
+    show_default=True,
+    help="Number of posts to collect before inserting them into the database.",
+)
+@click.option(
+    "--bulk-load",
+    is_flag=True,
+    help="Use faster but less crash-safe database settings while loading, and build "
+    "indexes once loading has finished. Recommended for large initial loads.",
+)
+@click.option(
+    "--json-decoder",
+    type=click.Choice(["auto"] + input_files.json_decoder_names),
+    default="auto",
+    show_default=True,
+    help="JSON decoder to use. auto uses the fastest one installed.",
+)
+@click.option(
+    "--row-cache-size",
+    type=click.IntRange(min=0),
+    default=100_000,
+    show_default=True,
+    help="Number of emoji, card, group and media rows to remember, so that unchanged "
+    "copies of them aren't written to the database again. 0 turns this off.",
+)
+@click.option(
+    "--commit-every",
+    "--checkpoint-every",
+    "commit_every",
+    default="100000",
+    show_default=True,
+    callback=parse_commit_interval,
+    help="How often to commit and save progress through each file, so that the "
+    "database can be read while loading and an interrupted load can carry on where it "
+    "stopped. Either a number of lines, or a size of (decompressed) input such as "
+    "256MB or 1GiB. 0 only commits at the end of each file. Input which can't be "
+    "resumed, such as stdin, is always only committed at the end.",
+)
+@click.option(
+    "--reload",
+    is_flag=True,
+    help="Load files even if they have already been loaded into the database.",
+)
+@click.option(
+    "--clean-content",
+    is_flag=True,
+    help="Also store the text of each post without HTML, with and without URLs, and "
+    "the URLs in it in the gab_url table.",
+)
+@quarantine_option
+@click.option(
+    "--storage-mode",
+    "storage_modes",
+    type=click.Choice(list(gts.storage_modes)),
+    multiple=True,
+    help="Store some data in a smaller form, which can be given more than once. Only "
+    "used when creating a new database. account_snapshots only stores an account's "
+    "profile again when it has changed, rather than once for every file, and "
+    "gab_observations does the same for gabs. url_dictionary stores the common "
+    "beginnings of URLs once (not with account_snapshots).",
+)
+@indexes_option
+@click.option(
+    "--full-text",
+    "full_text_index",
+    is_flag=True,
+    help="Build a full-text search index over gab and account text once loading has "
+    "finished. Once built, it is kept up to date by later loads.",
+)
+@click.option(
+    "--shards",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Number of processes to load the JSON files with, each writing a group of "
+    "files to its own temporary database, which are then merged into the database. "
+    "Each group is loaded with a single worker.",
+)
+@click.option(
+    "--profile",
+    is_flag=True,
+    help="Time JSON decoding and data mapping separately for every line, and show a "
+    "breakdown of where the time went once loading has finished.",
+)
+@click.option(
+    "--metrics-out",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Write timings, throughput and memory use for this load to this JSON file.",
+)
+@click.option(
+    "--progress/--no-progress",
+    default=None,
+    help="Show progress through each file on stderr. On by default when stderr is a "
+    "terminal.",
+)
+def load(
+    json_files,
+    database_filename,
+    log_level,
+    workers,
+    batch_size,
+    bulk_load,
+    json_decoder,
+    row_cache_size,
+    commit_every,
+    reload,
+    clean_content,
+    quarantine_path,
+    storage_modes,
+    indexes,
+    full_text_index,
+    shards,
+    profile,
+    metrics_out,
+    progress,
+):
+    """Loads Garc JSON files into the database, creating it if it doesn't exist"""
+    set_log_level(log_level)
+
+    try:
+        input_files.get_json_decoder(json_decoder)
+    except RuntimeError as e:
+        raise click.BadParameter(str(e), param_hint="--json-decoder")
+
+    if shards > 1 and any(not path.isfile(json_file.name) for json_file in json_files):
+        raise click.BadParameter(
+            "sharded loading needs files on disk, not standard input",
+            param_hint="--shards",
+        )
+
     logger.info(f"Loading {len(json_files)} JSON files into {database_filename}")
     click.echo(f"Loading {len(json_files)} JSON files into {database_filename}")
 
     db_is_new = True if not path.exists(database_filename) else False
 
+    if progress is None:
+        progress = sys.stderr.isatty()
+    metrics = IngestMetrics(profile=profile)
+
     with sqlite3.connect(database_filename) as db_connection:
-        # Check for database and initialise if needed
-        if db_is_new:
-            logger.debug("New database created")
-            gts.initialise_empty_database(db_connection)
-        else:
+        # Check the schema of an existing database before changing anything in it
+        if not db_is_new:
             logger.debug("Connected to existing database")
             if not gts.schema_is_current(db_connection):
                 # Sometimes the error message comes before the "Loading" echo statement
                 # above and it's confusing to read. The following echo should confirm to
                 # the user that their files weren't loaded.
                 click.echo("Files not loaded.")
-                raise click.ClickException(
-                    f"Database {database_filename} already exists, and uses a database "
-                    "schema that is a different version from the schema in the version "
-                    "of Gab Tidy Data you are currently using. You will need to reload"
-                    "your data (including any files previously loaded into "
-                    f"{database_filename}) into a new database file."
+                raise schema_mismatch(database_filename)
+            existing_modes = gts.database_storage_modes(db_connection)
+            if storage_modes and set(storage_modes) != set(existing_modes):
+                click.echo("Files not loaded.")
+                raise click.BadParameter(
+                    f"{database_filename} already exists with storage modes "
+                    f"{', '.join(existing_modes) or 'none'}. Storage modes can only be "
+                    "chosen for a new database.",
+                    param_hint="--storage-mode",
                 )
 
-        time_started = dt.datetime.utcnow()
+        if bulk_load:
+            logger.info("Loading in bulk load mode")
+            load_context = gts.bulk_load(db_connection, new_database=db_is_new)
+        else:
+            load_context = nullcontext()
 
-        for json_file in json_files:
-            added, fails = gts.load_file_to_sqlite(json_file, db_connection)
+        quarantine_context = (
+            Quarantine(quarantine_path) if quarantine_path else nullcontext()
+        )
 
-            click.echo(
-                f"- {json_file.name} loaded: {added} posts added; {fails} failed to add"
-            )
+        with load_context, quarantine_context as quarantine:
+            # Initialise the new database inside the bulk load context, as some bulk
+            # load settings must be applied before any tables are created
+            if db_is_new:
+                logger.debug("New database created")
+                gts.initialise_empty_database(db_connection, storage_modes)
+
+            checkpoint_every, checkpoint_every_bytes = commit_every
+            time_started = dt.datetime.utcnow()
+            row_cache = WrittenRowCache(row_cache_size)
+
+            files_to_shard = []
+            # Fingerprints of files_to_shard, which aren't in the database until the
+            # shards are merged
+            fingerprints_to_shard = set()
+
+            for json_file in json_files:
+                file_fingerprint = input_files.fingerprint(json_file)
+                previous_load = gts.find_inserted_file(db_connection, file_fingerprint)
+                if previous_load is not None:
+                    if previous_load.num_gabs_inserted is None:
+                        click.echo(
+                            f"- {json_file.name}: resuming from line "
+                            f"{(previous_load.lines_read or 0) + 1}"
+                        )
+                    elif not reload:
+                        click.echo(f"- {json_file.name} skipped: already loaded")
+                        continue
+
+                # Interrupted loads are always resumed here rather than in a shard
+                resuming = (
+                    previous_load is not None
+                    and previous_load.num_gabs_inserted is None
+                )
+                if shards > 1 and not resuming:
+                    if file_fingerprint in fingerprints_to_shard and not reload:
+                        click.echo(f"- {json_file.name} skipped: already loaded")
+                        continue
+                    files_to_shard.append(json_file.name)
+                    fingerprints_to_shard.add(file_fingerprint)
+                    continue
+
+                added, fails = gts.load_file_to_sqlite(
+                    json_file,
+                    db_connection,
+                    workers=workers,
+                    batch_size=batch_size,
+                    json_decoder=json_decoder,
+                    row_cache=row_cache,
+                    checkpoint_every=checkpoint_every,
+                    checkpoint_every_bytes=checkpoint_every_bytes,
+                    skip_loaded=not reload,
+                    metrics=metrics,
+                    progress=progress,
+                    clean_content=clean_content,
+                    quarantine=quarantine,
+                )
+
+                click.echo(
+                    f"- {json_file.name} loaded: {added} posts added; {fails} failed "
+                    "to add"
+                )
+
+            if files_to_shard:
+                logger.info(f"Loading {len(files_to_shard)} files in {shards} shards")
+                sharded_results = load_files_sharded(
+                    files_to_shard,
+                    db_connection,
+                    shards,
+                    shard_directory=path.dirname(path.abspath(database_filename)),
+                    metrics=metrics,
+                    batch_size=batch_size,
+                    json_decoder=json_decoder,
+                    checkpoint_every=checkpoint_every,
+                    checkpoint_every_bytes=checkpoint_every_bytes,
+                    skip_loaded=not reload,
+                    clean_content=clean_content,
+                    quarantine=quarantine,
+                )
+                for filename, added, fails in sharded_results:
+                    click.echo(
+                        f"- {filename} loaded: {added} posts added; {fails} failed "
+                        "to add"
+                    )
+
+        # Built after the bulk load has rebuilt any existing indexes
+        if indexes:
+            with metrics.time_stage("index"):
+                built = gts.create_query_indexes(db_connection, indexes)
+            if built:
+                click.echo(f"Built {len(built)} indexes: {', '.join(built)}")
+
+        # Filling the index in one go is faster than through its triggers while loading
+        if full_text_index:
+            with metrics.time_stage("full_text"):
+                if full_text.create_full_text_index(db_connection):
+                    click.echo("Built full-text search index")
 
         files_added = gts.fetch_db_contents(db_connection, time_started)
 
-    total_posts_added = sum([n for _, n, _ in files_added])
-    total_parse_fails = sum([n for _, _, n in files_added])
+    row_cache.log_stats()
+    cache_hits = sum(hits for hits, _ in row_cache.stats().values())
+    cache_lookups = sum(hits + misses for hits, misses in row_cache.stats().values())
+    if cache_lookups:
+        click.echo(
+            f"Skipped writing {cache_hits} of {cache_lookups} unchanged emoji, card, "
+            "group and media rows."
+        )
+
+    if profile:
+        click.echo(metrics.summary(), err=True)
+    if metrics_out:
+        metrics.write_json(metrics_out)
+    logger.info(f"Load metrics: {metrics.as_dict()}")
+
+    total_posts_added = sum([n for _, n, _, _ in files_added])
+    total_parse_fails = sum([n or 0 for _, _, n, _ in files_added])
+    total_map_fails = sum([n or 0 for _, _, _, n in files_added])
 
     click.echo(
         f"Parsed {len(files_added)} JSON files, resulting in {total_posts_added} posts "
         f"added to database {database_filename}. {total_parse_fails} posts failed to "
-        "parse."
+        f"parse, and {total_map_fails} failed to map."
     )
+    if quarantine_path and total_parse_fails + total_map_fails:
+        click.echo(f"Failed lines were written to {quarantine_path}.")
+
+
+@gab_tidy_data.command()
+@click.argument("paths", type=click.Path(exists=True), nargs=-1, required=True)
+@click.argument(
+    "database_filename", type=click.Path(dir_okay=False, writable=True), required=True
+)
+@log_level_option
+@click.option(
+    "--max-latency",
+    type=click.FloatRange(min=0),
+    default=5.0,
+    show_default=True,
+    help="Longest time in seconds between reading a line and committing it to the "
+    "database.",
+)
+@click.option(
+    "--poll-interval",
+    type=click.FloatRange(min=0),
+    default=1.0,
+    show_default=True,
+    help="Time in seconds between checking the files for new lines.",
+)
+@click.option(
+    "--idle-timeout",
+    type=click.FloatRange(min=0),
+    help="Stop once there have been no new lines for this many seconds. By default, "
+    "keep following until stopped with Ctrl+C.",
+)
+@click.option(
+    "--batch-size",
+    type=click.IntRange(min=1),
+    default=5000,
+    show_default=True,
+    help="Number of posts to collect before inserting them into the database.",
+)
+@click.option(
+    "--json-decoder",
+    type=click.Choice(["auto"] + input_files.json_decoder_names),
+    default="auto",
+    show_default=True,
+    help="JSON decoder to use. auto uses the fastest one installed.",
+)
+@click.option(
+    "--clean-content",
+    is_flag=True,
+    help="Also store the text of each post without HTML, with and without URLs, and "
+    "the URLs in it in the gab_url table.",
+)
+@quarantine_option
+def follow(
+    paths,
+    database_filename,
+    log_level,
+    max_latency,
+    poll_interval,
+    idle_timeout,
+    batch_size,
+    json_decoder,
+    clean_content,
+    quarantine_path,
+):
+    """
+    Loads Garc JSON files while they are still being written, creating the database
+    if it doesn't exist. PATHS can be files, or directories whose JSON files (including
+    any new ones) are followed. Following the same files again carries on where it
+    stopped.
+    """
+    set_log_level(log_level)
+
+    try:
+        input_files.get_json_decoder(json_decoder)
+    except RuntimeError as e:
+        raise click.BadParameter(str(e), param_hint="--json-decoder")
+
+    db_is_new = not path.exists(database_filename)
+
+    with closing(sqlite3.connect(database_filename)) as db_connection:
+        if db_is_new:
+            gts.initialise_empty_database(db_connection)
+        elif not gts.schema_is_current(db_connection):
+            raise schema_mismatch(database_filename)
+
+        click.echo(f"Following {len(paths)} paths into {database_filename}")
+        quarantine_context = (
+            Quarantine(quarantine_path) if quarantine_path else nullcontext()
+        )
+        try:
+            with quarantine_context as quarantine:
+                lines_loaded = follow_files(
+                    list(paths),
+                    db_connection,
+                    max_latency=max_latency,
+                    poll_interval=poll_interval,
+                    idle_timeout=idle_timeout,
+                    batch_size=batch_size,
+                    json_decoder=json_decoder,
+                    clean_content=clean_content,
+                    quarantine=quarantine,
+                )
+        except ValueError as e:
+            raise click.ClickException(str(e))
+
+    for filename, num_lines in lines_loaded.items():
+        click.echo(f"- {filename}: {num_lines} lines loaded")
+
+
+@gab_tidy_data.command()
+@click.argument(
+    "source_databases",
+    type=click.Path(exists=True, dir_okay=False),
+    nargs=-1,
+    required=True,
+)
+@click.argument(
+    "database_filename", type=click.Path(dir_okay=False, writable=True), required=True
+)
+@log_level_option
+@click.option(
+    "--include-loaded",
+    is_flag=True,
+    help="Merge files even if they have already been loaded into the database.",
+)
+def merge(source_databases, database_filename, log_level, include_loaded):
+    """
+    Merges databases made by Gab Tidy Data into one database, creating it if it doesn't
+    exist. Files already loaded into the database are skipped.
+    """
+    set_log_level(log_level)
+
+    for source_database in source_databases:
+        if path.exists(database_filename) and path.samefile(
+            source_database, database_filename
+        ):
+            raise click.BadParameter(
+                f"{source_database} is the database being merged into",
+                param_hint="SOURCE_DATABASES",
+            )
+
+        # Check every database before merging any of them
+        with closing(sqlite3.connect(source_database)) as source_connection:
+            if not gts.schema_is_current(source_connection):
+                raise click.ClickException(
+                    f"Database {source_database} uses a database schema that is a "
+                    "different version from the schema in the version of Gab Tidy Data "
+                    "you are currently using, so can't be merged."
+                )
+
+    logger.info(f"Merging {len(source_databases)} databases into {database_filename}")
+    click.echo(f"Merging {len(source_databases)} databases into {database_filename}")
+
+    db_is_new = not path.exists(database_filename)
+
+    with closing(sqlite3.connect(database_filename)) as db_connection:
+        if db_is_new:
+            gts.initialise_empty_database(db_connection)
+        elif not gts.schema_is_current(db_connection):
+            raise schema_mismatch(database_filename)
+
+        for source_database in source_databases:
+            num_files = merge_database(
+                db_connection, source_database, skip_loaded=not include_loaded
+            )
+            click.echo(f"- {source_database} merged: {num_files} files added")
+
+
+@gab_tidy_data.command()
+@click.argument(
+    "database_filename", type=click.Path(exists=True, dir_okay=False, writable=True)
+)
+@log_level_option
+@indexes_option
+def index(database_filename, log_level, indexes):
+    """Builds indexes for faster queries on an existing database"""
+    set_log_level(log_level)
+
+    with closing(sqlite3.connect(database_filename)) as db_connection:
+        if not gts.schema_is_current(db_connection):
+            raise schema_mismatch(database_filename)
+
+        built = gts.create_query_indexes(db_connection, indexes)
+
+    click.echo(f"Built {len(built)} indexes in {database_filename}")
+
+
+@gab_tidy_data.command()
+@click.argument("database_filename", type=click.Path(exists=True, dir_okay=False))
+@click.argument("table")
+@click.argument("output", type=click.Path(writable=True))
+@log_level_option
+@click.option(
+    "--format",
+    "export_format",
+    type=click.Choice(export_formats),
+    help="Output format. By default, this is taken from the extension of OUTPUT.",
+)
+@click.option(
+    "--chunk-size",
+    type=click.IntRange(min=1),
+    default=10_000,
+    show_default=True,
+    help="Number of rows to read from the database and write out at a time.",
+)
+@click.option(
+    "--restart",
+    is_flag=True,
+    help="Start the export again, rather than carrying on from where an interrupted "
+    "export to OUTPUT stopped.",
+)
+def export(
+    database_filename, table, output, log_level, export_format, chunk_size, restart
+):
+    """
+    Exports a table or view (such as gab_unique) to a CSV, JSON lines or Parquet file.
+    Parquet output is a directory of Parquet files, and needs the pyarrow package.
+    """
+    set_log_level(log_level)
+
+    if export_format is None:
+        export_format = format_from_filename(output)
+        if export_format not in export_formats:
+            raise click.BadParameter(
+                "can't tell the output format from the filename, use --format",
+                param_hint="OUTPUT",
+            )
+
+    with closing(sqlite3.connect(database_filename)) as db_connection:
+        try:
+            num_rows, resumed = export_table(
+                db_connection,
+                table,
+                output,
+                export_format,
+                chunk_size=chunk_size,
+                resume=not restart,
+            )
+        except (ValueError, RuntimeError) as e:
+            raise click.ClickException(str(e))
+
+    resumed_message = " (resumed)" if resumed else ""
+    click.echo(f"Exported {num_rows} rows of {table} to {output}{resumed_message}")
+
+
+@gab_tidy_data.command("full-text")
+@click.argument(
+    "database_filename", type=click.Path(exists=True, dir_okay=False, writable=True)
+)
+@log_level_option
+@click.option(
+    "--rebuild",
+    is_flag=True,
+    help="Rebuild an existing full-text index from scratch.",
+)
+def full_text_command(database_filename, log_level, rebuild):
+    """
+    Builds a full-text search index over gab and account text in an existing database,
+    or optimizes the index if it already exists. The index is kept up to date by later
+    loads and merges.
+    """
+    set_log_level(log_level)
+
+    with closing(sqlite3.connect(database_filename)) as db_connection:
+        if not gts.schema_is_current(db_connection):
+            raise schema_mismatch(database_filename)
+
+        if full_text.create_full_text_index(db_connection):
+            click.echo(f"Built full-text search index in {database_filename}")
+        elif rebuild:
+            full_text.rebuild_full_text_index(db_connection)
+            click.echo(f"Rebuilt full-text search index in {database_filename}")
+
+        full_text.optimize_full_text_index(db_connection)
+
+
+@gab_tidy_data.command("rebuild-unique")
+@click.argument(
+    "database_filename", type=click.Path(exists=True, dir_okay=False, writable=True)
+)
+@log_level_option
+def rebuild_unique(database_filename, log_level):
+    """
+    Rebuilds the gab_unique, account_unique and gab_group_unique tables of a database.
+    These are kept up to date when loading and merging, so this is only needed if the
+    gab, account or gab_group tables have been changed by hand.
+
+    Databases made before these tables were added (which had group by views instead)
+    are upgraded to the current schema, with the tables built from their data.
+    """
+    set_log_level(log_level)
+
+    with closing(sqlite3.connect(database_filename)) as db_connection:
+        if gts.schema_is_upgradable(db_connection):
+            gts.upgrade_schema(db_connection)
+            click.echo(f"Upgraded {database_filename} to the current database schema")
+        elif not gts.schema_is_current(db_connection):
+            raise schema_mismatch(database_filename)
+        else:
+            gts.rebuild_unique_tables(db_connection)
+
+    click.echo(f"Rebuilt one row per id tables in {database_filename}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,141 @@
+-------------------------------------
+-- Account snapshots storage mode  --
+-------------------------------------
+
+-- Applied after gab_schema.sql when a database is created with the account_snapshots
+-- storage mode. Instead of a full copy of every account for every file it appears in,
+-- each account's profile is only stored again when it has changed. The account view
+-- gives the same rows as the account table does in the default storage mode, and
+-- inserting into it (as loading does) fills the tables below.
+
+drop table account;
+
+-- What doesn't change about an account
+create table account_identity (
+    id text primary key, -- Gab-provided user id
+    created_at text -- Unparsed ISO datetime
+);
+
+-- Each different version of an account's profile
+create table account_snapshot (
+    id integer primary key,
+    account_id text not null references account_identity (id),
+    username text not null,
+    acct text,
+    display_name text,
+    locked integer, -- boolean
+    bot integer, -- boolean
+    note text,
+    url text,
+    avatar text,
+    avatar_static text,
+    header text,
+    header_static text,
+    is_spam integer, -- boolean
+    is_pro integer, -- boolean
+    is_verified integer, -- boolean
+    is_donor integer, -- boolean
+    is_investor integer, -- boolean
+    _file_id integer references _inserted_files (id) -- file this version first appeared in
+);
+
+create index account_snapshot_account_id on account_snapshot (account_id);
+
+-- Each file an account appeared in, with the counts which change all the time
+create table account_observation (
+    account_id text references account_identity (id),
+    _file_id integer references _inserted_files (id),
+    snapshot_id integer references account_snapshot (id),
+    followers_count integer,
+    following_count integer,
+    statuses_count integer,
+    primary key (account_id, _file_id)
+);
+
+-- Same columns, in the same order, as the account table of the default storage mode
+create view account as
+select
+    observation.account_id as id,
+    snapshot.username,
+    snapshot.acct,
+    snapshot.display_name,
+    snapshot.locked,
+    snapshot.bot,
+    identity.created_at,
+    julianday(identity.created_at) as created_at_parsed,
+    snapshot.note,
+    snapshot.url,
+    snapshot.avatar,
+    snapshot.avatar_static,
+    snapshot.header,
+    snapshot.header_static,
+    snapshot.is_spam,
+    observation.followers_count,
+    observation.following_count,
+    observation.statuses_count,
+    snapshot.is_pro,
+    snapshot.is_verified,
+    snapshot.is_donor,
+    snapshot.is_investor,
+    observation._file_id
+from account_observation as observation
+join account_snapshot as snapshot on snapshot.id = observation.snapshot_id
+join account_identity as identity on identity.id = observation.account_id;
+
+-- A new snapshot is only written if none of the account's snapshots has the same
+-- profile. Loading inserts with "insert or replace", which also applies to the
+-- statements here, so the last observation of an account in a file is kept.
+create trigger account_insert instead of insert on account
+begin
+    insert into account_identity (id, created_at)
+    values (new.id, new.created_at)
+    on conflict (id) do nothing;
+
+    insert into account_snapshot (
+        account_id, username, acct, display_name, locked, bot,
+        note, url, avatar, avatar_static, header, header_static,
+        is_spam, is_pro, is_verified, is_donor, is_investor,
+        _file_id
+    )
+    select
+        new.id, new.username, new.acct, new.display_name, new.locked, new.bot,
+        new.note, new.url, new.avatar, new.avatar_static, new.header, new.header_static,
+        new.is_spam, new.is_pro, new.is_verified, new.is_donor, new.is_investor,
+        new._file_id
+    where not exists (
+        select 1 from account_snapshot
+        where account_id = new.id
+            and username is new.username and acct is new.acct
+            and display_name is new.display_name and locked is new.locked
+            and bot is new.bot and note is new.note and url is new.url
+            and avatar is new.avatar and avatar_static is new.avatar_static
+            and header is new.header and header_static is new.header_static
+            and is_spam is new.is_spam and is_pro is new.is_pro
+            and is_verified is new.is_verified and is_donor is new.is_donor
+            and is_investor is new.is_investor
+    );
+
+    insert into account_observation (
+        account_id, _file_id, snapshot_id,
+        followers_count, following_count, statuses_count
+    )
+    values (
+        new.id,
+        new._file_id,
+        (
+            select id from account_snapshot
+            where account_id = new.id
+                and username is new.username and acct is new.acct
+                and display_name is new.display_name and locked is new.locked
+                and bot is new.bot and note is new.note and url is new.url
+                and avatar is new.avatar and avatar_static is new.avatar_static
+                and header is new.header and header_static is new.header_static
+                and is_spam is new.is_spam and is_pro is new.is_pro
+                and is_verified is new.is_verified and is_donor is new.is_donor
+                and is_investor is new.is_investor
+        ),
+        new.followers_count,
+        new.following_count,
+        new.statuses_count
+    );
+end;
@@ -0,0 +1,470 @@
+"""
+Exporting tables
+
+Streams a table or view out of a Gab Tidy Data database into a CSV, JSON lines or
+Parquet file, a chunk of rows at a time, so memory use doesn't depend on the size of
+the table.
+
+Exports can be resumed. After each chunk has been written out, the progress (the last
+rowid exported, and how much of the output is complete) is saved to a small progress
+file next to the output. If the export is interrupted, running it again picks up from
+there, rather than starting again. Tables are read in rowid order from the last rowid
+exported, so resuming doesn't read the table again from the start. Views don't have a
+rowid, so they are read in the order of their key instead, and a resumed view export
+skips the rows already exported. The views made by storage modes have the primary key
+of the table they replace (see view_key_columns). Other views have no known order, so
+their exports are started again rather than resumed.
+
+Parquet output is a directory of Parquet files ("parts"), as a Parquet file can't be
+added to once it has been closed. Each part is closed, and the progress saved, every
+rows_per_part rows. Booleans are stored as booleans, and the *_parsed columns (Julian
+day numbers) as timestamps. Parquet output needs the pyarrow package.
+"""
+
+import csv
+import json
+import os
+import re
+import shutil
+import sqlite3
+from contextlib import closing
+from importlib.resources import open_text
+from logging import getLogger
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover - depends on the environment
+    pyarrow = None
+
+
+logger = getLogger(__name__)
+
+export_formats = ["csv", "jsonl", "parquet"]
+
+# Julian day number of the Unix epoch
+_unix_epoch_julian_day = 2440587.5
+_milliseconds_per_day = 86_400_000
+
+# Integer columns holding booleans, marked in the schema with a "boolean" comment
+_boolean_column_pattern = re.compile(r"^\s*(\w+)\s+integer\b.*--\s*boolean", re.I)
+_create_table_pattern = re.compile(r"^\s*create table (\w+)", re.I)
+
+
+def _schema_boolean_columns() -> Dict[str, List[str]]:
+    """The boolean columns of each table, from the comments in gab_schema.sql"""
+    boolean_columns = {}
+    table = None
+
+    with open_text("gab_tidy_data", "gab_schema.sql") as sql_file:
+        for line in sql_file:
+            table_match = _create_table_pattern.match(line)
+            if table_match:
+                table = table_match.group(1)
+                boolean_columns[table] = []
+                continue
+
+            column_match = _boolean_column_pattern.match(line)
+            if column_match and table is not None:
+                boolean_columns[table].append(column_match.group(1))
+
+    return boolean_columns
+
+
+boolean_columns = _schema_boolean_columns()
+
+
+def _schema_primary_keys() -> Dict[str, List[str]]:
+    """The primary key columns of each table in gab_schema.sql"""
+    with closing(sqlite3.connect(":memory:")) as schema_connection:
+        with open_text("gab_tidy_data", "gab_schema.sql") as sql_file:
+            schema_connection.executescript(sql_file.read())
+
+        primary_keys = {}
+        for (table,) in schema_connection.execute(
+            "select name from sqlite_master where type = 'table'"
+        ):
+            key = sorted(
+                (position, name)
+                for _, name, _, _, _, position in schema_connection.execute(
+                    f'pragma table_info("{table}")'
+                )
+                if position
+            )
+            primary_keys[table] = [name for _, name in key]
+
+    return primary_keys
+
+
+primary_keys = _schema_primary_keys()
+
+
+class ExportProgress(NamedTuple):
+    """Progress through an export, as saved in its progress file"""
+
+    table: str
+    format: str
+    rows: int  # Rows exported so far
+    last_rowid: Optional[int]  # rowid of the last row exported, or None for views
+    output_position: int  # Bytes of output written, or number of Parquet parts
+
+
+def progress_path(output_path: str) -> str:
+    return f"{output_path}.export-progress"
+
+
+def read_progress(output_path: str) -> Optional[ExportProgress]:
+    try:
+        with open(progress_path(output_path), encoding="utf-8") as progress_fh:
+            return ExportProgress(**json.load(progress_fh))
+    except FileNotFoundError:
+        return None
+
+
+def _save_progress(output_path: str, progress: ExportProgress):
+    # Written to a temporary file first, so the progress file is never half written
+    temporary_path = progress_path(output_path) + ".tmp"
+    with open(temporary_path, "w", encoding="utf-8") as progress_fh:
+        json.dump(progress._asdict(), progress_fh)
+    os.replace(temporary_path, progress_path(output_path))
+
+
+def format_from_filename(output_path: str) -> Optional[str]:
+    extension = os.path.splitext(output_path)[1].lower().lstrip(".")
+    return {"json": "jsonl", "ndjson": "jsonl"}.get(extension, extension) or None
+
+
+def _table_type(db_connection: sqlite3.Connection, table: str) -> str:
+    """Whether table is a table or a view, raising ValueError if it is neither"""
+    row = db_connection.execute(
+        "select type from sqlite_master where name = ? and type in ('table', 'view')",
+        [table],
+    ).fetchone()
+    if row is None:
+        raise ValueError(f"There is no table or view called {table} in the database")
+
+    return row[0]
+
+
+def view_key_columns(
+    db_connection: sqlite3.Connection, view: str
+) -> Optional[List[str]]:
+    """
+    Columns which identify each row of the view, so it can be read in the same order
+    every time: the primary key of the table in gab_schema.sql that it replaces (see
+    gab_to_sqlite.storage_modes). None if the view isn't one of those.
+    """
+    key = primary_keys.get(view)
+    view_columns = {
+        name for _, name, *_ in db_connection.execute(f'pragma table_xinfo("{view}")')
+    }
+    if not key or not set(key) <= view_columns:
+        return None
+
+    return key
+
+
+def column_kinds(
+    db_connection: sqlite3.Connection, table: str
+) -> List[Tuple[str, str]]:
+    """
+    The columns of the table or view in select * order, each with the kind of value it
+    holds: "boolean", "timestamp" (for Julian day *_parsed columns), "integer", "real"
+    or "text".
+    """
+    table_booleans = boolean_columns.get(table, [])
+    kinds = []
+
+    for _, name, declared_type, _, _, _, hidden in db_connection.execute(
+        f'pragma table_xinfo("{table}")'
+    ):
+        if hidden == 1:  # Hidden columns of virtual tables aren't in select *
+            continue
+
+        declared_type = (declared_type or "").lower()
+        if name in table_booleans:
+            kind = "boolean"
+        elif name.endswith("_parsed"):
+            # Views computing these with julianday() don't declare a type
+            kind = "timestamp"
+        elif declared_type in ("integer", "real"):
+            kind = declared_type
+        else:
+            kind = "text"
+        kinds.append((name, kind))
+
+    return kinds
+
+
+class _CsvWriter:
+    """Writes rows as CSV, with a header row"""
+
+    def __init__(self, output_path: str, columns: List[Tuple[str, str]], position: int):
+        self.output_fh = _open_text_output(output_path, position)
+        self.writer = csv.writer(self.output_fh)
+        if position == 0:
+            self.writer.writerow([name for name, _ in columns])
+
+    def write(self, rows: List[tuple]):
+        self.writer.writerows(rows)
+
+    def checkpoint(self) -> Optional[int]:
+        self.output_fh.flush()
+        return self.output_fh.tell()
+
+    def close(self):
+        self.output_fh.close()
+
+
+class _JsonLinesWriter:
+    """Writes rows as JSON objects, one per line, with booleans as true or false"""
+
+    def __init__(self, output_path: str, columns: List[Tuple[str, str]], position: int):
+        self.output_fh = _open_text_output(output_path, position)
+        self.names = [name for name, _ in columns]
+        self.boolean_indexes = [
+            i for i, (_, kind) in enumerate(columns) if kind == "boolean"
+        ]
+
+    def write(self, rows: List[tuple]):
+        lines = []
+        for row in rows:
+            if self.boolean_indexes:
+                row = list(row)
+                for i in self.boolean_indexes:
+                    if row[i] is not None:
+                        row[i] = bool(row[i])
+            lines.append(json.dumps(dict(zip(self.names, row)), ensure_ascii=False))
+        self.output_fh.write("\n".join(lines) + "\n")
+
+    def checkpoint(self) -> Optional[int]:
+        self.output_fh.flush()
+        return self.output_fh.tell()
+
+    def close(self):
+        self.output_fh.close()
+
+
+def _open_text_output(output_path: str, position: int):
+    """Opens the output for writing from position, dropping anything written after it"""
+    if position == 0:
+        return open(output_path, "w", encoding="utf-8", newline="")
+
+    output_fh = open(output_path, "r+", encoding="utf-8", newline="")
+    output_fh.seek(position)
+    output_fh.truncate()
+    return output_fh
+
+
+class _ParquetWriter:
+    """Writes rows to a directory of Parquet files, each of up to rows_per_part rows"""
+
+    arrow_types = {
+        "integer": "int64",
+        "real": "float64",
+        "text": "string",
+        "boolean": "bool_",
+    }
+
+    def __init__(
+        self,
+        output_path: str,
+        columns: List[Tuple[str, str]],
+        position: int,
+        rows_per_part: int,
+    ):
+        if pyarrow is None:
+            raise RuntimeError(
+                "Exporting to Parquet requires the pyarrow package. You can install it "
+                "with: python -m pip install pyarrow"
+            )
+
+        if position == 0 and os.path.isdir(output_path):
+            shutil.rmtree(output_path)
+        os.makedirs(output_path, exist_ok=True)
+        # Remove any part left unfinished by an interrupted export
+        for filename in os.listdir(output_path):
+            if filename.startswith("part-") and int(filename[5:10]) >= position:
+                os.remove(os.path.join(output_path, filename))
+
+        self.output_path = output_path
+        self.columns = columns
+        self.schema = pyarrow.schema(
+            [
+                (
+                    name,
+                    (
+                        pyarrow.timestamp("ms", tz="UTC")
+                        if kind == "timestamp"
+                        else getattr(pyarrow, self.arrow_types[kind])()
+                    ),
+                )
+                for name, kind in columns
+            ]
+        )
+        self.rows_per_part = rows_per_part
+        self.parts = position
+        self.part_writer = None
+        self.part_rows = 0
+
+    def _array(self, values: List[Any], kind: str, arrow_type):
+        if kind == "boolean":
+            values = [None if value is None else bool(value) for value in values]
+        elif kind == "timestamp":
+            values = [
+                (
+                    None
+                    if value is None
+                    else round((value - _unix_epoch_julian_day) * _milliseconds_per_day)
+                )
+                for value in values
+            ]
+        return pyarrow.array(values, type=arrow_type)
+
+    def _open_part(self):
+        part_path = os.path.join(self.output_path, f"part-{self.parts:05d}.parquet")
+        self.part_writer = pyarrow.parquet.ParquetWriter(part_path, self.schema)
+
+    def write(self, rows: List[tuple]):
+        if self.part_writer is None:
+            self._open_part()
+
+        arrays = [
+            self._array(list(values), kind, field.type)
+            for values, (_, kind), field in zip(zip(*rows), self.columns, self.schema)
+        ]
+        self.part_writer.write_table(
+            pyarrow.Table.from_arrays(arrays, schema=self.schema)
+        )
+        self.part_rows += len(rows)
+
+    def _close_part(self):
+        self.part_writer.close()
+        self.part_writer = None
+        self.part_rows = 0
+        self.parts += 1
+
+    def checkpoint(self) -> Optional[int]:
+        # Only finished parts can be kept when resuming
+        if self.part_rows < self.rows_per_part:
+            return None
+
+        self._close_part()
+        return self.parts
+
+    def close(self):
+        # An empty table still gets one (empty) part, so the columns are recorded
+        if self.part_writer is None and self.parts == 0:
+            self._open_part()
+        if self.part_writer is not None:
+            self._close_part()
+
+
+def export_table(
+    db_connection: sqlite3.Connection,
+    table: str,
+    output_path: str,
+    export_format: str,
+    chunk_size: int = 10_000,
+    rows_per_part: int = 1_000_000,
+    resume: bool = True,
+) -> Tuple[int, bool]:
+    """
+    Exports the table or view to output_path in export_format (one of export_formats),
+    fetching chunk_size rows at a time. Parquet output is a directory of files of up to
+    rows_per_part rows each.
+
+    If resume is True and an earlier export of the same table in the same format to
+    output_path was interrupted, it is carried on from where it stopped. Otherwise any
+    existing output is replaced.
+
+    Returns the total number of rows exported, and whether the export was resumed.
+    Raises ValueError if there is no such table or view.
+    """
+    if export_format not in export_formats:
+        raise ValueError(f"Unknown export format {export_format}")
+
+    is_table = _table_type(db_connection, table) == "table"
+    columns = column_kinds(db_connection, table)
+    key = None if is_table else view_key_columns(db_connection, table)
+
+    progress = read_progress(output_path) if resume else None
+    if progress is not None and (progress.table, progress.format) != (
+        table,
+        export_format,
+    ):
+        progress = None
+    if progress is not None and not is_table and key is None:
+        logger.warning(
+            f"Exporting {table} again from the start, as the rows of a view without a "
+            "key can't be read in the same order again to resume its export"
+        )
+        progress = None
+    if progress is None:
+        progress = ExportProgress(table, export_format, 0, None, 0)
+    else:
+        logger.info(f"Resuming export of {table} after {progress.rows} rows")
+    resumed = progress.rows > 0
+
+    if export_format == "csv":
+        writer = _CsvWriter(output_path, columns, progress.output_position)
+    elif export_format == "jsonl":
+        writer = _JsonLinesWriter(output_path, columns, progress.output_position)
+    else:
+        writer = _ParquetWriter(
+            output_path, columns, progress.output_position, rows_per_part
+        )
+
+    db = db_connection.cursor()
+    if is_table:
+        # The rowid is selected first, so that the export can resume after it
+        db.execute(
+            f'select rowid, * from "{table}" where rowid > ? order by rowid',
+            [progress.last_rowid if progress.last_rowid is not None else -(1 << 63)],
+        )
+    elif key is not None:
+        # Skipping the rows already exported only works if they come in the same order
+        db.execute(
+            f"""
+            select * from "{table}"
+            order by {", ".join(f'"{column}"' for column in key)}
+            limit -1 offset ?
+            """,
+            [progress.rows],
+        )
+    else:
+        db.execute(f'select * from "{table}"')
+
+    rows_exported = progress.rows
+    last_rowid = progress.last_rowid
+
+    try:
+        while True:
+            rows = db.fetchmany(chunk_size)
+            if not rows:
+                break
+
+            if is_table:
+                last_rowid = rows[-1][0]
+                rows = [row[1:] for row in rows]
+
+            writer.write(rows)
+            rows_exported += len(rows)
+
+            position = writer.checkpoint()
+            if position is not None:
+                _save_progress(
+                    output_path,
+                    ExportProgress(
+                        table, export_format, rows_exported, last_rowid, position
+                    ),
+                )
+    finally:
+        writer.close()
+
+    if os.path.exists(progress_path(output_path)):
+        os.remove(progress_path(output_path))
+    logger.info(f"Exported {rows_exported} rows of {table} to {output_path}")
+
+    return rows_exported, resumed
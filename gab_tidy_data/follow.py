@@ -0,0 +1,338 @@
+"""
+Following growing files
+
+Garc collections can run for days, writing gabs to their output files as they are
+collected. Following loads those files while they are still being written: each file
+is polled for new data, every complete line is loaded as soon as it appears, and a
+line that is still being written is left until its newline arrives. Directories can
+also be followed, in which case new JSON files appearing in them are followed too.
+
+New lines are inserted in batches (see gab_to_sqlite.InsertBuffer), and committed at
+least every max_latency seconds while data is arriving, so they can be queried soon
+after they are written. Each commit also records how far through each file loading
+has got, so following the same files again after stopping carries on from there.
+
+Followed files are recorded in _inserted_files by their full path, as their contents,
+and so their fingerprint, keep changing. While a file is being followed its
+num_gabs_inserted is null, as for any other file that hasn't finished loading. When
+following stops, the files are marked as loaded, along with the fingerprint of their
+contents at that point, so loading a finished file again with the load command skips
+it as usual.
+"""
+
+import datetime as dt
+import io
+import os
+import sqlite3
+import time
+from logging import getLogger
+from typing import Dict, Iterable, List, Optional
+
+import gab_tidy_data.gab_data_mapping as data_mapping
+import gab_tidy_data.gab_to_sqlite as gts
+import gab_tidy_data.input_files as input_files
+from gab_tidy_data.metrics import IngestMetrics
+from gab_tidy_data.quarantine import Quarantine
+from gab_tidy_data.row_cache import WrittenRowCache
+
+
+logger = getLogger(__name__)
+
+# Files in followed directories with these extensions are followed
+followed_extensions = (".json", ".jsonl")
+
+# Bytes needed to tell whether a file is compressed
+_magic_length = max(map(len, input_files.compression_magic_bytes.values()))
+
+
+class FollowedFile:
+    """A file being followed, and how far through it loading has got"""
+
+    def __init__(self, db_connection: sqlite3.Connection, path: str):
+        self.path = os.path.abspath(path)
+        self.fh = open(self.path, "rb")
+        self.pending = b""  # Start of a line whose newline hasn't been written yet
+        self.memo = data_mapping.MappedGabMemo()  # Embedded gabs mapped so far
+        self.checked_compression = False
+
+        db = db_connection.cursor()
+        db.execute(
+            """
+            select
+                id, lines_read, bytes_read, num_parsing_failures, num_mapping_failures
+            from _inserted_files
+            where filename = ?
+            order by id desc
+            limit 1
+            """,
+            [self.path],
+        )
+        previous = db.fetchone()
+        size = os.fstat(self.fh.fileno()).st_size
+
+        if previous is not None and (previous[2] or 0) <= size:
+            self.file_id = previous[0]
+            self.lines_read = previous[1] or 0
+            self.bytes_read = previous[2] or 0
+            self.num_failed = previous[3] or 0
+            self.num_mapping_failed = previous[4] or 0
+            logger.info(f"Following {self.path} from line {self.lines_read + 1}")
+
+            # No longer finished, until following stops again
+            db.execute(
+                """
+                update _inserted_files
+                set num_gabs_inserted = null, file_size = null, fingerprint = null
+                where id = ?
+                """,
+                [self.file_id],
+            )
+        else:
+            db.execute(
+                """
+                insert into _inserted_files (filename, inserted_by_version)
+                values (?, ?)
+                """,
+                [self.path, "superalpha"],
+            )
+            self.file_id = db.lastrowid
+            self.lines_read = 0
+            self.bytes_read = 0
+            self.num_failed = 0
+            self.num_mapping_failed = 0
+            logger.info(f"Following {self.path}")
+
+        self.fh.seek(self.bytes_read)
+        self.lines_committed = self.lines_read
+
+    def read_lines(self, read_size: int) -> List[bytes]:
+        """
+        Reads up to read_size bytes of new data, returning the complete lines in it,
+        with their newlines.
+        Raises ValueError if the file is compressed, as compressed files can't be read
+        until they are complete.
+        """
+        data = self.fh.read(read_size)
+        if not data:
+            return []
+
+        if not self.checked_compression and self.bytes_read == 0:
+            start = self.pending + data
+            if len(start) < _magic_length:
+                self.pending = start
+                return []
+
+            compression = input_files.detect_compression(io.BytesIO(start))
+            if compression is not None:
+                raise ValueError(
+                    f"{self.path} is {compression} compressed, so can't be followed"
+                )
+        self.checked_compression = True
+
+        lines = io.BytesIO(self.pending + data).readlines()
+        self.pending = b"" if lines[-1].endswith(b"\n") else lines.pop()
+        return lines
+
+    @property
+    def uncommitted(self) -> bool:
+        return self.lines_read > self.lines_committed
+
+    def checkpoint(self, db_connection: sqlite3.Connection):
+        gts._checkpoint(
+            db_connection,
+            self.file_id,
+            self.lines_read,
+            self.bytes_read,
+            self.num_failed,
+            self.num_mapping_failed,
+        )
+        self.lines_committed = self.lines_read
+
+    def finish(self, db_connection: sqlite3.Connection):
+        """
+        Marks the file as loaded as far as it has been read. If every line of the file
+        has been loaded, it is also recorded with the fingerprint of its contents, so
+        it is recognised as already loaded if loaded again.
+        """
+        db = db_connection.cursor()
+        db.execute("select count(*) from gab where _file_id = ?", [self.file_id])
+        num_gabs_inserted = db.fetchone()[0]
+
+        file_fingerprint = input_files.fingerprint(self.fh)
+        if file_fingerprint is None or file_fingerprint[0] != self.bytes_read:
+            file_fingerprint = (None, None)
+
+        db.execute(
+            """
+            update _inserted_files
+            set num_gabs_inserted = :num_gabs_inserted,
+                num_parsing_failures = :num_parsing_failures,
+                num_mapping_failures = :num_mapping_failures,
+                lines_read = :lines_read,
+                bytes_read = :bytes_read,
+                file_size = :file_size,
+                fingerprint = :fingerprint,
+                inserted_at = :now
+            where id = :file_id
+            """,
+            {
+                "file_id": self.file_id,
+                "num_gabs_inserted": num_gabs_inserted,
+                "num_parsing_failures": self.num_failed,
+                "num_mapping_failures": self.num_mapping_failed,
+                "lines_read": self.lines_read,
+                "bytes_read": self.bytes_read,
+                "file_size": file_fingerprint[0],
+                "fingerprint": file_fingerprint[1],
+                "now": dt.datetime.utcnow(),
+            },
+        )
+        self.fh.close()
+
+
+def _find_new_files(
+    directories: Iterable[str], followed: Dict[str, FollowedFile]
+) -> List[str]:
+    """JSON files in the directories which aren't being followed yet, in name order"""
+    new_files = []
+    for directory in directories:
+        for filename in sorted(os.listdir(directory)):
+            path = os.path.abspath(os.path.join(directory, filename))
+            if (
+                filename.endswith(followed_extensions)
+                and path not in followed
+                and os.path.isfile(path)
+            ):
+                new_files.append(path)
+
+    return new_files
+
+
+def follow_files(
+    paths: List[str],
+    db_connection: sqlite3.Connection,
+    max_latency: float = 5.0,
+    poll_interval: float = 1.0,
+    idle_timeout: Optional[float] = None,
+    batch_size: int = 5000,
+    read_size: int = 1 << 22,
+    json_decoder: str = "auto",
+    clean_content: bool = False,
+    metrics: Optional[IngestMetrics] = None,
+    quarantine: Optional[Quarantine] = None,
+) -> Dict[str, int]:
+    """
+    Follows the files, and the JSON files in any directories, in paths, loading each
+    complete line into the database as it is written (see the module docstring).
+
+    Each file is checked for new data every poll_interval seconds, reading up to
+    read_size bytes of it at a time. Loaded lines are committed within max_latency
+    seconds of being read. Following stops once no new data has arrived for
+    idle_timeout seconds, or when interrupted with Ctrl+C (KeyboardInterrupt) if
+    idle_timeout is None.
+
+    Lines which fail to parse or map are skipped, and written to the quarantine if one
+    is given (see quarantine).
+
+    Returns the number of lines loaded from each file while following.
+    """
+    if metrics is None:
+        metrics = IngestMetrics()
+    directories = [path for path in paths if os.path.isdir(path)]
+    followed: Dict[str, FollowedFile] = {}
+    for path in paths:
+        if not os.path.isdir(path) and os.path.abspath(path) not in followed:
+            followed[os.path.abspath(path)] = FollowedFile(db_connection, path)
+
+    db = db_connection.cursor()
+    insert_buffer = gts.InsertBuffer(
+        db,
+        batch_size,
+        WrittenRowCache(),
+        metrics,
+        gts._url_dictionary(db_connection),
+    )
+    lines_loaded = {path: 0 for path in followed}
+    clock = time.monotonic
+    first_uncommitted = None
+    last_data = clock()
+
+    def commit():
+        insert_buffer.flush()
+        with metrics.time_stage("commit"):
+            for followed_file in followed.values():
+                if followed_file.uncommitted:
+                    followed_file.checkpoint(db_connection)
+
+    try:
+        while True:
+            for path in _find_new_files(directories, followed):
+                followed[path] = FollowedFile(db_connection, path)
+                lines_loaded[path] = 0
+
+            received_data = False
+            for path, followed_file in followed.items():
+                with metrics.time_stage("read"):
+                    lines = followed_file.read_lines(read_size)
+                if not lines:
+                    continue
+
+                mapped_chunk = gts._map_lines(
+                    followed_file.file_id,
+                    json_decoder,
+                    lines,
+                    metrics.profile,
+                    clean_content,
+                    followed_file.memo,
+                )
+                if quarantine is not None:
+                    for failed_line in mapped_chunk.failed_lines:
+                        quarantine.add(
+                            path,
+                            followed_file.lines_read + failed_line.index + 1,
+                            failed_line,
+                        )
+                insert_buffer.add(mapped_chunk.rows, mapped_chunk.num_mapped)
+                gts._add_chunk_metrics(metrics, mapped_chunk)
+
+                followed_file.lines_read += mapped_chunk.num_lines
+                followed_file.bytes_read += mapped_chunk.num_bytes
+                followed_file.num_failed += mapped_chunk.num_failed
+                followed_file.num_mapping_failed += mapped_chunk.num_mapping_failed
+                lines_loaded[path] += mapped_chunk.num_lines
+                received_data = True
+
+            now = clock()
+            if received_data:
+                last_data = now
+                if first_uncommitted is None:
+                    first_uncommitted = now
+
+            if first_uncommitted is not None and now - first_uncommitted >= max_latency:
+                commit()
+                first_uncommitted = None
+
+            if received_data:
+                continue  # There may be more to read straight away
+            if idle_timeout is not None and now - last_data >= idle_timeout:
+                logger.info(f"No new data for {idle_timeout} seconds, stopping")
+                break
+
+            sleep = poll_interval
+            if first_uncommitted is not None:
+                sleep = min(sleep, max(first_uncommitted + max_latency - now, 0))
+            time.sleep(sleep)
+    except KeyboardInterrupt:
+        # Stopping with Ctrl+C is the usual way to stop following
+        logger.info("Following interrupted, stopping")
+    except Exception:
+        for followed_file in followed.values():
+            followed_file.fh.close()
+        raise
+
+    commit()
+    for followed_file in followed.values():
+        followed_file.finish(db_connection)
+    db_connection.commit()
+
+    return lines_loaded
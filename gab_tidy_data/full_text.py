@@ -0,0 +1,142 @@
+"""
+Full-text search
+
+An optional SQLite FTS5 index over the text of gabs and accounts, so they can be
+searched with "match" rather than scanning every row with "like '%term%'".
+
+The full-text tables are external content tables: they hold only the search index,
+and the text itself is read from the one row per id tables (see
+data_mapping.unique_table_names), so it isn't stored twice. Rows are matched up by
+the _unique_id (integer primary key) of those tables, which unlike an implicit rowid
+isn't renumbered by a vacuum. Once the index has been created (see
+create_full_text_index), triggers on those tables keep it up to date as files are
+loaded or merged. The triggers run inside the batched inserts made while
+loading, and only touch the index when a gab's or account's text has actually
+changed, so reloading the same gabs with updated counts costs little.
+
+For example, to find gabs mentioning "freedom":
+
+    select gab_unique.*
+    from gab_fts
+    join gab_unique on gab_unique._unique_id = gab_fts.rowid
+    where gab_fts match 'freedom'
+"""
+
+import sqlite3
+from logging import getLogger
+from typing import Dict, List, Tuple
+
+
+logger = getLogger(__name__)
+
+# {full-text table: (content table, [indexed columns])}
+full_text_tables: Dict[str, Tuple[str, List[str]]] = {
+    "gab_fts": ("gab_unique", ["content", "plain_markdown"]),
+    "account_fts": ("account_unique", ["display_name", "note"]),
+}
+
+
+def _trigger_sql(fts_table: str, content_table: str, columns: List[str]) -> List[str]:
+    """Triggers keeping the external content table fts_table in step with its content"""
+    column_list = ", ".join(columns)
+    new_values = ", ".join(f"new.{column}" for column in columns)
+    old_values = ", ".join(f"old.{column}" for column in columns)
+    changed = " or ".join(f"old.{column} is not new.{column}" for column in columns)
+
+    insert_new = f"""
+        insert into {fts_table} (rowid, {column_list})
+        values (new._unique_id, {new_values});
+    """
+    # External content tables need the old values to remove a row from the index
+    delete_old = f"""
+        insert into {fts_table} ({fts_table}, rowid, {column_list})
+        values ('delete', old._unique_id, {old_values});
+    """
+
+    return [
+        f"""
+        create trigger if not exists {fts_table}_insert
+        after insert on {content_table}
+        begin {insert_new} end
+        """,
+        f"""
+        create trigger if not exists {fts_table}_delete
+        after delete on {content_table}
+        begin {delete_old} end
+        """,
+        f"""
+        create trigger if not exists {fts_table}_update
+        after update of {column_list} on {content_table}
+        when {changed}
+        begin {delete_old} {insert_new} end
+        """,
+    ]
+
+
+def full_text_index_exists(db_connection: sqlite3.Connection) -> bool:
+    existing = {
+        name
+        for (name,) in db_connection.execute(
+            "select name from sqlite_master where type = 'table'"
+        )
+    }
+    return all(fts_table in existing for fts_table in full_text_tables)
+
+
+def create_full_text_index(db_connection: sqlite3.Connection) -> bool:
+    """
+    Creates the full-text tables and the triggers which keep them up to date, and
+    fills them from the rows already in the database. Does nothing if they already
+    exist. Returns True if the index was created.
+    """
+    if full_text_index_exists(db_connection):
+        return False
+
+    db = db_connection.cursor()
+
+    for fts_table, (content_table, columns) in full_text_tables.items():
+        logger.info(f"Creating full-text index {fts_table} over {content_table}")
+        db.execute(
+            f"""
+            create virtual table if not exists {fts_table} using fts5(
+                {", ".join(columns)},
+                content = {content_table},
+                content_rowid = _unique_id
+            )
+            """
+        )
+        for sql in _trigger_sql(fts_table, content_table, columns):
+            db.execute(sql)
+        db.execute(f"insert into {fts_table} ({fts_table}) values ('rebuild')")
+
+    db_connection.commit()
+
+    return True
+
+
+def rebuild_full_text_index(db_connection: sqlite3.Connection):
+    """
+    Rebuilds the full-text tables from scratch from their content tables, for example
+    if the content tables have been changed with the triggers disabled.
+    """
+    for fts_table in full_text_tables:
+        logger.info(f"Rebuilding full-text index {fts_table}")
+        db_connection.execute(
+            f"insert into {fts_table} ({fts_table}) values ('rebuild')"
+        )
+
+    db_connection.commit()
+
+
+def optimize_full_text_index(db_connection: sqlite3.Connection):
+    """
+    Merges the index segments written by many small batches of inserts into one, which
+    makes searches faster. Best run once loading has finished.
+    """
+    for fts_table in full_text_tables:
+        logger.info(f"Optimizing full-text index {fts_table}")
+        db_connection.execute(
+            f"insert into {fts_table} ({fts_table}) values ('optimize')"
+        )
+
+    db_connection.commit()
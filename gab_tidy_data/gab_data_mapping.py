@@ -21,16 +21,22 @@ as possible to create and modify the json->relational mapping and minimise human
 in doing so.
 
 The SQL queries should specify what should happen on primary key conflict.
+
+At the end of this file, the same mappings are also expressed declaratively as data
+(column_mappings), which mapping_compiler turns into the faster tuple-based mapping used
+when loading files. Any change to the mapping functions needs a matching change there.
 """
 
 from logging import getLogger
-from typing import Dict, List, Any
+from typing import Dict, Iterator, List, Any, NamedTuple, Optional, Tuple
+
+from gab_tidy_data.content_cleaning import clean_content as clean_gab_content
 
 logger = getLogger(__name__)
 
 
 # Database schema version - must be consistent with gab_schema.sql
-schema_version = "2021-08-30"
+schema_version = "2026-10-17.4"
 
 
 # Tables are ordered by how data should be inserted if foreign key integrity were to be
@@ -49,8 +55,17 @@ data_table_names = [
     "gab_mention",
     "gab_media_attachment",
     "gab_tag",
+    "gab_url",
     "gab_emoji",
 ]
+
+# Tables holding one row per id of the data table, from the most recently loaded file
+unique_table_names = {
+    "account": "account_unique",
+    "gab_group": "gab_group_unique",
+    "gab": "gab_unique",
+}
+
 insert_sql = dict()
 
 
@@ -441,7 +456,7 @@ def map_card_for_insert(card_json) -> Dict[str, List[Dict]]:
 # ---     Gab     ---
 # -------------------
 
-# missing reblog, mention_user_ids, mention_usernames
+# missing mention_user_ids, mention_usernames
 insert_sql[
     "gab"
 ] = """
@@ -457,6 +472,7 @@ insert or replace into gab (
     quote_of_id, has_quote,
     reblog,
     content, rich_content, plain_markdown,
+    content_text, content_text_sans_urls,
     account_id, group_id, card_id,
     _embedded_gab,
     _file_id
@@ -472,6 +488,7 @@ insert or replace into gab (
     :quote_of_id, :has_quote,
     :reblog,
     :content, :rich_content, :plain_markdown,
+    :content_text, :content_text_sans_urls,
     :account_id, :group_id, :card_id,
     :_embedded_gab,
     :_file_id
@@ -488,6 +505,15 @@ insert or ignore into gab_mention (
     :url, :acct
 )
 """
+insert_sql[
+    "gab_url"
+] = """
+insert or ignore into gab_url (
+    gab_id, url
+) values (
+    :gab_id, :url
+)
+"""
 insert_sql[
     "gab_emoji"
 ] = """
@@ -522,16 +548,96 @@ def map_mentions_for_insert(gab_id, mentions_json) -> Dict[str, list]:
     return {"gab_mention": mentions}
 
 
-def map_gab_for_insert(file_id, gab_json, embedded_gab=False) -> Dict[str, list]:
+# Fields of a gab which can hold another gab, mapped as embedded gabs
+embedded_gab_fields = ["quote", "reblog"]
+
+
+class MappedGabMemo:
     """
-    As the top-level json, object, this function will call all other mapping functions.
-    This may include map_gab_for_insert itself where gabs are embedded (e.g. quotes)
+    The rows mapped for embedded gabs (and the gabs embedded in them) from a file, so
+    that a gab embedded in many others (e.g. a popular quoted gab) is only mapped the
+    first time, and its rows are reused after that (see mapping_compiler.map_gab_into).
+    Remembers up to max_size gabs, forgetting the earliest first.
+
+    Rows are only reused for a copy of the gab identical to the one they were mapped
+    from, so the rows are always the same as mapping the copy again would give, and
+    what gets loaded doesn't depend on which gabs are remembered.
     """
-    gab_id = gab_json["id"]
 
+    def __init__(self, max_size: int = 10_000):
+        self.max_size = max_size
+        self._mapped = {}
+
+    def get(self, gab_json) -> Optional[Dict[str, list]]:
+        """The rows mapped from an identical copy of the gab, or None"""
+        mapped = self._mapped.get((gab_json["id"], gab_json["revised_at"]))
+        if mapped is None:
+            return None
+
+        mapped_json, rows = mapped
+        return rows if mapped_json == gab_json else None
+
+    def add(self, gab_json, rows: Dict[str, list]):
+        """Remembers the rows mapped from the gab"""
+        key = (gab_json["id"], gab_json["revised_at"])
+        if key not in self._mapped and len(self._mapped) >= self.max_size:
+            del self._mapped[next(iter(self._mapped))]
+        self._mapped[key] = (gab_json, rows)
+
+
+def embedded_gabs_first(gab_json) -> Iterator[Tuple[dict, bool]]:
+    """
+    Yields the gab and the gabs embedded in it (quotes and reblogs, to any depth), each
+    with whether it is embedded. Embedded gabs come before the gab they are embedded in,
+    quotes before reblogs.
+
+    Uses an explicit stack rather than recursion, so there is no limit on how deeply
+    gabs can be embedded.
+    """
+    # (gab, embedded, whether the gabs embedded in it have been added to the stack)
+    stack = [(gab_json, False, False)]
+    while stack:
+        gab, embedded, expanded = stack.pop()
+        if expanded:
+            yield gab, embedded
+            continue
+
+        stack.append((gab, embedded, True))
+        for field in reversed(embedded_gab_fields):
+            embedded_json = gab[field]
+            if embedded_json is not None:
+                stack.append((embedded_json, True, False))
+
+
+def map_gab_for_insert(
+    file_id, gab_json, embedded_gab=False, clean_content=False
+) -> Dict[str, list]:
+    """
+    As the top-level json, object, this function will call all other mapping functions,
+    for the gab and any gabs embedded in it (quotes and reblogs, see
+    embedded_gabs_first). Embedded gabs are mapped before the gab they are embedded in.
+
+    If clean_content is True, the plain text of the gab's content and the URLs in it are
+    also mapped (see content_cleaning), otherwise those columns are left empty.
+    """
     # Dict *ought* to retain key order - needed for foreign key integrity (if used)
     mappings = {t: [] for t in data_table_names}
 
+    for gab, embedded in embedded_gabs_first(gab_json):
+        add_mappings(
+            mappings,
+            _map_single_gab(file_id, gab, embedded_gab or embedded, clean_content),
+        )
+
+    return mappings
+
+
+def _map_single_gab(file_id, gab_json, embedded_gab, clean_content) -> Dict[str, list]:
+    """Maps the gab itself, without any gabs embedded in it"""
+    gab_id = gab_json["id"]
+
+    mappings = {t: [] for t in data_table_names}
+
     # Account
     account_mappings = map_account_for_insert(file_id, gab_id, gab_json["account"])
     account_id = account_mappings["account"][0]["id"]
@@ -573,6 +679,19 @@ def map_gab_for_insert(file_id, gab_json, embedded_gab=False) -> Dict[str, list]
     else:
         card_id = None
 
+    # Content text and URLs
+    if clean_content:
+        cleaned = clean_gab_content(gab_json["content"])
+        add_mappings(
+            mappings,
+            {"gab_url": [{"gab_id": gab_id, "url": url} for url in cleaned.urls]},
+        )
+        content_text = cleaned.text
+        content_text_sans_urls = cleaned.text_sans_urls
+    else:
+        content_text = None
+        content_text_sans_urls = None
+
     # Gab attributes
     mappings["gab"].append(
         {
@@ -598,9 +717,12 @@ def map_gab_for_insert(file_id, gab_json, embedded_gab=False) -> Dict[str, list]
             "content": gab_json["content"],  # text
             "rich_content": gab_json["rich_content"],  # text
             "plain_markdown": gab_json["plain_markdown"],  # text
-            "reblog": gab_json[
-                "reblog"
-            ],  # text - may need to be parsed as embedded gab
+            "content_text": content_text,  # text
+            "content_text_sans_urls": content_text_sans_urls,  # text
+            # text - id of the reblogged gab, which is mapped as an embedded gab
+            "reblog": (
+                gab_json["reblog"]["id"] if gab_json["reblog"] is not None else None
+            ),
             "account_id": account_id,  # text
             "group_id": group_id,  # text
             "card_id": card_id,  # text
@@ -609,19 +731,199 @@ def map_gab_for_insert(file_id, gab_json, embedded_gab=False) -> Dict[str, list]
         }
     )
 
-    embedded_gabs = []
+    return mappings
 
-    # process quotes
-    if gab_json["quote"] is not None:
-        embedded_gabs.append(
-            map_gab_for_insert(file_id, gab_json["quote"], embedded_gab=True)
-        )
 
-    # Merge embedded gabs in with this gab!
-    merged_mappings = {t: [] for t in data_table_names}
+# -----------------------------------
+# --- Declarative column mappings ---
+# -----------------------------------
 
-    # This gab goes last after any embedded gabs
-    for mapped_gab in embedded_gabs + [mappings]:
-        add_mappings(merged_mappings, mapped_gab)
+# The mappings above, expressed as data, so that mapping_compiler can compile them into
+# fast tuple-based row extractors and positional-parameter insert statements. These
+# must be kept consistent with the mapping functions above, which remain the reference
+# implementation (the tests check that both give the same rows).
+#
+# For each table, the columns are listed in the same order as the named parameters of
+# the insert statement in insert_sql, each with where its value comes from in the JSON
+# object being mapped (e.g. the account JSON for the account table):
+# - a string: that key of the JSON object
+# - a tuple of strings: a path of keys into nested JSON objects, which gives None if any
+#   object along the path is None. The empty tuple is the JSON object itself.
+# - a Context: a value which isn't in the JSON object itself, passed in by the caller
+
+
+class Context(NamedTuple):
+    name: str
+
+
+# Names of all the values which can be given by a Context
+context_names = [
+    "file_id",
+    "gab_id",
+    "parent_id",
+    "ordering",
+    "embedded_gab",
+    "content_text",
+    "content_text_sans_urls",
+]
 
-    return merged_mappings
+column_mappings: Dict[str, List[Tuple[str, Any]]] = {
+    "emoji": [
+        ("shortcode", "shortcode"),
+        ("url", "url"),
+        ("static_url", "static_url"),
+    ],
+    "account": [
+        ("id", "id"),
+        ("username", "username"),
+        ("acct", "acct"),
+        ("display_name", "display_name"),
+        ("locked", "locked"),
+        ("bot", "bot"),
+        ("created_at", "created_at"),
+        ("note", "note"),
+        ("url", "url"),
+        ("avatar", "avatar"),
+        ("avatar_static", "avatar_static"),
+        ("header", "header"),
+        ("header_static", "header_static"),
+        ("is_spam", "is_spam"),
+        ("followers_count", "followers_count"),
+        ("following_count", "following_count"),
+        ("statuses_count", "statuses_count"),
+        ("is_pro", "is_pro"),
+        ("is_verified", "is_verified"),
+        ("is_donor", "is_donor"),
+        ("is_investor", "is_investor"),
+        ("_file_id", Context("file_id")),
+    ],
+    # From each of the account's fields, with parent_id being the account id
+    "account_fields": [
+        ("account_id", Context("parent_id")),
+        ("_file_id", Context("file_id")),
+        ("ordering", Context("ordering")),
+        ("name", "name"),
+        ("value", "value"),
+        ("verified_at", "verified_at"),
+    ],
+    # From each of the account's emoji, with parent_id being the account id
+    "account_emoji": [
+        ("account_id", Context("parent_id")),
+        ("_file_id", Context("file_id")),
+        ("emoji_shortcode", "shortcode"),
+    ],
+    "group_category": [
+        ("id", "id"),
+        ("created_at", "created_at"),
+        ("updated_at", "updated_at"),
+        ("text", "text"),
+    ],
+    "gab_group": [
+        ("id", "id"),
+        ("title", "title"),
+        ("slug", "slug"),
+        ("url", "url"),
+        ("description", "description"),
+        ("description_html", "description_html"),
+        ("cover_image_url", "cover_image_url"),
+        ("group_category", ("group_category", "id")),
+        ("is_archived", "is_archived"),
+        ("is_private", "is_private"),
+        ("is_visible", "is_visible"),
+        ("member_count", "member_count"),
+        ("created_at", "created_at"),
+        ("has_password", "has_password"),
+        ("_file_id", Context("file_id")),
+    ],
+    # From each of the group's tags, with parent_id being the group id
+    "group_tag": [
+        ("group_id", Context("parent_id")),
+        ("_file_id", Context("file_id")),
+        ("tag", ()),
+    ],
+    "media_attachment": [
+        ("id", "id"),
+        ("type", "type"),
+        ("file_content_type", "file_content_type"),
+        ("url", "url"),
+        ("preview_url", "preview_url"),
+        ("source_mp4", "source_mp4"),
+        ("remote_url", "remote_url"),
+        ("text_url", "text_url"),
+        ("description", "description"),
+        ("blurhash", "blurhash"),
+    ],
+    "card": [
+        ("id", "id"),
+        ("url", "url"),
+        ("title", "title"),
+        ("description", "description"),
+        ("type", "type"),
+        ("provider_name", "provider_name"),
+        ("provider_url", "provider_url"),
+        ("html", "html"),
+        ("image_url", "image"),
+        ("embed_url", "embed_url"),
+        ("updated_at", "updated_at"),
+    ],
+    "gab": [
+        ("id", "id"),
+        ("created_at", "created_at"),
+        ("revised_at", "revised_at"),
+        ("expires_at", "expires_at"),
+        ("in_reply_to_id", "in_reply_to_id"),
+        ("in_reply_to_account_id", "in_reply_to_account_id"),
+        ("sensitive", "sensitive"),
+        ("spoiler_text", "spoiler_text"),
+        ("visibility", "visibility"),
+        ("language", "language"),
+        ("uri", "uri"),
+        ("url", "url"),
+        ("replies_count", "replies_count"),
+        ("reblogs_count", "reblogs_count"),
+        ("favourites_count", "favourites_count"),
+        ("pinnable", "pinnable"),
+        ("pinnable_by_group", "pinnable_by_group"),
+        ("quote_of_id", "quote_of_id"),
+        ("has_quote", "has_quote"),
+        ("reblog", ("reblog", "id")),
+        ("content", "content"),
+        ("rich_content", "rich_content"),
+        ("plain_markdown", "plain_markdown"),
+        ("content_text", Context("content_text")),
+        ("content_text_sans_urls", Context("content_text_sans_urls")),
+        ("account_id", ("account", "id")),
+        ("group_id", ("group", "id")),
+        ("card_id", ("card", "id")),
+        ("_embedded_gab", Context("embedded_gab")),
+        ("_file_id", Context("file_id")),
+    ],
+    # From each of the gab's mentions
+    "gab_mention": [
+        ("gab_id", Context("gab_id")),
+        ("account_id", "id"),
+        ("url", "url"),
+        ("acct", "acct"),
+    ],
+    # From each of the gab's media attachments
+    "gab_media_attachment": [
+        ("gab_id", Context("gab_id")),
+        ("media_attachment_id", "id"),
+    ],
+    # From each of the gab's tags
+    "gab_tag": [
+        ("gab_id", Context("gab_id")),
+        ("name", "name"),
+        ("url", "url"),
+    ],
+    # From each of the URLs in the gab's content, if content is being cleaned
+    "gab_url": [
+        ("gab_id", Context("gab_id")),
+        ("url", ()),
+    ],
+    # From each of the gab's emoji
+    "gab_emoji": [
+        ("gab_id", Context("gab_id")),
+        ("emoji_shortcode", "shortcode"),
+    ],
+}
@@ -0,0 +1,177 @@
+-------------------------------------
+-- Gab observations storage mode   --
+-------------------------------------
+
+-- Applied after gab_schema.sql when a database is created with the gab_observations
+-- storage mode. Instead of a full copy of every gab, content and all, for every file it
+-- appears in, each gab is stored once, along with a narrow row of the counts which
+-- change over time for each file it appears in. A gab is only stored again if it has
+-- changed in some other way (for example if it has been edited). The gab view gives the
+-- same rows as the gab table does in the default storage mode, and inserting into it
+-- (as loading does) fills the tables below.
+
+drop table gab;
+
+-- Each different version of a gab, usually only one
+create table gab_post (
+    id integer primary key,
+    gab_id text not null, -- Gab-provided id
+    created_at text not null, -- Unparsed text - appears to be in ISO format
+    created_at_parsed real generated always as (julianday(created_at)) stored, -- created_at in julianday format
+    revised_at text, -- Unparsed text
+    revised_at_parsed real generated always as (julianday(revised_at)) stored, -- revised_at in julianday format
+    in_reply_to_id text,
+    in_reply_to_account_id text,
+    sensitive integer, -- boolean
+    spoiler_text text,
+    visibility text,
+    language text,
+    uri text,
+    url text,
+    quote_of_id text,
+    expires_at text,
+    has_quote integer, -- boolean
+    content text, -- HTML text of gab
+    rich_content text,
+    plain_markdown text,
+    content_text text, -- content with HTML removed, if loaded with content cleaning
+    content_text_sans_urls text, -- content_text with URLs removed
+    reblog text,
+    account_id text references account (id),
+    group_id text references gab_group (id),
+    card_id text references card (id),
+    _file_id integer references _inserted_files (id) -- file this version first appeared in
+);
+
+create index gab_post_gab_id on gab_post (gab_id);
+
+-- Each file a gab appeared in, with the values which change over time
+create table gab_observation (
+    gab_id text,
+    _file_id integer references _inserted_files (id),
+    post_id integer references gab_post (id),
+    replies_count integer,
+    reblogs_count integer,
+    pinnable integer, -- boolean
+    pinnable_by_group integer, -- boolean
+    favourites_count integer,
+    _embedded_gab integer, -- boolean
+    primary key (gab_id, _file_id)
+);
+
+-- So queries on gab_post columns (e.g. through the query indexes) can find the files
+create index gab_observation_post_id on gab_observation (post_id);
+
+-- Same columns, in the same order, as the gab table of the default storage mode
+create view gab as
+select
+    observation.gab_id as id,
+    post.created_at,
+    post.created_at_parsed,
+    post.revised_at,
+    post.revised_at_parsed,
+    post.in_reply_to_id,
+    post.in_reply_to_account_id,
+    post.sensitive,
+    post.spoiler_text,
+    post.visibility,
+    post.language,
+    post.uri,
+    post.url,
+    observation.replies_count,
+    observation.reblogs_count,
+    observation.pinnable,
+    observation.pinnable_by_group,
+    observation.favourites_count,
+    post.quote_of_id,
+    post.expires_at,
+    post.has_quote,
+    post.content,
+    post.rich_content,
+    post.plain_markdown,
+    post.content_text,
+    post.content_text_sans_urls,
+    post.reblog,
+    post.account_id,
+    post.group_id,
+    post.card_id,
+    observation._embedded_gab,
+    observation._file_id
+from gab_observation as observation
+join gab_post as post on post.id = observation.post_id;
+
+-- A new version is only written if none of the gab's versions are the same. Loading
+-- inserts with "insert or replace", which also applies to the statements here, so the
+-- last observation of a gab in a file is kept.
+create trigger gab_insert instead of insert on gab
+begin
+    insert into gab_post (
+        gab_id, created_at, revised_at, in_reply_to_id, in_reply_to_account_id,
+        sensitive, spoiler_text, visibility, language, uri, url,
+        quote_of_id, expires_at, has_quote,
+        content, rich_content, plain_markdown, content_text, content_text_sans_urls,
+        reblog, account_id, group_id, card_id,
+        _file_id
+    )
+    select
+        new.id, new.created_at, new.revised_at, new.in_reply_to_id,
+        new.in_reply_to_account_id,
+        new.sensitive, new.spoiler_text, new.visibility, new.language, new.uri, new.url,
+        new.quote_of_id, new.expires_at, new.has_quote,
+        new.content, new.rich_content, new.plain_markdown, new.content_text,
+        new.content_text_sans_urls,
+        new.reblog, new.account_id, new.group_id, new.card_id,
+        new._file_id
+    where not exists (
+        select 1 from gab_post
+        where gab_id = new.id
+            and created_at is new.created_at and revised_at is new.revised_at
+            and in_reply_to_id is new.in_reply_to_id
+            and in_reply_to_account_id is new.in_reply_to_account_id
+            and sensitive is new.sensitive and spoiler_text is new.spoiler_text
+            and visibility is new.visibility and language is new.language
+            and uri is new.uri and url is new.url
+            and quote_of_id is new.quote_of_id and expires_at is new.expires_at
+            and has_quote is new.has_quote and content is new.content
+            and rich_content is new.rich_content
+            and plain_markdown is new.plain_markdown
+            and content_text is new.content_text
+            and content_text_sans_urls is new.content_text_sans_urls
+            and reblog is new.reblog and account_id is new.account_id
+            and group_id is new.group_id and card_id is new.card_id
+    );
+
+    insert into gab_observation (
+        gab_id, _file_id, post_id,
+        replies_count, reblogs_count, pinnable, pinnable_by_group, favourites_count,
+        _embedded_gab
+    )
+    values (
+        new.id,
+        new._file_id,
+        (
+            select id from gab_post
+            where gab_id = new.id
+                and created_at is new.created_at and revised_at is new.revised_at
+                and in_reply_to_id is new.in_reply_to_id
+                and in_reply_to_account_id is new.in_reply_to_account_id
+                and sensitive is new.sensitive and spoiler_text is new.spoiler_text
+                and visibility is new.visibility and language is new.language
+                and uri is new.uri and url is new.url
+                and quote_of_id is new.quote_of_id and expires_at is new.expires_at
+                and has_quote is new.has_quote and content is new.content
+                and rich_content is new.rich_content
+                and plain_markdown is new.plain_markdown
+                and content_text is new.content_text
+                and content_text_sans_urls is new.content_text_sans_urls
+                and reblog is new.reblog and account_id is new.account_id
+                and group_id is new.group_id and card_id is new.card_id
+        ),
+        new.replies_count,
+        new.reblogs_count,
+        new.pinnable,
+        new.pinnable_by_group,
+        new.favourites_count,
+        new._embedded_gab
+    );
+end;
@@ -9,7 +9,7 @@ create table _gab_tidy_data (
 );
 
 -- Update this whenever the schema is changed!!!
-insert into _gab_tidy_data values ("schema_version", "2021-08-30");
+insert into _gab_tidy_data values ("schema_version", "2026-10-17.4");
 
 -- Metadata table to track which files have been inserted into this database
 create table _inserted_files (
@@ -18,9 +18,16 @@ create table _inserted_files (
     num_gabs_inserted integer,  -- null may indicate unsuccessful insert
     num_parsing_failures integer,  -- counts lines of input file, not gabs
     inserted_at real,  -- time in UTC (julianday format, see sqlite docs)
-    inserted_by_version text  -- stores the gab_tidy_data tool version
+    inserted_by_version text,  -- stores the gab_tidy_data tool version
+    file_size integer,  -- size of the input file in bytes, as stored (i.e. compressed)
+    fingerprint text,  -- hash of samples of the input file, to recognise reloads
+    lines_read integer,  -- lines of the input file loaded so far, for resuming
+    bytes_read integer,  -- bytes of the decompressed input loaded so far, for resuming
+    num_mapping_failures integer  -- lines which parsed, but couldn't be mapped
 );
 
+create index _inserted_files_fingerprint on _inserted_files (fingerprint);
+
 ---------------------
 -- Gab data tables --
 ---------------------
@@ -175,7 +182,9 @@ create table gab (
     content text, -- HTML text of gab
     rich_content text, -- Not sure how different from content?
     plain_markdown text,
-    reblog text, -- Always null. Should be json if not null in theory. Does the Gab hashtag API only give original posts and no reblogs?
+    content_text text, -- content with HTML removed, if loaded with content cleaning
+    content_text_sans_urls text, -- content_text with URLs removed
+    reblog text, -- id of the reblogged gab if this is a reblog, which is stored as an embedded gab
     account_id text references account (id),
     group_id text references gab_group (id),
     card_id text references card (id),
@@ -185,9 +194,10 @@ create table gab (
 );
 -- fields omitted:
 -- - User-specific: favourited, reblogged, bookmark_collection_id
--- - quote: use quote_of_id to identify the quoted tweet
+-- - quote: use quote_of_id to identify the quoted gab, which is stored as an embedded gab
 -- fields added:
 -- - created_at_parsed, revised_at_parsed
+-- - content_text, content_text_sans_urls - only filled if content cleaning is on
 -- - mention_user_ids, mention_usernames, tags - convenience columns duplicating
 --   information available in the gab_mention and gab_tag tables respectively
 
@@ -213,6 +223,14 @@ create table gab_media_attachment (
     media_attachment_id text references media_attachment (id)
 );
 
+-- URLs found in the text of the gab's content, only filled if content cleaning is on.
+-- Like tags, assumes the content doesn't change over time
+create table gab_url (
+    gab_id text references gab (id),
+    url text,
+    primary key (gab_id, url)
+);
+
 -- Assumes emoji are only in the content, and that the content doesn't change over time
 create table gab_emoji (
     gab_id text references gab (id),
@@ -220,18 +238,98 @@ create table gab_emoji (
 );
 
 
----------------------
---      Views      --
----------------------
+----------------------------
+--   One row per id tables  --
+----------------------------
 
--- These views remove the time element from the tables, so there is only one row per
--- post, account, etc. Where the full table does have multiple rows per post (for
--- example), it is arbitrary which row for each post is displayed in the view, but in
--- practice it usually seems to be the first row in the table per post.
--- See https://www.sqlite.org/quirks.html#aggregate_queries_can_contain_non_aggregate_result_columns_that_are_not_in_the_group_by_clause
+-- These tables remove the time element from the gab, account and gab_group tables, so
+-- there is only one row per post, account and group: the row from the most recently
+-- loaded file containing it (the highest _file_id). They have the same columns as the
+-- tables they are made from, plus _unique_id, and are kept up to date as files are
+-- loaded.
+--
+-- _unique_id is the rowid of each row. The full-text index (see full_text.py) refers to
+-- rows by rowid, and only an integer primary key keeps the same rowid through a vacuum.
 
-create view gab_unique as select * from gab group by id;
+create table gab_unique (
+    id text not null unique, -- Gab-provided id
+    created_at text not null,
+    created_at_parsed real generated always as (julianday(created_at)) stored,
+    revised_at text,
+    revised_at_parsed real generated always as (julianday(revised_at)) stored,
+    in_reply_to_id text,
+    in_reply_to_account_id text,
+    sensitive integer, -- boolean
+    spoiler_text text,
+    visibility text,
+    language text,
+    uri text,
+    url text,
+    replies_count integer,
+    reblogs_count integer,
+    pinnable integer, -- boolean
+    pinnable_by_group integer, -- boolean
+    favourites_count integer,
+    quote_of_id text,
+    expires_at text,
+    has_quote integer, -- boolean
+    content text,
+    rich_content text,
+    plain_markdown text,
+    content_text text,
+    content_text_sans_urls text,
+    reblog text,
+    account_id text references account (id),
+    group_id text references gab_group (id),
+    card_id text references card (id),
+    _embedded_gab integer, -- boolean
+    _file_id integer references _inserted_files (id),
+    _unique_id integer primary key
+);
 
-create view account_unique as select * from account group by id;
+create table account_unique (
+    id text not null unique, -- Gab-provided user id
+    username text not null,
+    acct text,
+    display_name text,
+    locked integer, -- boolean
+    bot integer, -- boolean
+    created_at text,
+    created_at_parsed real generated always as (julianday(created_at)) stored,
+    note text,
+    url text,
+    avatar text,
+    avatar_static text,
+    header text,
+    header_static text,
+    is_spam integer, -- boolean
+    followers_count integer,
+    following_count integer,
+    statuses_count integer,
+    is_pro integer, -- boolean
+    is_verified integer, -- boolean
+    is_donor integer, -- boolean
+    is_investor integer, --boolean,
+    _file_id integer references _inserted_files (id),
+    _unique_id integer primary key
+);
 
-create view gab_group_unique as select * from gab_group group by id;
+create table gab_group_unique (
+    id text not null unique,
+    title text,
+    description text,
+    description_html text,
+    cover_image_url text,
+    is_archived integer, -- boolean
+    member_count integer,
+    created_at text,
+    created_at_parsed real generated always as (julianday(created_at)) stored,
+    is_private integer, -- boolean
+    is_visible integer, -- boolean
+    slug text,
+    url text,
+    group_category integer references group_category (id),
+    has_password integer, -- boolean
+    _file_id integer references _inserted_files (id),
+    _unique_id integer primary key
+);
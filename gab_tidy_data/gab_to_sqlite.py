@@ -1,78 +1,964 @@
 from logging import getLogger
 import sqlite3
-import json
+import multiprocessing
+import time
+from collections import deque
+from contextlib import closing, contextmanager
+from functools import partial
 from click import format_filename
 
-from typing import TextIO, Optional, Tuple
+from typing import (
+    TextIO,
+    BinaryIO,
+    Union,
+    Optional,
+    Tuple,
+    Dict,
+    List,
+    Iterator,
+    Iterable,
+    NamedTuple,
+    Callable,
+    Any,
+)
 from importlib.resources import open_text
 import datetime as dt
 
 import gab_tidy_data.gab_data_mapping as data_mapping
+import gab_tidy_data.input_files as input_files
+import gab_tidy_data.mapping_compiler as mapping_compiler
+from gab_tidy_data.metrics import IngestMetrics, ProgressReporter
+from gab_tidy_data.quarantine import FailedLine, Quarantine, describe_error
+from gab_tidy_data.row_cache import WrittenRowCache
+from gab_tidy_data.url_dictionary import (
+    UrlDictionary,
+    encoded_columns,
+    encoded_insert_sql,
+)
 
 
 logger = getLogger(__name__)
 
 metadata_table_names = ["_gab_tidy_data", "_inserted_files"]
-all_table_names = metadata_table_names + data_mapping.data_table_names
+all_table_names = (
+    metadata_table_names
+    + data_mapping.data_table_names
+    + list(data_mapping.unique_table_names.values())
+)
 
 
-def initialise_empty_database(db_connection: sqlite3.Connection):
-    with open_text("gab_tidy_data", "gab_schema.sql") as sql_file:
-        logger.debug(f"Initialising database from SQL file {sql_file.name}")
-        db_connection.executescript("\n".join(sql_file))
+# Connection settings used while bulk loading (see bulk_load). These trade durability
+# for speed: a crash part way through a bulk load may leave the database unusable.
+bulk_load_pragmas = {
+    "journal_mode": "memory",
+    "synchronous": "off",
+    "cache_size": -256 * 1024,  # negative means KiB, so 256MiB
+    "temp_store": "memory",
+}
+# Only takes effect if set before the database schema is created
+bulk_load_page_size = 65536
+
+
+# Secondary indexes for common research queries, as {name: (table, column)}, built
+# after loading (see create_query_indexes). Building an index over a loaded table in one
+# go is much faster than maintaining it row by row while loading.
+query_indexes = {
+    "gab_created_at_parsed": ("gab", "created_at_parsed"),
+    "gab_account_id": ("gab", "account_id"),
+    "gab_group_id": ("gab", "group_id"),
+    "gab_in_reply_to_id": ("gab", "in_reply_to_id"),
+    "gab_quote_of_id": ("gab", "quote_of_id"),
+    "gab_tag_name": ("gab_tag", "name"),
+    "gab_mention_account_id": ("gab_mention", "account_id"),
+    "gab_media_attachment_gab_id": ("gab_media_attachment", "gab_id"),
+    "gab_emoji_gab_id": ("gab_emoji", "gab_id"),
+    "gab_unique_created_at_parsed": ("gab_unique", "created_at_parsed"),
+    "gab_unique_account_id": ("gab_unique", "account_id"),
+}
+
+
+# Optional ways of storing some of the data, as {name: SQL file}. Each SQL file is run
+# after gab_schema.sql when a database is created with that storage mode, replacing
+# tables with smaller ones, and views with the same columns as the tables they replace
+# so that loading and queries work as before.
+storage_modes = {
+    # Only store an account's profile again when it changes, see account_snapshots.sql
+    "account_snapshots": "account_snapshots.sql",
+    # Only store a gab again when it changes, see gab_observations.sql
+    "gab_observations": "gab_observations.sql",
+    # Store the common prefixes of URLs once, see url_dictionary.sql
+    "url_dictionary": "url_dictionary.sql",
+}
+
+# Storage modes which replace the same table, so can't be used together
+conflicting_storage_modes = [{"account_snapshots", "url_dictionary"}]
+
+# The tables holding the columns of views made by storage modes, so that query indexes
+# on a view are built on the table under it instead. Unlike indexes on the data tables,
+# indexes on these aren't dropped during bulk loads, as the storage mode triggers need
+# them to find earlier versions of a row.
+view_index_tables = {"gab": "gab_post"}
+
+# Errors raised when mapping JSON which isn't shaped like a gab, e.g. a missing field
+# (KeyError) or a field of the wrong type (TypeError). Lines raising these are skipped
+# rather than stopping the load (see _map_lines).
+mapping_errors = (KeyError, IndexError, TypeError, ValueError, AttributeError)
+
+
+def initialise_empty_database(
+    db_connection: sqlite3.Connection, modes: Iterable[str] = ()
+):
+    """
+    Creates the tables of a new database, using the given storage modes (see
+    storage_modes). Raises ValueError for an unknown storage mode.
+    """
+    modes = list(dict.fromkeys(modes))
+    unknown = [mode for mode in modes if mode not in storage_modes]
+    if unknown:
+        raise ValueError(f"Unknown storage modes {', '.join(unknown)}")
+    for conflicting in conflicting_storage_modes:
+        if conflicting <= set(modes):
+            raise ValueError(
+                f"Storage modes {' and '.join(sorted(conflicting))} can't be used "
+                "together"
+            )
+
+    for sql_filename in ["gab_schema.sql"] + [storage_modes[mode] for mode in modes]:
+        with open_text("gab_tidy_data", sql_filename) as sql_file:
+            logger.debug(f"Initialising database from SQL file {sql_file.name}")
+            db_connection.executescript("\n".join(sql_file))
+
+    if modes:
+        db_connection.execute(
+            "insert into _gab_tidy_data values ('storage_modes', ?)", [",".join(modes)]
+        )
 
     db_connection.commit()
 
 
-def load_file_to_sqlite(json_fh: TextIO, db_connection) -> Tuple[int, int]:
+def database_storage_modes(db_connection: sqlite3.Connection) -> List[str]:
+    """The storage modes the database was created with"""
+    row = db_connection.execute(
+        "select metadata_value from _gab_tidy_data where metadata_key = 'storage_modes'"
+    ).fetchone()
+
+    return row[0].split(",") if row is not None and row[0] else []
+
+
+def is_view(
+    db_connection: sqlite3.Connection, table: str, schema: str = "main"
+) -> bool:
     """
-    Parse and load Garc output json file into database using data mappings
+    Whether the table is a view, as tables replaced by a storage mode are. Views have no
+    rowid, so must be ordered by _file_id instead.
+    """
+    row = db_connection.execute(
+        f'select type from "{schema}".sqlite_master where name = ?', [table]
+    ).fetchone()
 
-    Garc output is one json object per line. No [] wrapping the whole, no comma between
-    objects.
+    return row is not None and row[0] == "view"
 
-    Note: the "fh" in "json_fh" is short for "file handler"
 
-    Returns (number of gabs inserted, number of posts which failed to parse). The total
-    number of posts may be greater than the number of lines in the json file, as
-    embedded gabs are also counted.
+def stored_columns(
+    db_connection: sqlite3.Connection, table: str, schema: str = "main"
+) -> List[str]:
+    """The columns of the table which can be inserted into, i.e. not generated ones"""
+    return [
+        name
+        for _, name, _, _, _, _, hidden in db_connection.execute(
+            f'pragma "{schema}".table_xinfo("{table}")'
+        )
+        if hidden == 0
+    ]
+
+
+def unique_table_columns(
+    db_connection: sqlite3.Connection, unique_table: str, schema: str = "main"
+) -> List[str]:
+    """
+    The columns of a one row per id table which are filled from its data table, i.e.
+    the stored columns other than its own _unique_id
+    """
+    return [
+        column
+        for column in stored_columns(db_connection, unique_table, schema)
+        if column != "_unique_id"
+    ]
+
+
+def rebuild_unique_tables(db_connection: sqlite3.Connection):
+    """
+    Refills the one row per id tables (see data_mapping.unique_table_names) from the
+    tables they are made from. They are kept up to date while loading, so this is only
+    needed if the data tables have been changed some other way.
     """
     db = db_connection.cursor()
-    # Filename string to use for logging, output, metadata etc
-    friendly_filename = format_filename(json_fh.name, shorten=True)
 
-    failed_parsing = []
+    for table, unique_table in data_mapping.unique_table_names.items():
+        logger.info(f"Rebuilding {unique_table} from {table}")
+        columns = unique_table_columns(db_connection, unique_table)
+        order = "_file_id" if is_view(db_connection, table) else "_file_id, rowid"
+        db.execute(f"delete from {unique_table}")
+        db.execute(
+            f"""
+            insert into {unique_table} ({", ".join(columns)})
+            select {", ".join(columns)}
+            from {table}
+            where true
+            order by {order}
+            {mapping_compiler.unique_upsert_clause(table, columns)}
+            """
+        )
+
+    db_connection.commit()
+
+
+def drop_secondary_indexes(db_connection: sqlite3.Connection) -> List[str]:
+    """
+    Drops the non-unique indexes on the data tables, so they aren't maintained row by
+    row during a bulk load. Primary keys and unique indexes are left alone, as the
+    "insert or replace"/"insert or ignore" conflict handling relies on them.
 
-    # File metadata
+    Returns the SQL needed to recreate the dropped indexes (see create_indexes).
+    """
+    db = db_connection.cursor()
     db.execute(
         """
-        insert into _inserted_files (filename, inserted_by_version)
-        values (:filename, :inserted_by_version)
-    """,
-        {"filename": friendly_filename, "inserted_by_version": "superalpha"},
+        select m.name, m.sql
+        from sqlite_master as m
+        where m.type = 'index'
+            and m.sql is not null
+            and m.tbl_name in ({})
+        """.format(
+            ", ".join("?" for _ in data_mapping.data_table_names)
+        ),
+        data_mapping.data_table_names,
     )
+    indexes = [
+        (name, sql)
+        for name, sql in db.fetchall()
+        if not sql.lstrip().lower().startswith("create unique")
+    ]
+
+    for name, _ in indexes:
+        logger.debug(f"Dropping index {name} until loading is finished")
+        db.execute(f'drop index "{name}"')
+
+    db_connection.commit()
+
+    return [sql for _, sql in indexes]
+
+
+def create_indexes(db_connection: sqlite3.Connection, index_sql: List[str]):
+    for sql in index_sql:
+        # SQLite stores index SQL starting "CREATE INDEX", so indexes which have been
+        # built again in the meantime (e.g. by create_query_indexes) can be skipped
+        db_connection.execute(
+            sql.replace("CREATE INDEX", "CREATE INDEX IF NOT EXISTS", 1)
+        )
+
+    db_connection.commit()
+
+
+def create_query_indexes(
+    db_connection: sqlite3.Connection, index_names: Optional[List[str]] = None
+) -> List[str]:
+    """
+    Builds the named query_indexes (by default all of them) that don't already exist,
+    and updates the query planner statistics if any were built. Returns the names of
+    the indexes built.
+    """
+    if index_names is None:
+        index_names = list(query_indexes)
+
+    existing = {
+        name
+        for (name,) in db_connection.execute(
+            "select name from sqlite_master where type = 'index'"
+        )
+    }
+    to_build = [name for name in index_names if name not in existing]
+
+    for name in to_build:
+        logger.info(f"Building index {name}")
+        table, column = query_indexes[name]
+        if is_view(db_connection, table):
+            table = view_index_tables[table]
+        db_connection.execute(f"create index {name} on {table} ({column})")
+
+    if to_build:
+        db_connection.execute("analyze")
+    db_connection.commit()
+
+    return to_build
 
-    file_id = db.lastrowid
 
-    for gab_line in json_fh:
+@contextmanager
+def bulk_load(db_connection: sqlite3.Connection, new_database: bool = False):
+    """
+    Context manager for loading a large amount of data in one go.
+
+    On entry, applies bulk_load_pragmas to the connection (and bulk_load_page_size if
+    this is a new database, which must not have been initialised yet) and drops the
+    secondary indexes on the data tables. On exit, the indexes are rebuilt in bulk, the
+    query planner statistics are updated with ANALYZE, and the connection's original
+    settings are restored.
+    """
+    original_pragmas = {
+        pragma: db_connection.execute(f"pragma {pragma}").fetchone()[0]
+        for pragma in bulk_load_pragmas
+    }
+
+    if new_database:
+        db_connection.execute(f"pragma page_size = {bulk_load_page_size}")
+
+    for pragma, value in bulk_load_pragmas.items():
+        db_connection.execute(f"pragma {pragma} = {value}")
+
+    deferred_indexes = drop_secondary_indexes(db_connection)
+
+    try:
+        yield
+    finally:
+        db_connection.commit()
+
+        logger.info(f"Rebuilding {len(deferred_indexes)} indexes after bulk load")
+        create_indexes(db_connection, deferred_indexes)
+
+        logger.info("Updating query planner statistics")
+        db_connection.execute("analyze")
+        db_connection.commit()
+
+        for pragma, value in original_pragmas.items():
+            db_connection.execute(f"pragma {pragma} = {value}")
+
+
+def _chunk_lines(
+    lines: Iterable[Union[bytes, str]], chunk_size: int
+) -> Iterator[List[Union[bytes, str]]]:
+    """
+    Groups the lines of the input file into lists of (at most) chunk_size lines, to be
+    handed to the parsing workers.
+    """
+    chunk = []
+    for gab_line in lines:
+        chunk.append(gab_line)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+
+    if chunk:
+        yield chunk
+
+
+class MappedChunk(NamedTuple):
+    """Result of mapping a chunk of input lines"""
+
+    rows: Dict[str, list]  # Rows for each table
+    num_lines: int
+    num_bytes: int  # Size of the lines in bytes, including newlines (UTF-8 for text)
+    num_mapped: int
+    num_failed: int  # Number of lines which failed to parse
+    # Time spent decoding JSON, or None if it was timed together with mapping
+    decode_seconds: Optional[float] = None
+    map_seconds: float = 0.0  # Time spent mapping (and decoding, if not timed above)
+    num_mapping_failed: int = 0  # Number of lines which parsed, but failed to map
+    failed_lines: Tuple[FailedLine, ...] = ()  # Lines which failed to parse or map
+
+
+def _map_lines(
+    file_id: int,
+    json_decoder: str,
+    lines: List[Union[bytes, str]],
+    profile: bool = False,
+    clean_content: bool = False,
+    memo: Optional[data_mapping.MappedGabMemo] = None,
+) -> MappedChunk:
+    """
+    Parses and maps a chunk of input lines, ready for insertion into the database.
+
+    This does not touch the database, so it can be run in a worker process. The JSON
+    decoder is given by name (see input_files.get_json_decoder) so it can be passed to
+    worker processes.
+
+    Rows are mapped with the compiled mappings (see mapping_compiler), and are in input
+    order within each table. If clean_content is True, the plain text and URLs of each
+    gab's content are mapped too. Gabs embedded in other gabs are only mapped the first
+    time they appear in the chunk, or across all the chunks of a file mapped with the
+    same memo, and their rows reused after that, so the rows are the same however the
+    file is split into chunks. Lines which fail to parse, or to map (see
+    mapping_errors), are skipped, and returned in failed_lines along with their errors.
+
+    The time taken is recorded for the whole chunk, or if profile is True, separately
+    for decoding and mapping each line.
+    """
+    decode, decode_errors = input_files.get_json_decoder(json_decoder)
+    if memo is None:
+        memo = data_mapping.MappedGabMemo()
+    rows = mapping_compiler.empty_rows()
+    table_rows = list(rows.values())
+    num_mapped = 0
+    num_failed = 0
+    num_mapping_failed = 0
+    failed_lines = []
+    decode_seconds = 0.0 if profile else None
+    map_seconds = 0.0
+    clock = time.perf_counter
+    chunk_started = clock()
+
+    for index, gab_line in enumerate(lines):
+        if profile:
+            line_started = clock()
         try:
-            gab_json = json.loads(gab_line)
-        except json.JSONDecodeError as e:
-            failed_parsing.append(gab_line)
+            gab_json = decode(gab_line)
+        except decode_errors as e:
+            num_failed += 1
+            failed_lines.append(FailedLine(index, "parse", describe_error(e), gab_line))
             logger.debug(exc_info=e, msg="Failed to parse input line. Skipping line.")
             continue  # Skip lines with JSON parsing issues
 
+        if profile:
+            decoded = clock()
+            decode_seconds += decoded - line_started
+
         # Parse this gab, and any gabs embedded within this gab
-        gab_mappings = data_mapping.map_gab_for_insert(file_id, gab_json)
+        num_table_rows = [len(table) for table in table_rows]
+        try:
+            mapping_compiler.map_gab_into(
+                rows, file_id, gab_json, clean_content=clean_content, memo=memo
+            )
+        except mapping_errors as e:
+            # Throw away any rows mapped before the error
+            for table, num_rows in zip(table_rows, num_table_rows):
+                del table[num_rows:]
+
+            num_mapping_failed += 1
+            failed_lines.append(FailedLine(index, "map", describe_error(e), gab_line))
+            logger.debug(exc_info=e, msg="Failed to map input line. Skipping line.")
+            continue
+
+        num_mapped += 1
+
+        if profile:
+            map_seconds += clock() - decoded
+
+    if not profile:
+        map_seconds = clock() - chunk_started
+
+    # Lines include their newlines. Text lines are counted as UTF-8, which is only the
+    # size of the input if that is how it was encoded.
+    if lines and isinstance(lines[0], str):
+        num_bytes = sum(len(line.encode("utf-8", errors="replace")) for line in lines)
+    else:
+        num_bytes = sum(map(len, lines))
+
+    return MappedChunk(
+        rows,
+        len(lines),
+        num_bytes,
+        num_mapped,
+        num_failed,
+        decode_seconds,
+        map_seconds,
+        num_mapping_failed,
+        tuple(failed_lines),
+    )
+
+
+def _add_chunk_metrics(metrics: IngestMetrics, mapped_chunk: MappedChunk):
+    metrics.lines_read += mapped_chunk.num_lines
+    metrics.bytes_read += mapped_chunk.num_bytes
+    metrics.gabs_mapped += mapped_chunk.num_mapped
+    metrics.parsing_failures += mapped_chunk.num_failed
+    metrics.mapping_failures += mapped_chunk.num_mapping_failed
+
+    if mapped_chunk.decode_seconds is None:
+        metrics.add_stage(
+            "decode_and_map", mapped_chunk.map_seconds, mapped_chunk.num_lines
+        )
+    else:
+        metrics.add_stage("decode", mapped_chunk.decode_seconds, mapped_chunk.num_lines)
+        metrics.add_stage("map", mapped_chunk.map_seconds, mapped_chunk.num_mapped)
+
+
+def _map_byte_range(
+    file_id: int,
+    json_decoder: str,
+    path: str,
+    byte_range: Tuple[int, int],
+    profile: bool = False,
+    clean_content: bool = False,
+) -> MappedChunk:
+    """
+    Reads the lines in a byte range of an uncompressed file (see
+    input_files.split_line_ranges) and maps them, as _map_lines. Run in a worker
+    process, so only the path and byte offsets are sent to the worker, not the lines.
+    """
+    start, end = byte_range
+    lines = input_files.read_line_range(path, start, end)
+    mapped_chunk = _map_lines(file_id, json_decoder, lines, profile, clean_content)
+
+    # Exact, even if the final line of the file doesn't end with a newline
+    return mapped_chunk._replace(num_bytes=end - start)
+
+
+def _map_in_parallel(
+    map_chunk: Callable[[Any], MappedChunk],
+    chunks: Iterable[Any],
+    workers: int,
+) -> Iterator[MappedChunk]:
+    """
+    Maps chunks of input (lists of lines, or byte ranges) with map_chunk in a pool of
+    worker processes, yielding the results in input order.
+
+    Only a bounded number of chunks are in flight at any time, so the input file is
+    never read much further ahead than the workers can keep up with.
+    """
+    max_in_flight = workers * 2
+
+    with multiprocessing.Pool(workers) as pool:
+        in_flight = deque()
+
+        for chunk in chunks:
+            in_flight.append(pool.apply_async(map_chunk, (chunk,)))
+
+            if len(in_flight) >= max_in_flight:
+                yield in_flight.popleft().get()
+
+        while in_flight:
+            yield in_flight.popleft().get()
+
+
+@contextmanager
+def _open_mapped_chunks(
+    json_fh: Union[TextIO, BinaryIO],
+    file_id: int,
+    json_decoder: str,
+    start: int,
+    workers: int,
+    chunk_size: int,
+    range_size: int,
+    mappable_path: Optional[str],
+    metrics: IngestMetrics,
+    clean_content: bool,
+) -> Iterator[Iterator[MappedChunk]]:
+    """
+    Context manager giving the mapped chunks of the input file from byte start onwards,
+    in input order (see load_file_to_sqlite).
+    """
+    if mappable_path is not None:
+        byte_ranges = input_files.split_line_ranges(mappable_path, start, range_size)
+        map_range = partial(
+            _map_byte_range,
+            file_id,
+            json_decoder,
+            mappable_path,
+            profile=metrics.profile,
+            clean_content=clean_content,
+        )
+        byte_ranges = metrics.timed_iter(byte_ranges, "read")
+        with closing(_map_in_parallel(map_range, byte_ranges, workers)) as chunks:
+            yield chunks
+        return
+
+    with input_files.open_input_lines(json_fh, start=start) as lines:
+        chunks = metrics.timed_iter(_chunk_lines(lines, chunk_size), "read")
+        # Worker processes each get a copy of the partial, so can only share a memo
+        # within a chunk. This only changes how much mapping is saved, not the rows.
+        map_chunk = partial(
+            _map_lines,
+            file_id,
+            json_decoder,
+            profile=metrics.profile,
+            clean_content=clean_content,
+            memo=data_mapping.MappedGabMemo() if workers == 1 else None,
+        )
+
+        if workers > 1:
+            with closing(_map_in_parallel(map_chunk, chunks, workers)) as mapped:
+                yield mapped
+        else:
+            yield map(map_chunk, chunks)
+
+
+class InsertBuffer:
+    """
+    Collects the mapped rows for each table across many gabs, so that each table can be
+    inserted with a single large executemany rather than several small ones per gab.
+
+    Rows are buffered until batch_size gabs have been added, or until flush is called.
+    Tables are always flushed in the order of data_mapping.data_table_names, which is
+    the order needed for foreign key integrity. Within a table, rows are inserted in the
+    order they were added, so "insert or replace" still keeps the last row. Rows of the
+    tables with a one row per id table (see data_mapping.unique_table_names) are also
+    inserted into that table.
+
+    Rows are tuples, inserted with the compiled insert statements in
+    mapping_compiler.insert_sql, or encoded with url_dictionary first if one is given
+    (for databases using the url_dictionary storage mode). If a row_cache is given,
+    rows of reference tables which have already been written unchanged are skipped. If
+    metrics are given, the time taken and rows inserted are recorded for each table.
+    """
+
+    def __init__(
+        self,
+        db: sqlite3.Cursor,
+        batch_size: int = 5000,
+        row_cache: Optional[WrittenRowCache] = None,
+        metrics: Optional[IngestMetrics] = None,
+        url_dictionary: Optional[UrlDictionary] = None,
+    ):
+        self.db = db
+        self.batch_size = batch_size
+        self.row_cache = row_cache
+        self.metrics = metrics
+        self.url_dictionary = url_dictionary
+        self.rows = mapping_compiler.empty_rows()
+        self.num_gabs = 0
+
+    def add(self, rows: Dict[str, list], num_gabs: int = 1):
+        """Adds the rows for each table mapped from num_gabs gabs"""
+        for table, table_rows in rows.items():
+            self.rows[table].extend(table_rows)
+
+        self.num_gabs += num_gabs
+        if self.num_gabs >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        for table in data_mapping.data_table_names:
+            rows = self.rows[table]
+            if self.row_cache is not None:
+                rows = self.row_cache.filter_unwritten(table, rows)
+            if rows:
+                started = time.perf_counter()
+                if self.url_dictionary is not None and table in encoded_columns:
+                    self.db.executemany(
+                        encoded_insert_sql[table],
+                        self.url_dictionary.encode_rows(table, rows),
+                    )
+                else:
+                    self.db.executemany(mapping_compiler.insert_sql[table], rows)
+                if self.metrics is not None:
+                    self.metrics.add_table_insert(
+                        table, time.perf_counter() - started, len(rows)
+                    )
+
+            if rows and table in data_mapping.unique_table_names:
+                started = time.perf_counter()
+                self.db.executemany(mapping_compiler.unique_insert_sql[table], rows)
+                if self.metrics is not None:
+                    self.metrics.add_table_insert(
+                        data_mapping.unique_table_names[table],
+                        time.perf_counter() - started,
+                        len(rows),
+                    )
+
+            self.rows[table] = []
+
+        self.num_gabs = 0
+
+
+def _url_dictionary(db_connection: sqlite3.Connection) -> Optional[UrlDictionary]:
+    """A new UrlDictionary if the database uses the url_dictionary storage mode"""
+    if "url_dictionary" in database_storage_modes(db_connection):
+        return UrlDictionary(db_connection.cursor())
+
+    return None
+
+
+class InsertedFile(NamedTuple):
+    """A file recorded in the _inserted_files table"""
+
+    id: int
+    num_gabs_inserted: Optional[int]  # None if the file hasn't finished loading
+    num_parsing_failures: Optional[int]
+    lines_read: Optional[int]
+    bytes_read: Optional[int]
+    num_mapping_failures: Optional[int]
+
+
+def find_inserted_file(
+    db_connection: sqlite3.Connection, file_fingerprint: Optional[Tuple[int, str]]
+) -> Optional[InsertedFile]:
+    """
+    Finds the most recent load of a file with the given fingerprint (see
+    input_files.fingerprint), whether or not it finished loading. Returns None if
+    there isn't one, or if the fingerprint is None.
+    """
+    if file_fingerprint is None:
+        return None
+
+    file_size, file_hash = file_fingerprint
+    db = db_connection.cursor()
+    db.execute(
+        """
+        select
+            id, num_gabs_inserted, num_parsing_failures, lines_read, bytes_read,
+            num_mapping_failures
+        from _inserted_files
+        where file_size = :file_size and fingerprint = :fingerprint
+        order by id desc
+        limit 1
+        """,
+        {"file_size": file_size, "fingerprint": file_hash},
+    )
+    row = db.fetchone()
 
-        for table, mappings in gab_mappings.items():
-            if len(mappings) == 0 or len(mappings[0]) == 0:
-                # such a hack - why is group coming up as [[]]?
-                continue
-            elif not isinstance(mappings, list):
-                db.execute(data_mapping.insert_sql[table], mappings)
-            else:
-                db.executemany(data_mapping.insert_sql[table], mappings)
+    return InsertedFile(*row) if row is not None else None
+
+
+def _checkpoint(
+    db_connection: sqlite3.Connection,
+    file_id: int,
+    lines_read: int,
+    bytes_read: Optional[int],
+    num_parsing_failures: int,
+    num_mapping_failures: int,
+):
+    """
+    Records how far through the file loading has got, and commits everything loaded so
+    far, so that an interrupted load can carry on from here.
+    """
+    db_connection.execute(
+        """
+        update _inserted_files
+        set lines_read = :lines_read,
+            bytes_read = :bytes_read,
+            num_parsing_failures = :num_parsing_failures,
+            num_mapping_failures = :num_mapping_failures
+        where id = :file_id
+        """,
+        {
+            "file_id": file_id,
+            "lines_read": lines_read,
+            "bytes_read": bytes_read,
+            "num_parsing_failures": num_parsing_failures,
+            "num_mapping_failures": num_mapping_failures,
+        },
+    )
+    db_connection.commit()
+
+
+def load_file_to_sqlite(
+    json_fh: Union[TextIO, BinaryIO],
+    db_connection,
+    workers: int = 1,
+    chunk_size: int = 1000,
+    batch_size: int = 5000,
+    json_decoder: str = "auto",
+    row_cache: Optional[WrittenRowCache] = None,
+    checkpoint_every: Optional[int] = 100_000,
+    checkpoint_every_bytes: Optional[int] = None,
+    range_size: int = 1 << 22,
+    skip_loaded: bool = True,
+    metrics: Optional[IngestMetrics] = None,
+    progress: bool = False,
+    clean_content: bool = False,
+    quarantine: Optional[Quarantine] = None,
+) -> Tuple[int, int]:
+    """
+    Parse and load Garc output json file into database using data mappings
+
+    Garc output is one json object per line. No [] wrapping the whole, no comma between
+    objects.
+
+    Note: the "fh" in "json_fh" is short for "file handler"
+
+    If json_fh is opened in binary mode, it may be gzip, bz2, xz or zstd compressed, and
+    is decompressed as it is read (see input_files). Lines are parsed with the named
+    json_decoder, which by default is the fastest one installed.
+
+    If workers is greater than 1, the json parsing and data mapping is spread across
+    that many worker processes, each handling chunk_size lines at a time. The database
+    is only ever written to from this process, and in the same order as the input
+    file, so the result is the same as loading with a single worker. If the file is an
+    uncompressed file on disk, it is instead split into byte ranges of about range_size
+    bytes, and each worker memory-maps the file and reads its own ranges.
+
+    Mapped rows are inserted batch_size gabs at a time (see InsertBuffer). Pass the same
+    row_cache when loading several files to skip reference rows (emoji, cards, groups
+    etc) already written by earlier files; otherwise a new cache is used for this file.
+
+    Files opened in binary mode from disk are recorded with a fingerprint of their
+    contents (see input_files.fingerprint). If skip_loaded is True, a file which has
+    already been completely loaded into the database is skipped. Every checkpoint_every
+    lines, or every checkpoint_every_bytes bytes of (decompressed) input if that is
+    given, the progress through the file is recorded and committed, and a file whose
+    load was interrupted carries on from its last checkpoint rather than starting
+    again. Checkpoints are made at the end of the first mapped chunk past each interval,
+    so each transaction holds at most about one interval and one chunk of the file.
+    Until a file has finished loading, its num_gabs_inserted is null. Files without a
+    fingerprint (opened in text mode, or not seekable like stdin) can't be resumed, so
+    are only committed once they have been completely loaded.
+
+    If metrics are given, the time taken by each stage of loading, and the lines, bytes
+    and gabs loaded, are added to them (see metrics.IngestMetrics). If progress is True,
+    progress through the file is shown on stderr.
+
+    If clean_content is True, the plain text of each gab's content is stored with and
+    without URLs, and the URLs in it are stored in the gab_url table (see
+    content_cleaning). Otherwise those are left empty.
+
+    Lines which aren't valid JSON, or which can't be mapped (e.g. because a field is
+    missing), are skipped and counted separately in _inserted_files. If a quarantine is
+    given, they are also written to it along with their line numbers and errors (see
+    quarantine).
+
+    Returns (number of gabs inserted, number of lines which failed to parse or map). The
+    total number of posts may be greater than the number of lines in the json file, as
+    embedded gabs are also counted. Skipped files return (0, 0).
+    """
+    db = db_connection.cursor()
+    # Filename string to use for logging, output, metadata etc
+    friendly_filename = format_filename(json_fh.name, shorten=True)
+
+    file_fingerprint = input_files.fingerprint(json_fh)
+    previous_load = find_inserted_file(db_connection, file_fingerprint)
+
+    if previous_load is not None and previous_load.num_gabs_inserted is not None:
+        if skip_loaded:
+            logger.info(
+                f"Skipping file {friendly_filename}, which has already been loaded "
+                f"(file id {previous_load.id})"
+            )
+            return 0, 0
+        previous_load = None
+
+    if previous_load is not None:
+        # Carry on from the last checkpoint of an interrupted load
+        file_id = previous_load.id
+        lines_read = previous_load.lines_read or 0
+        bytes_read = previous_load.bytes_read or 0
+        num_failed_parsing = previous_load.num_parsing_failures or 0
+        num_failed_mapping = previous_load.num_mapping_failures or 0
+        logger.info(
+            f"Resuming loading file {friendly_filename} from line {lines_read + 1}"
+        )
+    else:
+        file_size, file_hash = file_fingerprint or (None, None)
+
+        # File metadata
+        db.execute(
+            """
+            insert into _inserted_files (
+                filename, inserted_by_version, file_size, fingerprint
+            ) values (
+                :filename, :inserted_by_version, :file_size, :fingerprint
+            )
+        """,
+            {
+                "filename": friendly_filename,
+                "inserted_by_version": "superalpha",
+                "file_size": file_size,
+                "fingerprint": file_hash,
+            },
+        )
+
+        file_id = db.lastrowid
+        lines_read = 0
+        bytes_read = 0
+        num_failed_parsing = 0
+        num_failed_mapping = 0
+
+    # Byte offsets can only be used to resume binary input
+    is_binary = file_fingerprint is not None
+
+    # A file without a fingerprint can't be resumed, so a checkpoint would only commit
+    # rows that loading the file again adds a second time
+    if file_fingerprint is None and (checkpoint_every or checkpoint_every_bytes):
+        logger.info(
+            f"{friendly_filename} can't be resumed if interrupted, so will only be "
+            "committed once it has been completely loaded"
+        )
+        checkpoint_every = None
+        checkpoint_every_bytes = None
+
+    if row_cache is None:
+        row_cache = WrittenRowCache()
+    insert_buffer = InsertBuffer(
+        db, batch_size, row_cache, metrics, _url_dictionary(db_connection)
+    )
+    lines_since_checkpoint = 0
+    bytes_since_checkpoint = 0
+
+    if metrics is None:
+        # Timings are still gathered, but thrown away
+        metrics = IngestMetrics()
+    metrics.files += 1
+
+    # Progress is measured by how far through the file (as stored) has been read
+    progress_reporter = None
+    if progress:
+        progress_reporter = ProgressReporter(
+            friendly_filename, file_fingerprint[0] if is_binary else None
+        )
+
+    # Uncompressed files on disk are split into byte ranges for the workers to read
+    mappable_path = input_files.mappable_path(json_fh) if workers > 1 else None
+
+    try:
+        with _open_mapped_chunks(
+            json_fh,
+            file_id,
+            json_decoder,
+            bytes_read,
+            workers,
+            chunk_size,
+            range_size,
+            mappable_path,
+            metrics,
+            clean_content,
+        ) as mapped_chunks:
+            for mapped_chunk in mapped_chunks:
+                num_failed_parsing += mapped_chunk.num_failed
+                num_failed_mapping += mapped_chunk.num_mapping_failed
+                if quarantine is not None:
+                    for failed_line in mapped_chunk.failed_lines:
+                        quarantine.add(
+                            friendly_filename,
+                            lines_read + failed_line.index + 1,
+                            failed_line,
+                        )
+                insert_buffer.add(mapped_chunk.rows, mapped_chunk.num_mapped)
+
+                lines_read += mapped_chunk.num_lines
+                bytes_read += mapped_chunk.num_bytes
+                lines_since_checkpoint += mapped_chunk.num_lines
+                bytes_since_checkpoint += mapped_chunk.num_bytes
+                _add_chunk_metrics(metrics, mapped_chunk)
+
+                checkpoint_due = (
+                    checkpoint_every and lines_since_checkpoint >= checkpoint_every
+                ) or (
+                    checkpoint_every_bytes
+                    and bytes_since_checkpoint >= checkpoint_every_bytes
+                )
+                if checkpoint_due:
+                    insert_buffer.flush()
+                    with metrics.time_stage("commit"):
+                        _checkpoint(
+                            db_connection,
+                            file_id,
+                            lines_read,
+                            bytes_read if is_binary else None,
+                            num_failed_parsing,
+                            num_failed_mapping,
+                        )
+                    lines_since_checkpoint = 0
+                    bytes_since_checkpoint = 0
+
+                if progress_reporter is not None and is_binary:
+                    position = bytes_read if mappable_path else json_fh.tell()
+                    progress_reporter.update(lines_read, position)
+                elif progress_reporter is not None:
+                    progress_reporter.update(lines_read)
+
+        insert_buffer.flush()
+    except Exception:
+        # The rows written so far won't be committed, so the cache is no longer right
+        row_cache.clear()
+        raise
 
     # How many gabs were successfully inserted from this file
     db.execute("select count(*) from gab where _file_id = ?", [file_id])
@@ -84,33 +970,48 @@ def load_file_to_sqlite(json_fh: TextIO, db_connection) -> Tuple[int, int]:
         update _inserted_files
         set num_gabs_inserted = :num_gabs_inserted,
             num_parsing_failures = :num_parsing_failures,
+            num_mapping_failures = :num_mapping_failures,
+            lines_read = :lines_read,
+            bytes_read = :bytes_read,
             inserted_at = :now
         where id = :file_id
     """,
         {
             "file_id": file_id,
             "num_gabs_inserted": num_gabs_inserted,
-            "num_parsing_failures": len(failed_parsing),
+            "num_parsing_failures": num_failed_parsing,
+            "num_mapping_failures": num_failed_mapping,
+            "lines_read": lines_read,
+            "bytes_read": bytes_read if is_binary else None,
             "now": dt.datetime.utcnow(),
         },
     )
 
     # Done with this file!
-    db_connection.commit()
+    with metrics.time_stage("commit"):
+        db_connection.commit()
 
-    if len(failed_parsing) > 0:
+    if progress_reporter is not None:
+        progress_reporter.update(
+            lines_read, file_fingerprint[0] if is_binary else None, final=True
+        )
+
+    num_failed = num_failed_parsing + num_failed_mapping
+    if num_failed > 0:
         logger.warning(
-            f"Failed to parse {len(failed_parsing)} lines of filename. These lines have"
-            f" been skipped. See debug logs for error information."
+            f"Failed to parse {num_failed_parsing} lines and to map "
+            f"{num_failed_mapping} lines of {friendly_filename}. These lines have been "
+            "skipped. See the quarantine file, if there is one, or debug logs for "
+            "error information."
         )
 
     logger.info(
         f"Finished loading file {friendly_filename}: {num_gabs_inserted} gabs "
-        f"successfully added; {len(failed_parsing)} gabs skipped due to parsing "
-        f"errors"
+        f"successfully added; {num_failed_parsing} gabs skipped due to parsing "
+        f"errors; {num_failed_mapping} gabs skipped due to mapping errors"
     )
 
-    return num_gabs_inserted, len(failed_parsing)
+    return num_gabs_inserted, num_failed
 
 
 def fetch_db_contents(db_connection, since: Optional[dt.datetime] = None):
@@ -120,7 +1021,7 @@ def fetch_db_contents(db_connection, since: Optional[dt.datetime] = None):
     after that time. All times are in UTC.
 
     Returns a list of inserted files: (filename, number of posts inserted, number of
-    posts which failed to parse)
+    posts which failed to parse, number of posts which failed to map)
     """
     db = db_connection.cursor()
 
@@ -128,7 +1029,8 @@ def fetch_db_contents(db_connection, since: Optional[dt.datetime] = None):
 
     db.execute(
         """
-            select filename, num_gabs_inserted, num_parsing_failures
+            select
+                filename, num_gabs_inserted, num_parsing_failures, num_mapping_failures
             from _inserted_files
         """
         + date_clause,
@@ -138,20 +1040,108 @@ def fetch_db_contents(db_connection, since: Optional[dt.datetime] = None):
     return db.fetchall()
 
 
+def schema_version(db_connection: sqlite3.Connection) -> str:
+    """The schema version of an existing database"""
+    db = db_connection.cursor()
+
+    db.execute(
+        """
+        select metadata_value from _gab_tidy_data
+        where metadata_key = 'schema_version'
+        """
+    )
+
+    return db.fetchone()[0]
+
+
 def schema_is_current(db_connection: sqlite3.Connection) -> bool:
     """
     Given an existing database, checks to see whether the schema version in the existing
     database matches the schema version for this version of Gab Tidy Data.
     """
+    return schema_version(db_connection) == data_mapping.schema_version
+
+
+# Schema versions upgrade_schema can bring up to date: the schema from before the one
+# row per id tables, which had group by views instead
+upgradable_schema_versions = ["2021-08-30"]
+
+
+def schema_is_upgradable(db_connection: sqlite3.Connection) -> bool:
+    return schema_version(db_connection) in upgradable_schema_versions
+
+
+def upgrade_schema(db_connection: sqlite3.Connection):
+    """
+    Brings a database with one of the upgradable_schema_versions up to date: the group
+    by views are replaced by the one row per id tables, which are then filled from the
+    data tables (see rebuild_unique_tables), and any other tables and columns added
+    since are added, empty. Columns are added to the end of existing tables, so may be
+    in a different order from a new database.
+
+    The schema version is only updated once everything else has been done, so an
+    interrupted upgrade can be run again. Raises ValueError if the database's schema
+    can't be upgraded.
+    """
+    if not schema_is_upgradable(db_connection):
+        raise ValueError(
+            "Can't upgrade a database with schema version "
+            + schema_version(db_connection)
+        )
+
+    # A new database with the current schema, to compare against
+    with closing(sqlite3.connect(":memory:")) as current_connection:
+        initialise_empty_database(current_connection)
+        current_tables = current_connection.execute(
+            """
+            select name, sql from sqlite_master
+            where type = 'table' and name not like 'sqlite_%'
+            """
+        ).fetchall()
+        current_columns = {
+            table: [
+                (name, column_type)
+                for _, name, column_type, _, _, _ in current_connection.execute(
+                    f"pragma table_info({table})"
+                )
+            ]
+            for table, _ in current_tables
+        }
+        current_indexes = current_connection.execute(
+            "select name, sql from sqlite_master where type = 'index' and sql not null"
+        ).fetchall()
+
     db = db_connection.cursor()
+    existing = dict(db.execute("select name, type from sqlite_master").fetchall())
+
+    for table, sql in current_tables:
+        if existing.get(table) == "view":
+            logger.info(f"Replacing the {table} view with a table")
+            db.execute(f"drop view {table}")
+            db.execute(sql)
+        elif table not in existing:
+            logger.info(f"Adding the {table} table")
+            db.execute(sql)
+        else:
+            existing_columns = {
+                name for _, name, *_ in db.execute(f"pragma table_xinfo({table})")
+            }
+            for name, column_type in current_columns[table]:
+                if name not in existing_columns:
+                    logger.info(f"Adding the {name} column to {table}")
+                    db.execute(f"alter table {table} add column {name} {column_type}")
+
+    for index, sql in current_indexes:
+        if index not in existing:
+            db.execute(sql)
+
+    rebuild_unique_tables(db_connection)
 
     db.execute(
         """
-        select metadata_value from _gab_tidy_data
+        update _gab_tidy_data set metadata_value = ?
         where metadata_key = 'schema_version'
-        """
+        """,
+        [data_mapping.schema_version],
     )
-
-    db_schema_version = db.fetchone()[0]
-
-    return db_schema_version == data_mapping.schema_version
+    db_connection.commit()
@@ -0,0 +1,400 @@
+"""
+Input files
+
+Garc output files are often archived compressed. This file contains the functions for
+reading input files for loading, whether or not they are compressed, so that they don't
+need to be decompressed to disk first.
+
+Compression is detected from the first few bytes of the file (its "magic bytes") rather
+than from the filename, and the file is decompressed as it is read. Decompression is
+done in a background thread, so it can happen at the same time as the JSON parsing.
+
+Lines are read as bytes and handed straight to the JSON decoder, without decoding them
+to str first. The JSON decoder is pluggable: the standard library json module is always
+available, and orjson or msgspec are used if they are installed.
+
+Uncompressed files on disk can also be split into byte ranges of whole lines, so that
+parallel workers can each memory-map and read their own part of the file, rather than
+having every line read and sent to them by the main process.
+"""
+
+import bz2
+import gzip
+import hashlib
+import io
+import json
+import lzma
+import mmap
+import os
+import queue
+import stat
+import threading
+from contextlib import contextmanager
+from logging import getLogger
+from typing import Any, BinaryIO, Callable, Iterable, Iterator, List, Optional, TextIO
+from typing import Tuple, Type, Union
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - depends on the environment
+    zstandard = None
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:  # pragma: no cover - depends on the environment
+    msgspec = None
+
+
+logger = getLogger(__name__)
+
+
+# Magic bytes at the start of each supported compressed file format
+compression_magic_bytes = {
+    "gzip": b"\x1f\x8b",
+    "bz2": b"BZh",
+    "xz": b"\xfd7zXZ\x00",
+    "zstd": b"\x28\xb5\x2f\xfd",
+}
+_magic_length = max(len(magic) for magic in compression_magic_bytes.values())
+
+
+def _peek(binary_fh: BinaryIO, size: int) -> bytes:
+    """
+    Returns the first size bytes of the file without consuming them. Assumes nothing
+    has been read from the file yet.
+    """
+    if hasattr(binary_fh, "peek"):
+        return binary_fh.peek(size)[:size]
+
+    start = binary_fh.read(size)
+    binary_fh.seek(-len(start), io.SEEK_CUR)
+    return start
+
+
+def detect_compression(binary_fh: BinaryIO) -> Optional[str]:
+    """
+    Returns the name of the compression format of the file (a key of
+    compression_magic_bytes), or None if the file isn't compressed.
+    """
+    start = _peek(binary_fh, _magic_length)
+
+    for compression, magic in compression_magic_bytes.items():
+        if start.startswith(magic):
+            return compression
+
+    return None
+
+
+def _decompressing_reader(binary_fh: BinaryIO, compression: str) -> BinaryIO:
+    """
+    Wraps binary_fh in a reader for the given compression format. Closing the returned
+    reader does not close binary_fh.
+    """
+    if compression == "gzip":
+        return gzip.GzipFile(fileobj=binary_fh, mode="rb")
+    elif compression == "bz2":
+        return bz2.BZ2File(binary_fh, mode="rb")
+    elif compression == "xz":
+        return lzma.LZMAFile(binary_fh, mode="rb")
+    elif compression == "zstd":
+        if zstandard is None:
+            raise RuntimeError(
+                "Reading zstd compressed files requires the zstandard package. You "
+                "can install it with: python -m pip install zstandard"
+            )
+        return zstandard.ZstdDecompressor().stream_reader(binary_fh, closefd=False)
+    else:
+        raise ValueError(f"Unknown compression format {compression}")
+
+
+class BackgroundReader(io.RawIOBase):
+    """
+    Reads a binary stream in a background thread, keeping up to max_chunks chunks of
+    read_size bytes ready to be read.
+
+    The decompressors all release the GIL while decompressing, so reading through this
+    lets decompression run at the same time as the JSON parsing in the main thread.
+    """
+
+    def __init__(self, source: BinaryIO, read_size: int = 1 << 20, max_chunks: int = 8):
+        super().__init__()
+        self._source = source
+        self._read_size = read_size
+        self._chunks = queue.Queue(maxsize=max_chunks)
+        self._current = memoryview(b"")
+        self._finished = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._read_ahead, daemon=True)
+        self._thread.start()
+
+    def _read_ahead(self):
+        try:
+            while not self._stop.is_set():
+                chunk = self._source.read(self._read_size)
+                self._put(chunk)
+                if not chunk:
+                    break
+        except Exception as e:
+            # Raised again in the main thread, by readinto
+            self._put(e)
+
+    def _put(self, item):
+        # Don't block forever if the reader has been closed part way through
+        while not self._stop.is_set():
+            try:
+                self._chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if not self._current:
+            if self._finished:
+                return 0
+
+            chunk = self._chunks.get()
+            if isinstance(chunk, Exception):
+                self._finished = True
+                raise chunk
+            elif not chunk:
+                self._finished = True
+                return 0
+
+            self._current = memoryview(chunk)
+
+        size = min(len(buffer), len(self._current))
+        buffer[:size] = self._current[:size]
+        self._current = self._current[size:]
+        return size
+
+    def close(self):
+        if not self.closed:
+            self._stop.set()
+            self._thread.join()
+            self._source.close()
+        super().close()
+
+
+@contextmanager
+def open_binary_input(binary_fh: BinaryIO) -> Iterator[BinaryIO]:
+    """
+    Context manager giving a binary stream of the decompressed contents of binary_fh.
+    Uncompressed files are returned as they are. binary_fh itself is not closed.
+    """
+    compression = detect_compression(binary_fh)
+
+    if compression is None:
+        yield binary_fh
+        return
+
+    logger.debug(f"Reading {compression} compressed file")
+    reader = BackgroundReader(_decompressing_reader(binary_fh, compression))
+    try:
+        yield io.BufferedReader(reader)
+    finally:
+        reader.close()
+
+
+def iter_lines(binary_fh: BinaryIO, read_size: int = 1 << 20) -> Iterator[bytes]:
+    """
+    Yields the lines of a binary stream as bytes, with their trailing newline (apart
+    from a final line which doesn't have one). The stream is read read_size bytes at a
+    time, and each chunk is split on newlines (by BytesIO.readlines, which is quicker
+    than bytes.split and keeps the newlines).
+
+    As when iterating over a file, there is no empty line yielded after the final
+    newline in the file.
+    """
+    remainder = b""
+
+    while True:
+        chunk = binary_fh.read(read_size)
+        if not chunk:
+            break
+
+        lines = io.BytesIO(chunk).readlines()
+        if remainder:
+            lines[0] = remainder + lines[0]
+        remainder = b"" if lines[-1].endswith(b"\n") else lines.pop()
+
+        yield from lines
+
+    if remainder:
+        yield remainder
+
+
+def _skip_bytes(binary_fh: BinaryIO, num_bytes: int, read_size: int = 1 << 20):
+    """Moves num_bytes forward in the stream, by reading if it can't seek"""
+    if binary_fh.seekable():
+        binary_fh.seek(num_bytes, io.SEEK_CUR)
+        return
+
+    while num_bytes > 0:
+        skipped = len(binary_fh.read(min(read_size, num_bytes)))
+        if not skipped:
+            break
+        num_bytes -= skipped
+
+
+@contextmanager
+def open_input_lines(
+    json_fh: Union[TextIO, BinaryIO], start: int = 0
+) -> Iterator[Iterable[Union[bytes, str]]]:
+    """
+    Context manager giving the lines of an input file, decompressing it first if needed.
+
+    Lines of binary handles are given as bytes (see iter_lines), starting from byte
+    start of the decompressed contents, which should be the start of a line. Handles
+    already opened in text mode are iterated over as they are, and are not checked for
+    compression. The input handle itself is not closed.
+    """
+    if isinstance(json_fh, io.TextIOBase):
+        yield json_fh
+        return
+
+    with open_binary_input(json_fh) as binary_fh:
+        if start:
+            _skip_bytes(binary_fh, start)
+        yield iter_lines(binary_fh)
+
+
+def mappable_path(json_fh: Union[TextIO, BinaryIO]) -> Optional[str]:
+    """
+    Returns the path of the file that json_fh reads, if it is an uncompressed regular
+    file opened in binary mode which can be memory-mapped. Otherwise returns None.
+    """
+    if isinstance(json_fh, io.TextIOBase) or not isinstance(
+        getattr(json_fh, "name", None), str
+    ):
+        return None
+
+    try:
+        file_stat = os.fstat(json_fh.fileno())
+        path_stat = os.stat(json_fh.name)
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return None
+
+    if (
+        not stat.S_ISREG(file_stat.st_mode)
+        or (file_stat.st_dev, file_stat.st_ino) != (path_stat.st_dev, path_stat.st_ino)
+        or detect_compression(json_fh) is not None
+    ):
+        return None
+
+    return json_fh.name
+
+
+def split_line_ranges(
+    path: str, start: int = 0, range_size: int = 1 << 22
+) -> Iterator[Tuple[int, int]]:
+    """
+    Splits the file at path, from byte start onwards, into (start, end) byte ranges of
+    at least range_size bytes (apart from the last range). Each range ends just after a
+    newline, or at the end of the file, so it holds whole lines.
+    """
+    with open(path, "rb") as binary_fh:
+        size = os.fstat(binary_fh.fileno()).st_size
+        if start >= size:
+            return
+
+        with mmap.mmap(binary_fh.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            while start < size:
+                end = mapped.find(b"\n", min(start + range_size, size) - 1)
+                end = size if end == -1 else end + 1
+                yield start, end
+                start = end
+
+
+def read_line_range(path: str, start: int, end: int) -> List[bytes]:
+    """
+    Memory-maps the file at path, and returns the lines in the byte range (see
+    split_line_ranges) with their trailing newlines, as iter_lines.
+    """
+    if start >= end:
+        return []
+
+    with open(path, "rb") as binary_fh:
+        with mmap.mmap(binary_fh.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return io.BytesIO(mapped[start:end]).readlines()
+
+
+def fingerprint(
+    json_fh: Union[TextIO, BinaryIO], sample_size: int = 1 << 20
+) -> Optional[Tuple[int, str]]:
+    """
+    Identifies the contents of an input file, without reading the whole file.
+
+    Returns (size of file in bytes, hex digest of a hash of the size plus the first,
+    middle and last sample_size bytes of the file), or None if the file can't be
+    fingerprinted because it is opened in text mode or isn't seekable (e.g. stdin).
+    Compressed files are fingerprinted as they are stored, not decompressed.
+    """
+    if isinstance(json_fh, io.TextIOBase) or not json_fh.seekable():
+        return None
+
+    position = json_fh.tell()
+    size = json_fh.seek(0, io.SEEK_END)
+
+    file_hash = hashlib.blake2b(str(size).encode(), digest_size=16)
+    middle = max(0, (size - sample_size) // 2)
+    end = max(0, size - sample_size)
+    for offset in sorted({0, middle, end}):
+        json_fh.seek(offset)
+        file_hash.update(json_fh.read(sample_size))
+
+    json_fh.seek(position)
+
+    return size, file_hash.hexdigest()
+
+
+# ---------------------
+# --- JSON decoders ---
+# ---------------------
+
+# Preferred order of JSON decoders when using "auto". All of these accept either bytes
+# or str. The standard library json module goes last, as it is always available.
+json_decoder_names = ["orjson", "msgspec", "json"]
+
+
+def installed_json_decoders() -> List[str]:
+    installed = {"orjson": orjson, "msgspec": msgspec, "json": json}
+    return [name for name in json_decoder_names if installed[name] is not None]
+
+
+def get_json_decoder(
+    name: str = "auto",
+) -> Tuple[Callable[[Union[bytes, str]], Any], Tuple[Type[Exception], ...]]:
+    """
+    Returns (decode function, exceptions raised by the decode function for invalid
+    input) for the named JSON decoder, or for the fastest installed decoder if name is
+    "auto".
+    """
+    if name == "auto":
+        name = installed_json_decoders()[0]
+
+    if name == "json":
+        return json.loads, (json.JSONDecodeError, UnicodeDecodeError)
+    elif name == "orjson":
+        if orjson is None:
+            raise RuntimeError(
+                "The orjson JSON decoder is not installed. You can install it with: "
+                "python -m pip install orjson"
+            )
+        return orjson.loads, (orjson.JSONDecodeError,)
+    elif name == "msgspec":
+        if msgspec is None:
+            raise RuntimeError(
+                "The msgspec JSON decoder is not installed. You can install it with: "
+                "python -m pip install msgspec"
+            )
+        return msgspec.json.decode, (msgspec.DecodeError, UnicodeDecodeError)
+    else:
+        raise ValueError(f"Unknown JSON decoder {name}")
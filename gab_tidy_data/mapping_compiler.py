@@ -0,0 +1,293 @@
+"""
+Compiled data mappings
+
+The mapping functions in gab_data_mapping build a new dictionary for every row, and
+several dictionaries of lists for every gab, which is a lot of work per post when
+loading millions of posts. This file compiles the declarative column mappings in
+gab_data_mapping (column_mappings) into:
+
+- insert_sql: the insert statement for each table, using positional parameters
+- unique_insert_sql: the statement keeping each one row per id table up to date
+- extractors: a generated function for each table, which returns a row as a tuple in
+  the same order as the parameters of that table's insert statement
+
+map_gab_into then uses the extractors to map a gab (and any gabs embedded in it)
+straight into lists of rows for each table, without any intermediate dictionaries.
+
+The dictionary-based functions in gab_data_mapping remain the reference implementation,
+and the tests check that both give identical rows.
+"""
+
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import gab_tidy_data.gab_data_mapping as data_mapping
+from gab_tidy_data.content_cleaning import clean_content as clean_gab_content
+
+# Finds the conflict clause in the reference insert statements, e.g. "or replace"
+_conflict_pattern = re.compile(r"insert\s+or\s+(\w+)\s+into", re.IGNORECASE)
+
+
+def conflict_resolution(table: str) -> str:
+    """
+    The primary key conflict handling ("replace" or "ignore") of the reference insert
+    statement for the table in data_mapping.insert_sql.
+    """
+    return _conflict_pattern.search(data_mapping.insert_sql[table]).group(1).lower()
+
+
+def compile_insert_sql(
+    table: str, columns: List[str], into: Optional[str] = None
+) -> str:
+    """
+    Builds a positional-parameter insert statement for the given columns, using the same
+    primary key conflict handling as the reference statement in data_mapping.insert_sql.
+    The statement inserts into the table, or into the table named by into if given.
+    """
+    return (
+        f"insert or {conflict_resolution(table)} into {into or table} "
+        f"({', '.join(columns)}) "
+        f"values ({', '.join('?' for _ in columns)})"
+    )
+
+
+def unique_upsert_clause(table: str, columns: List[str]) -> str:
+    """
+    Conflict clause for inserting rows of a data table into its one row per id table
+    (see data_mapping.unique_table_names), keeping the row with the highest _file_id,
+    or the last row inserted for the same _file_id.
+    """
+    unique_table = data_mapping.unique_table_names[table]
+    updates = ", ".join(
+        f"{column} = excluded.{column}" for column in columns if column != "id"
+    )
+    return (
+        f"on conflict (id) do update set {updates} "
+        f"where excluded._file_id >= {unique_table}._file_id"
+    )
+
+
+def compile_unique_insert_sql(table: str, columns: List[str]) -> str:
+    """
+    Builds a positional-parameter statement inserting a row of the data table into its
+    one row per id table.
+    """
+    return (
+        f"insert into {data_mapping.unique_table_names[table]} ({', '.join(columns)}) "
+        f"values ({', '.join('?' for _ in columns)}) "
+        + unique_upsert_clause(table, columns)
+    )
+
+
+def _source_expression(source: Any) -> str:
+    """Python expression giving the value of a column source from the JSON object o"""
+    if isinstance(source, data_mapping.Context):
+        return source.name
+    elif isinstance(source, str):
+        return f"o[{source!r}]"
+
+    # Path into nested objects, giving None if any object along the way is None
+    expression = "o"
+    for key in source:
+        expression = f"(None if {expression} is None else {expression}[{key!r}])"
+
+    return expression
+
+
+def compile_extractor(
+    table: str, column_sources: List[Tuple[str, Any]]
+) -> Callable[..., tuple]:
+    """
+    Generates a function which takes a JSON object (plus any context values, as keyword
+    arguments) and returns the row for the table as a tuple.
+    """
+    parameters = ", ".join(f"{name}=None" for name in data_mapping.context_names)
+    values = "".join(
+        f"\n        {_source_expression(source)},  # {column}"
+        for column, source in column_sources
+    )
+    source_code = (
+        f"def extract_{table}(o, {parameters}):\n    return ({values}\n    )\n"
+    )
+
+    namespace = {}
+    exec(compile(source_code, f"<{table} extractor>", "exec"), namespace)
+    return namespace[f"extract_{table}"]
+
+
+columns = {
+    table: [column for column, _ in column_sources]
+    for table, column_sources in data_mapping.column_mappings.items()
+}
+insert_sql = {
+    table: compile_insert_sql(table, table_columns)
+    for table, table_columns in columns.items()
+}
+unique_insert_sql = {
+    table: compile_unique_insert_sql(table, columns[table])
+    for table in data_mapping.unique_table_names
+}
+extractors = {
+    table: compile_extractor(table, column_sources)
+    for table, column_sources in data_mapping.column_mappings.items()
+}
+
+
+def empty_rows() -> Dict[str, list]:
+    """Empty lists of rows for each table, in foreign key order"""
+    return {table: [] for table in data_mapping.data_table_names}
+
+
+def map_gab_into(
+    rows: Dict[str, list],
+    file_id: int,
+    gab_json: dict,
+    embedded_gab: bool = False,
+    clean_content: bool = False,
+    memo: Optional[data_mapping.MappedGabMemo] = None,
+):
+    """
+    Maps a gab and any gabs embedded in it (quotes and reblogs), appending the rows for
+    each table to the lists in rows (see empty_rows). If clean_content is True, the
+    plain text of the content and the URLs in it are mapped too (see content_cleaning).
+
+    Rows are added in the same order as the reference implementation,
+    data_mapping.map_gab_for_insert: any embedded gabs come before the gab they are
+    embedded in. If a memo is given, the rows of embedded gabs already mapped from the
+    same file are copied from it rather than mapped again, which gives the same rows
+    (see data_mapping.MappedGabMemo).
+    """
+    if memo is None:
+        for gab, embedded in data_mapping.embedded_gabs_first(gab_json):
+            _map_single_gab_into(
+                rows, file_id, gab, embedded_gab or embedded, clean_content
+            )
+        return
+
+    # As data_mapping.embedded_gabs_first, but each embedded gab's rows, and those of
+    # the gabs embedded in it, are added to or copied from the memo. Entries are (gab,
+    # embedded, and once the gabs embedded in it have been added to the stack, the
+    # number of rows in each table before them).
+    stack = [(gab_json, embedded_gab, None)]
+    while stack:
+        gab, embedded, rows_before = stack.pop()
+        if rows_before is not None:
+            _map_single_gab_into(rows, file_id, gab, embedded, clean_content)
+            if gab is not gab_json:
+                memo.add(
+                    gab,
+                    {
+                        table: rows[table][num_rows:]
+                        for table, num_rows in rows_before.items()
+                        if len(rows[table]) > num_rows
+                    },
+                )
+            continue
+
+        if gab is not gab_json:
+            mapped_rows = memo.get(gab)
+            if mapped_rows is not None:
+                for table, table_rows in mapped_rows.items():
+                    rows[table].extend(table_rows)
+                continue
+
+        stack.append((gab, embedded, {table: len(rows[table]) for table in rows}))
+        for field in reversed(data_mapping.embedded_gab_fields):
+            embedded_json = gab[field]
+            if embedded_json is not None:
+                stack.append((embedded_json, True, None))
+
+
+def _map_single_gab_into(
+    rows: Dict[str, list],
+    file_id: int,
+    gab_json: dict,
+    embedded_gab: bool,
+    clean_content: bool,
+):
+    """Maps the gab itself, without any gabs embedded in it"""
+    gab_id = gab_json["id"]
+
+    # Account
+    account_json = gab_json["account"]
+    account_id = account_json["id"]
+    rows["account"].append(extractors["account"](account_json, file_id=file_id))
+
+    extract_field = extractors["account_fields"]
+    for ordering, field_json in enumerate(account_json["fields"], start=1):
+        rows["account_fields"].append(
+            extract_field(
+                field_json, file_id=file_id, parent_id=account_id, ordering=ordering
+            )
+        )
+
+    for emoji_json in account_json["emojis"]:
+        rows["emoji"].append(extractors["emoji"](emoji_json))
+        rows["account_emoji"].append(
+            extractors["account_emoji"](
+                emoji_json, file_id=file_id, parent_id=account_id
+            )
+        )
+
+    # Group
+    group_json = gab_json["group"]
+    if group_json is not None:
+        category_json = group_json["group_category"]
+        if category_json is not None:
+            rows["group_category"].append(extractors["group_category"](category_json))
+
+        rows["gab_group"].append(extractors["gab_group"](group_json, file_id=file_id))
+
+        extract_tag = extractors["group_tag"]
+        for tag in group_json["tags"] or []:
+            rows["group_tag"].append(
+                extract_tag(tag, file_id=file_id, parent_id=group_json["id"])
+            )
+
+    # Media attachments
+    for media_json in gab_json["media_attachments"]:
+        rows["media_attachment"].append(extractors["media_attachment"](media_json))
+        rows["gab_media_attachment"].append(
+            extractors["gab_media_attachment"](media_json, gab_id=gab_id)
+        )
+
+    # Tags
+    extract_tag = extractors["gab_tag"]
+    for tag_json in gab_json["tags"]:
+        rows["gab_tag"].append(extract_tag(tag_json, gab_id=gab_id))
+
+    # Mentions
+    extract_mention = extractors["gab_mention"]
+    for mention_json in gab_json["mentions"] or []:
+        rows["gab_mention"].append(extract_mention(mention_json, gab_id=gab_id))
+
+    # Emoji
+    for emoji_json in gab_json["emojis"]:
+        rows["emoji"].append(extractors["emoji"](emoji_json))
+        rows["gab_emoji"].append(extractors["gab_emoji"](emoji_json, gab_id=gab_id))
+
+    # Card
+    if gab_json["card"] is not None:
+        rows["card"].append(extractors["card"](gab_json["card"]))
+
+    # Content text and URLs
+    if clean_content:
+        content_text, urls, content_text_sans_urls = clean_gab_content(
+            gab_json["content"]
+        )
+        extract_url = extractors["gab_url"]
+        for url in urls:
+            rows["gab_url"].append(extract_url(url, gab_id=gab_id))
+    else:
+        content_text = content_text_sans_urls = None
+
+    # Gab attributes
+    rows["gab"].append(
+        extractors["gab"](
+            gab_json,
+            file_id=file_id,
+            embedded_gab=embedded_gab,
+            content_text=content_text,
+            content_text_sans_urls=content_text_sans_urls,
+        )
+    )
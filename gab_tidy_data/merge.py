@@ -0,0 +1,194 @@
+"""
+Merging databases
+
+Combines Gab Tidy Data databases with the same schema version into one, without going
+back to the original JSON files. The merge happens entirely inside SQLite: the source
+database is attached to the target, and each table is copied across with a single
+"insert ... select", so memory use doesn't depend on the size of the databases.
+
+Files from the source database get new ids in the target's _inserted_files table, and
+every _file_id in the copied rows is rewritten to match, so ids never collide. Rows are
+inserted with the same conflict handling ("or replace"/"or ignore") as when loading
+from JSON, and in the same order, so merging databases in the order their files were
+loaded gives the same result as loading all the files into one database. Databases
+created with different storage modes (see gab_to_sqlite.storage_modes) can be merged,
+as the tables a storage mode replaces are read and written through views.
+"""
+
+import sqlite3
+from contextlib import closing
+from logging import getLogger
+
+import gab_tidy_data.gab_data_mapping as data_mapping
+import gab_tidy_data.gab_to_sqlite as gts
+import gab_tidy_data.mapping_compiler as mapping_compiler
+
+
+logger = getLogger(__name__)
+
+# Schema name the source database is attached as
+source_schema = "merge_source"
+
+
+def merge_database(
+    db_connection: sqlite3.Connection, source_filename: str, skip_loaded: bool = True
+) -> int:
+    """
+    Copies the contents of the database at source_filename into the database of
+    db_connection, remapping file ids. Returns the number of files merged.
+
+    If skip_loaded is True, files which have already been completely loaded into the
+    target database (recognised by their fingerprint, see input_files.fingerprint) are
+    left out, along with their account, group and gab rows and the tags, mentions,
+    media and emoji of their gabs, as they would be if loaded from JSON. Emoji, cards,
+    media attachments and group categories aren't recorded by file, so are always
+    merged.
+
+    Raises ValueError if the source database's schema version is not the current one.
+    """
+    with closing(sqlite3.connect(source_filename)) as source_connection:
+        if not gts.schema_is_current(source_connection):
+            raise ValueError(
+                f"Database {source_filename} uses a different schema version from this "
+                "version of Gab Tidy Data, so can't be merged"
+            )
+
+    # Databases can't be attached inside a transaction
+    db_connection.commit()
+    db_connection.execute(f"attach database ? as {source_schema}", [source_filename])
+
+    try:
+        db = db_connection.cursor()
+        db.execute("select coalesce(max(id), 0) from main._inserted_files")
+        file_id_offset = db.fetchone()[0]
+
+        # The source files to merge
+        db.execute("drop table if exists temp._merge_files")
+        db.execute("create temp table _merge_files (id integer primary key)")
+        db.execute(
+            f"""
+            insert into temp._merge_files
+            select source.id
+            from {source_schema}._inserted_files as source
+            where not :skip_loaded or not exists (
+                select 1
+                from main._inserted_files as target
+                where target.fingerprint = source.fingerprint
+                    and target.file_size = source.file_size
+                    and target.num_gabs_inserted is not null
+            )
+            """,
+            {"skip_loaded": skip_loaded},
+        )
+        db.execute(f"select count(*) from {source_schema}._inserted_files")
+        num_skipped = (
+            db.fetchone()[0]
+            - db.execute("select count(*) from temp._merge_files").fetchone()[0]
+        )
+
+        file_columns = gts.stored_columns(db_connection, "_inserted_files")
+        select_file_columns = [
+            "id + :offset" if column == "id" else column for column in file_columns
+        ]
+        db.execute(
+            f"""
+            insert into main._inserted_files ({", ".join(file_columns)})
+            select {", ".join(select_file_columns)}
+            from {source_schema}._inserted_files
+            where id in temp._merge_files
+            order by id
+            """,
+            {"offset": file_id_offset},
+        )
+        num_files = db.rowcount
+
+        for table in data_mapping.data_table_names:
+            columns = gts.stored_columns(db_connection, table)
+            select_columns = [
+                "_file_id + :offset" if column == "_file_id" else column
+                for column in columns
+            ]
+
+            if not num_skipped:
+                condition = ""
+            elif "_file_id" in columns:
+                condition = "where _file_id in temp._merge_files"
+            elif "gab_id" in columns:
+                condition = f"""
+                    where gab_id in (
+                        select id from {source_schema}.gab
+                        where _file_id in temp._merge_files
+                    )
+                """
+            else:
+                condition = ""
+
+            # Views have no rowid. Those without a _file_id hold rows which are the
+            # same whichever file they came from, so their order doesn't matter.
+            if not gts.is_view(db_connection, table, source_schema):
+                order = "order by rowid"
+            elif "_file_id" in columns:
+                order = "order by _file_id"
+            else:
+                order = ""
+
+            db.execute(
+                f"""
+                insert or {mapping_compiler.conflict_resolution(table)}
+                into main.{table} ({", ".join(columns)})
+                select {", ".join(select_columns)}
+                from {source_schema}.{table}
+                {condition}
+                {order}
+                """,
+                {"offset": file_id_offset},
+            )
+            logger.debug(f"Merged {db.rowcount} {table} rows from {source_filename}")
+
+        # The merged files have the highest file ids, so their rows replace any others
+        for table, unique_table in data_mapping.unique_table_names.items():
+            columns = gts.unique_table_columns(db_connection, unique_table)
+            select_columns = [
+                "_file_id + :offset" if column == "_file_id" else column
+                for column in columns
+            ]
+
+            if num_skipped:
+                if gts.is_view(db_connection, table, source_schema):
+                    order = "_file_id"
+                else:
+                    order = "_file_id, rowid"
+                source = f"""
+                    {source_schema}.{table}
+                    where _file_id in temp._merge_files
+                    order by {order}
+                """
+            else:
+                source = f"{source_schema}.{unique_table} where true"
+
+            db.execute(
+                f"""
+                insert into main.{unique_table} ({", ".join(columns)})
+                select {", ".join(select_columns)}
+                from {source}
+                {mapping_compiler.unique_upsert_clause(table, columns)}
+                """,
+                {"offset": file_id_offset},
+            )
+
+        db.execute("drop table temp._merge_files")
+        db_connection.commit()
+    except Exception:
+        db_connection.rollback()
+        raise
+    finally:
+        db_connection.execute(f"detach database {source_schema}")
+
+    if num_skipped:
+        logger.info(
+            f"Skipped {num_skipped} files from {source_filename} which were already "
+            "loaded"
+        )
+    logger.info(f"Merged {num_files} files from {source_filename}")
+
+    return num_files
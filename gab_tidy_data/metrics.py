@@ -0,0 +1,216 @@
+"""
+Ingest metrics
+
+Records where the time goes when loading files: reading (and decompressing) the input,
+JSON decoding, data mapping, and inserting into each table. Also records overall
+throughput and peak memory use, and can show live progress on stderr.
+
+An IngestMetrics object can be passed to gab_to_sqlite.load_file_to_sqlite, and its
+numbers read back with as_dict, or written out as JSON with write_json.
+"""
+
+import json
+import sys
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, Optional, TextIO, TypeVar
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - not available on Windows
+    resource = None
+
+
+T = TypeVar("T")
+
+
+def peak_memory_bytes() -> Dict[str, Optional[int]]:
+    """
+    Peak resident memory of this process and of its (finished) child processes, such as
+    parsing workers. None where it isn't available on this platform.
+    """
+    if resource is None:
+        return {"self": None, "children": None}
+
+    # ru_maxrss is in kilobytes on Linux, but bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return {
+        "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+        "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale,
+    }
+
+
+class IngestMetrics:
+    """
+    Wall time and counts for each stage of loading, plus overall totals.
+
+    Stages are "read" (reading and decompressing input lines), "decode" (JSON decoding),
+    "map" (data mapping), "insert" (also recorded per table) and "commit". Decode and
+    map times are only recorded separately if profile is True, as timing every line has
+    a small cost; otherwise they are recorded together as "decode_and_map". When loading
+    with several workers, decode and map times are summed across the workers.
+    """
+
+    def __init__(self, profile: bool = False):
+        self.profile = profile
+        self.stage_seconds = Counter()
+        self.stage_counts = Counter()
+        self.table_seconds = Counter()
+        self.table_rows = Counter()
+        self.files = 0
+        self.lines_read = 0
+        self.bytes_read = 0
+        self.gabs_mapped = 0
+        self.parsing_failures = 0
+        self.mapping_failures = 0
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def time_stage(self, stage: str, count: int = 1):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_seconds[stage] += time.perf_counter() - started
+            self.stage_counts[stage] += count
+
+    def timed_iter(self, iterable: Iterable[T], stage: str) -> Iterator[T]:
+        """Yields from iterable, recording the time taken to get each item as stage"""
+        iterator = iter(iterable)
+        while True:
+            with self.time_stage(stage):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def add_stage(self, stage: str, seconds: float, count: int):
+        self.stage_seconds[stage] += seconds
+        self.stage_counts[stage] += count
+
+    def add_table_insert(self, table: str, seconds: float, rows: int):
+        self.table_seconds[table] += seconds
+        self.table_rows[table] += rows
+        self.add_stage("insert", seconds, rows)
+
+    def add(self, other: "IngestMetrics"):
+        """Adds the counts and timings of another load, e.g. from a worker process"""
+        self.stage_seconds.update(other.stage_seconds)
+        self.stage_counts.update(other.stage_counts)
+        self.table_seconds.update(other.table_seconds)
+        self.table_rows.update(other.table_rows)
+        self.files += other.files
+        self.lines_read += other.lines_read
+        self.bytes_read += other.bytes_read
+        self.gabs_mapped += other.gabs_mapped
+        self.parsing_failures += other.parsing_failures
+        self.mapping_failures += other.mapping_failures
+
+    @property
+    def elapsed_seconds(self) -> float:
+        return time.perf_counter() - self._started
+
+    def as_dict(self) -> Dict[str, Any]:
+        elapsed = self.elapsed_seconds
+        return {
+            "elapsed_seconds": elapsed,
+            "files": self.files,
+            "lines_read": self.lines_read,
+            "bytes_read": self.bytes_read,
+            "gabs_mapped": self.gabs_mapped,
+            "parsing_failures": self.parsing_failures,
+            "mapping_failures": self.mapping_failures,
+            "lines_per_second": self.lines_read / elapsed if elapsed else None,
+            "gabs_per_second": self.gabs_mapped / elapsed if elapsed else None,
+            "peak_memory_bytes": peak_memory_bytes(),
+            "stages": {
+                stage: {
+                    "seconds": self.stage_seconds[stage],
+                    "count": self.stage_counts[stage],
+                }
+                for stage in self.stage_seconds
+            },
+            "tables": {
+                table: {
+                    "seconds": self.table_seconds[table],
+                    "rows": self.table_rows[table],
+                }
+                for table in self.table_seconds
+            },
+        }
+
+    def write_json(self, path: str):
+        with open(path, "w", encoding="utf-8") as metrics_fh:
+            json.dump(self.as_dict(), metrics_fh, indent=2)
+
+    def summary(self) -> str:
+        """Human readable summary of where the time went"""
+        metrics = self.as_dict()
+        lines = [
+            f"Loaded {metrics['lines_read']} lines ({metrics['bytes_read']} bytes) in "
+            f"{metrics['elapsed_seconds']:.1f}s: "
+            f"{metrics['lines_per_second'] or 0:.0f} lines/s, "
+            f"{metrics['gabs_per_second'] or 0:.0f} gabs/s"
+        ]
+        for stage, stage_metrics in metrics["stages"].items():
+            lines.append(
+                f"  {stage:<8} {stage_metrics['seconds']:10.2f}s "
+                f"{stage_metrics['count']:>12} items"
+            )
+        for table, table_metrics in sorted(
+            metrics["tables"].items(), key=lambda item: -item[1]["seconds"]
+        ):
+            lines.append(
+                f"    insert {table:<22} {table_metrics['seconds']:10.2f}s "
+                f"{table_metrics['rows']:>12} rows"
+            )
+        return "\n".join(lines)
+
+
+class ProgressReporter:
+    """
+    Shows the progress through a file on stderr (or another stream), at most once every
+    interval seconds: lines loaded, throughput and, if the file size is known, the
+    percentage done and estimated time remaining.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        total_bytes: Optional[int] = None,
+        stream: TextIO = sys.stderr,
+        interval: float = 1.0,
+    ):
+        self.name = name
+        self.total_bytes = total_bytes
+        self.stream = stream
+        self.interval = interval
+        self._started = time.perf_counter()
+        self._last_shown = float("-inf")  # So the first update is always shown
+
+    def update(self, lines_read: int, position: Optional[int] = None, final=False):
+        """
+        position is how far through the file has been read, in the same units as
+        total_bytes.
+        """
+        now = time.perf_counter()
+        if not final and now - self._last_shown < self.interval:
+            return
+        self._last_shown = now
+
+        elapsed = now - self._started
+        rate = lines_read / elapsed if elapsed else 0
+        message = f"{self.name}: {lines_read} lines, {rate:.0f} lines/s"
+
+        if self.total_bytes and position is not None:
+            fraction = min(position / self.total_bytes, 1.0)
+            message += f", {fraction:.1%}"
+            if 0 < fraction < 1:
+                remaining = elapsed * (1 - fraction) / fraction
+                message += f", ETA {time.strftime('%H:%M:%S', time.gmtime(remaining))}"
+
+        end = "\n" if final else ""
+        self.stream.write(f"\r{message}\033[K{end}")
+        self.stream.flush()
@@ -0,0 +1,95 @@
+"""
+Quarantine
+
+Lines which can't be loaded (because they aren't valid JSON, or because they are valid
+JSON but not a gab the data mappings can handle, e.g. an account missing a field) are
+skipped, so that one bad line doesn't stop the rest of the file loading. This file
+contains the quarantine those lines can be written to instead, so they can be looked at
+(or fixed and loaded) later.
+
+The quarantine is a gzip compressed JSON lines file, with one record per failed line:
+
+    {"file": ..., "line": ..., "stage": "parse" or "map", "error": ..., "content": ...}
+
+where line is the line number in the input file, counting from 1, and content is the
+line itself. Records are written as soon as each chunk of the file has been mapped, so
+memory use doesn't depend on how many lines fail. An existing quarantine file is added
+to rather than replaced. If a load is interrupted and resumed, lines after its last
+checkpoint may be recorded twice.
+"""
+
+import gzip
+import json
+import shutil
+from logging import getLogger
+from typing import NamedTuple, Union
+
+
+logger = getLogger(__name__)
+
+
+class FailedLine(NamedTuple):
+    """An input line which failed to load, from gab_to_sqlite._map_lines"""
+
+    index: int  # Position of the line in its chunk, counting from 0
+    stage: str  # "parse" or "map"
+    error: str
+    line: Union[bytes, str]
+
+
+def describe_error(error: Exception) -> str:
+    """The error as recorded in the quarantine, e.g. "KeyError: 'is_investor'" """
+    return f"{type(error).__name__}: {error}"
+
+
+class Quarantine:
+    """
+    Writes failed lines to a gzip compressed JSON lines file (see the module docstring),
+    counting the records written.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.num_lines = 0
+        self._fh = open(path, "ab")
+        self._gzip = gzip.GzipFile(fileobj=self._fh, mode="wb")
+
+    def add(self, filename: str, line_number: int, failed_line: FailedLine):
+        line = failed_line.line
+        if isinstance(line, bytes):
+            line = line.decode("utf-8", errors="replace")
+
+        record = {
+            "file": filename,
+            "line": line_number,
+            "stage": failed_line.stage,
+            "error": failed_line.error,
+            "content": line.rstrip("\r\n"),
+        }
+        self._gzip.write(json.dumps(record).encode("utf-8") + b"\n")
+        self.num_lines += 1
+
+    def add_file(self, path: str, num_lines: int):
+        """
+        Adds the records of another quarantine file, with num_lines records, e.g. one
+        written by a shard (see shards.load_files_sharded).
+        """
+        # Concatenated gzip members are read back as one file, so the other file's
+        # members can be copied across as they are
+        self._gzip.close()
+        with open(path, "rb") as other_fh:
+            shutil.copyfileobj(other_fh, self._fh)
+        self._gzip = gzip.GzipFile(fileobj=self._fh, mode="wb")
+        self.num_lines += num_lines
+
+    def close(self):
+        self._gzip.close()
+        self._fh.close()
+        if self.num_lines:
+            logger.info(f"Wrote {self.num_lines} failed lines to {self.path}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,104 @@
+"""
+Written row cache
+
+Some tables hold reference data which turns up in a large share of posts: on a hashtag
+collection, the same handful of emoji, groups and cards appear again and again. This
+file contains a size-bounded cache of which of these rows have already been written to
+the database during this run, so unchanged rows can be skipped before they are sent to
+SQLite again.
+"""
+
+from collections import Counter, OrderedDict
+from logging import getLogger
+from operator import itemgetter
+from typing import Dict, List, Tuple
+
+import gab_tidy_data.mapping_compiler as mapping_compiler
+
+
+logger = getLogger(__name__)
+
+
+# Primary key columns of the tables whose rows are cached
+cached_table_keys = {
+    "emoji": ["shortcode"],
+    "group_category": ["id"],
+    "gab_group": ["id", "_file_id"],
+    "media_attachment": ["id"],
+    "card": ["id"],
+}
+
+
+class WrittenRowCache:
+    """
+    Least recently used cache of the rows written to the cached tables (see
+    cached_table_keys), remembering up to max_size rows.
+
+    For each cached row, the cache remembers its primary key and a hash of its contents.
+    A row is only skipped if the last row written with the same primary key had the
+    same contents, so changed rows are still written and "insert or replace" still
+    keeps the last row.
+
+    The cache must be cleared if rows it has seen are not committed to the database
+    (e.g. after a rollback).
+    """
+
+    def __init__(self, max_size: int = 100_000):
+        self.max_size = max_size
+        self._written = OrderedDict()
+        self._key_getters = {
+            table: itemgetter(
+                *[mapping_compiler.columns[table].index(column) for column in key]
+            )
+            for table, key in cached_table_keys.items()
+        }
+        self.hits = Counter()
+        self.misses = Counter()
+
+    def filter_unwritten(self, table: str, rows: List[tuple]) -> List[tuple]:
+        """
+        Returns the rows which need writing to the database, in their original order,
+        and remembers them as written.
+        """
+        if table not in self._key_getters:
+            return rows
+
+        get_key = self._key_getters[table]
+        written = self._written
+        to_write = []
+
+        for row in rows:
+            key = (table, get_key(row))
+            row_hash = hash(row)
+
+            if written.get(key) == row_hash:
+                written.move_to_end(key)
+                self.hits[table] += 1
+                continue
+
+            self.misses[table] += 1
+            to_write.append(row)
+
+            written[key] = row_hash
+            written.move_to_end(key)
+            if len(written) > self.max_size:
+                written.popitem(last=False)
+
+        return to_write
+
+    def clear(self):
+        self._written.clear()
+
+    def stats(self) -> Dict[str, Tuple[int, int]]:
+        """Returns (hits, misses) for each cached table"""
+        return {
+            table: (self.hits[table], self.misses[table]) for table in cached_table_keys
+        }
+
+    def log_stats(self):
+        for table, (hits, misses) in self.stats().items():
+            if hits + misses:
+                logger.info(
+                    f"Row cache for {table}: {hits} unchanged rows skipped, {misses} "
+                    f"rows written ({hits / (hits + misses):.1%} hit rate)"
+                )
@@ -0,0 +1,191 @@
+"""
+Sharded loading
+
+SQLite only allows one writer at a time, so however many processes parse the input,
+inserting into a single database caps how fast files can be loaded. In sharded loading,
+the input files are split into groups ("shards"), and each shard is loaded by its own
+process into its own temporary database. The shard databases are then merged into the
+target database in file order (see merge), each as soon as it and the shards before it
+are finished, so the result is the same as loading the files one after another.
+"""
+
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+from contextlib import closing, nullcontext
+from logging import getLogger
+from typing import List, Optional, Tuple
+
+import gab_tidy_data.gab_to_sqlite as gts
+import gab_tidy_data.input_files as input_files
+from gab_tidy_data.merge import merge_database
+from gab_tidy_data.metrics import IngestMetrics
+from gab_tidy_data.quarantine import Quarantine
+
+logger = getLogger(__name__)
+
+
+def split_into_shards(file_paths: List[str], num_shards: int) -> List[List[str]]:
+    """
+    Splits the files into at most num_shards groups of consecutive files, with roughly
+    equal total file sizes. Consecutive files are kept together so that the shards can
+    be merged back in the original file order.
+    """
+    sizes = [os.path.getsize(path) for path in file_paths]
+    target_size = sum(sizes) / num_shards
+    shards = []
+    shard_size = 0
+
+    for path, size in zip(file_paths, sizes):
+        if not shards or (shard_size >= target_size and len(shards) < num_shards):
+            shards.append([])
+            shard_size = 0
+
+        shards[-1].append(path)
+        shard_size += size
+
+    return shards
+
+
+def _load_shard(
+    shard_path: str,
+    file_paths: List[str],
+    profile: bool,
+    quarantine_path: Optional[str],
+    load_options: dict,
+) -> Tuple[List[Tuple[str, int, int]], IngestMetrics, int]:
+    """
+    Loads the files into a new shard database. Runs in a worker process. Returns
+    (filename, gabs inserted, failed lines) for each file, the load metrics, and the
+    number of lines written to the shard's quarantine file, if there is one.
+    """
+    metrics = IngestMetrics(profile=profile)
+    results = []
+    quarantine = Quarantine(quarantine_path) if quarantine_path is not None else None
+
+    with closing(sqlite3.connect(shard_path)) as db_connection, (
+        quarantine or nullcontext()
+    ):
+        # The shard is temporary, so crash safety doesn't matter
+        db_connection.execute(f"pragma page_size = {gts.bulk_load_page_size}")
+        for pragma, value in gts.bulk_load_pragmas.items():
+            db_connection.execute(f"pragma {pragma} = {value}")
+
+        gts.initialise_empty_database(db_connection)
+
+        for file_path in file_paths:
+            with open(file_path, "rb") as json_fh:
+                added, fails = gts.load_file_to_sqlite(
+                    json_fh,
+                    db_connection,
+                    metrics=metrics,
+                    quarantine=quarantine,
+                    **load_options,
+                )
+            results.append((file_path, added, fails))
+
+    return results, metrics, quarantine.num_lines if quarantine is not None else 0
+
+
+def load_files_sharded(
+    file_paths: List[str],
+    db_connection: sqlite3.Connection,
+    num_shards: int,
+    shard_directory: Optional[str] = None,
+    metrics: Optional[IngestMetrics] = None,
+    quarantine: Optional[Quarantine] = None,
+    skip_loaded: bool = True,
+    **load_options,
+) -> List[Tuple[str, int, int]]:
+    """
+    Loads the files into the database of db_connection, split across up to num_shards
+    processes, each loading a group of files into its own temporary database (see
+    split_into_shards). Shard databases are created in shard_directory, which defaults
+    to the system temporary directory, and are deleted once merged.
+
+    load_options are passed on to gab_to_sqlite.load_file_to_sqlite for every file.
+    Each shard is loaded with a single worker, and files already loaded into the target
+    database should be left out of file_paths, as shards can't see what the target
+    database already holds. If skip_loaded is True, files with the same contents (see
+    input_files.fingerprint) as an earlier file are skipped, as they would be when
+    loading the files one after another. If a quarantine is given, each shard writes
+    the lines it fails to load to its own quarantine file, which is added to the
+    quarantine when the shard is merged.
+
+    Returns (filename, gabs inserted, failed lines) for each file, in order, with
+    (filename, 0, 0) for skipped files.
+    """
+    # Whether each file is loaded
+    to_load = [True] * len(file_paths)
+    if skip_loaded:
+        first_paths = {}
+        for number, file_path in enumerate(file_paths):
+            with open(file_path, "rb") as json_fh:
+                file_fingerprint = input_files.fingerprint(json_fh)
+            if file_fingerprint in first_paths:
+                logger.info(
+                    f"Skipping {file_path}, which has the same contents as "
+                    f"{first_paths[file_fingerprint]}"
+                )
+                to_load[number] = False
+            else:
+                first_paths[file_fingerprint] = file_path
+
+    shards = split_into_shards(
+        [path for path, load in zip(file_paths, to_load) if load], num_shards
+    )
+    load_options = dict(load_options, workers=1, skip_loaded=False)
+    if metrics is None:
+        metrics = IngestMetrics()
+    results = []
+
+    with tempfile.TemporaryDirectory(dir=shard_directory) as temporary_directory:
+        shard_paths = [
+            os.path.join(temporary_directory, f"shard{number}.db")
+            for number in range(len(shards))
+        ]
+        quarantine_paths = [
+            f"{shard_path}.quarantine.gz" if quarantine is not None else None
+            for shard_path in shard_paths
+        ]
+
+        with multiprocessing.Pool(max(len(shards), 1)) as pool:
+            shard_loads = [
+                pool.apply_async(
+                    _load_shard,
+                    (
+                        shard_path,
+                        shard,
+                        metrics.profile,
+                        quarantine_path,
+                        load_options,
+                    ),
+                )
+                for shard_path, shard, quarantine_path in zip(
+                    shard_paths, shards, quarantine_paths
+                )
+            ]
+
+            # Merge each shard as soon as it and the shards before it are loaded
+            for shard_path, quarantine_path, shard_load in zip(
+                shard_paths, quarantine_paths, shard_loads
+            ):
+                shard_results, shard_metrics, num_quarantined = shard_load.get()
+                results.extend(shard_results)
+                metrics.add(shard_metrics)
+
+                with metrics.time_stage("merge"):
+                    merge_database(db_connection, shard_path, skip_loaded=False)
+                os.remove(shard_path)
+                if quarantine_path is not None:
+                    quarantine.add_file(quarantine_path, num_quarantined)
+                    os.remove(quarantine_path)
+                logger.info(f"Merged shard of {len(shard_results)} files")
+
+    # With the skipped files put back in
+    loaded = iter(results)
+    return [
+        next(loaded) if load else (file_path, 0, 0)
+        for file_path, load in zip(file_paths, to_load)
+    ]
@@ -0,0 +1,330 @@
+"""
+Synthetic Garc data
+
+Generates realistic-looking Garc output, for measuring loading speed at any scale. The
+gabs have the same structure as real Garc output (see the mapping functions in
+gab_data_mapping), and the mix of quotes, groups, media, mentions, emoji and cards, and
+how often accounts post more than once, can be controlled with GeneratorSettings.
+
+Generation is deterministic: the same settings and seed always give the same output.
+Memory use doesn't grow with the number of gabs, so files of millions of lines can be
+generated. For example, to write 100,000 gabs:
+
+    python -m gab_tidy_data.synthetic_data 100000 synthetic.jsonl
+"""
+
+import datetime as dt
+import gzip
+import json
+import random
+from collections import deque
+from typing import Iterator, NamedTuple, Optional
+
+import click
+
+
+class GeneratorSettings(NamedTuple):
+    """
+    Proportions of gabs with each kind of embedded entity. Rates are the probability
+    that a gab has one (or more) of them.
+    """
+
+    quote_rate: float = 0.1
+    group_rate: float = 0.2
+    media_rate: float = 0.3
+    mention_rate: float = 0.3
+    emoji_rate: float = 0.1
+    card_rate: float = 0.15
+    # Probability that a gab is posted by an account which has already posted
+    repeat_account_rate: float = 0.7
+    # Sizes of the pools of groups, cards, emoji and tags which gabs draw from
+    num_groups: int = 200
+    num_cards: int = 2000
+    num_emoji: int = 50
+    num_tags: int = 1000
+
+
+# Only recent gabs are quoted, so memory use stays constant
+_quotable_gabs = 1000
+
+_words = (
+    "the of and to in is that for it as was with be by on not he this are or his from "
+    "at which but have an they you were her she there been one all we their has would "
+    "when if so no will can more about said what up its out into them than some could "
+    "gab post free speech news today people think time first new good know just like"
+).split()
+
+_start_time = dt.datetime(2021, 1, 1, tzinfo=dt.timezone.utc)
+
+
+def _timestamp(seconds: float) -> str:
+    timestamp = _start_time + dt.timedelta(seconds=seconds)
+    return (
+        timestamp.strftime("%Y-%m-%dT%H:%M:%S.")
+        + f"{timestamp.microsecond // 1000:03d}Z"
+    )
+
+
+def _text(rng: random.Random, min_words: int, max_words: int) -> str:
+    return " ".join(rng.choices(_words, k=rng.randint(min_words, max_words)))
+
+
+def _emoji(number: int) -> dict:
+    return {
+        "shortcode": f"emoji{number}",
+        "url": f"https://example.com/emoji/{number}.png",
+        "static_url": f"https://example.com/emoji/{number}_static.png",
+        "visible_in_picker": True,
+    }
+
+
+def _account(number: int, gab_number: int) -> dict:
+    """
+    The account with this number, as it would appear in the gab with gab_number. Each
+    account is generated from its own number, so accounts don't need to be remembered,
+    and its counts grow over time as a real account's would.
+    """
+    rng = random.Random(number)
+    username = f"user{number}"
+    fields = [
+        {"name": f"field{i}", "value": _text(rng, 1, 3), "verified_at": None}
+        for i in range(rng.choice([0, 0, 0, 1, 2]))
+    ]
+    emojis = [_emoji(rng.randrange(10))] if rng.random() < 0.05 else []
+
+    return {
+        "id": str(number),
+        "username": username,
+        "acct": username,
+        "display_name": username.title(),
+        "locked": False,
+        "bot": rng.random() < 0.01,
+        "created_at": _timestamp(-rng.randrange(4 * 365 * 24 * 3600)),
+        "note": _text(rng, 0, 20),
+        "url": f"https://example.com/{username}",
+        "avatar": f"https://example.com/avatars/{number}.png",
+        "avatar_static": f"https://example.com/avatars/{number}_static.png",
+        "header": "https://gab.com/headers/original/missing.png",
+        "header_static": "https://gab.com/headers/original/missing.png",
+        "is_spam": False,
+        "followers_count": rng.randrange(10000) + gab_number // 1000,
+        "following_count": rng.randrange(5000),
+        "statuses_count": rng.randrange(100000) + gab_number // 100,
+        "is_pro": rng.random() < 0.1,
+        "is_verified": rng.random() < 0.02,
+        "is_donor": rng.random() < 0.05,
+        "is_investor": False,
+        "emojis": emojis,
+        "fields": fields,
+    }
+
+
+def _group(number: int) -> dict:
+    rng = random.Random(-number)
+    category_number = number % 10
+    description = _text(rng, 5, 30)
+
+    return {
+        "id": str(number),
+        "title": f"Group {number}",
+        "description": description,
+        "description_html": f"<p>{description}</p>",
+        "cover_image_url": f"https://example.com/groups/{number}/cover.png",
+        "is_archived": False,
+        "member_count": rng.randrange(100000),
+        "created_at": _timestamp(-rng.randrange(3 * 365 * 24 * 3600)),
+        "is_private": rng.random() < 0.1,
+        "is_visible": True,
+        "slug": f"group-{number}",
+        "url": f"https://example.com/groups/{number}",
+        "has_password": False,
+        "password": None,
+        "group_category": {
+            "id": category_number,
+            "created_at": "2019-01-01T00:00:00.000Z",
+            "updated_at": "2019-01-01T00:00:00.000Z",
+            "text": f"Category {category_number}",
+        },
+        "tags": [f"tag{rng.randrange(100)}" for _ in range(rng.randrange(4))] or None,
+    }
+
+
+def _card(number: int) -> dict:
+    url = f"https://news.example.com/articles/{number}"
+    return {
+        "id": str(number),
+        "url": url,
+        "title": f"Article {number}",
+        "description": _text(random.Random(number), 5, 25),
+        "type": "link",
+        "provider_name": "Example News",
+        "provider_url": "https://news.example.com",
+        "html": "",
+        "image": f"https://example.com/cards/{number}.jpg",
+        "embed_url": "",
+        "updated_at": "2021-01-01T00:00:00.000Z",
+        "width": 400,
+        "height": 200,
+    }
+
+
+def _media(gab_id: str, ordering: int) -> dict:
+    media_id = f"{gab_id}{ordering}"
+    return {
+        "id": media_id,
+        "type": "image",
+        "url": f"https://example.com/media/{media_id}.png",
+        "preview_url": f"https://example.com/media/{media_id}_small.png",
+        "source_mp4": None,
+        "remote_url": None,
+        "text_url": f"https://example.com/media/{media_id}",
+        "description": None,
+        "blurhash": "UBL_:rOpGG-oBUNG,qRj2so|=eE1w^n4S5NH",
+        "file_content_type": "image/png",
+        "meta": {"original": {"width": 800, "height": 600}},
+    }
+
+
+def generate_gabs(
+    num_gabs: int, seed: int = 0, settings: GeneratorSettings = GeneratorSettings()
+) -> Iterator[dict]:
+    """Generates num_gabs gabs as Garc would output them, in posting order"""
+    rng = random.Random(seed)
+    recent_gabs = deque(maxlen=_quotable_gabs)
+    num_accounts = 0
+    seconds = 0.0
+
+    for gab_number in range(num_gabs):
+        gab_id = str(100_000_000_000_000_000 + gab_number)
+        seconds += rng.expovariate(1 / 30)
+
+        if num_accounts and rng.random() < settings.repeat_account_rate:
+            account_number = rng.randrange(num_accounts)
+        else:
+            account_number = num_accounts
+            num_accounts += 1
+        account = _account(account_number, gab_number)
+
+        content = _text(rng, 3, 60)
+
+        mentions = []
+        if num_accounts > 1 and rng.random() < settings.mention_rate:
+            for mentioned in {
+                rng.randrange(num_accounts) for _ in range(rng.randint(1, 3))
+            }:
+                mentions.append(
+                    {
+                        "id": str(mentioned),
+                        "username": f"user{mentioned}",
+                        "url": f"https://example.com/user{mentioned}",
+                        "acct": f"user{mentioned}",
+                    }
+                )
+                content = f"@user{mentioned} {content}"
+
+        tags = []
+        for tag_number in {
+            rng.randrange(settings.num_tags) for _ in range(rng.randrange(4))
+        }:
+            tags.append({"name": f"tag{tag_number}", "url": f"/tags/tag{tag_number}"})
+            content = f"{content} #tag{tag_number}"
+
+        emojis = []
+        if rng.random() < settings.emoji_rate:
+            emojis = [_emoji(rng.randrange(settings.num_emoji))]
+            content = f"{content} :{emojis[0]['shortcode']}:"
+
+        quote = None
+        if recent_gabs and rng.random() < settings.quote_rate:
+            quote = rng.choice(recent_gabs)
+
+        media = []
+        if rng.random() < settings.media_rate:
+            media = [_media(gab_id, i) for i in range(rng.randint(1, 4))]
+
+        gab = {
+            "id": gab_id,
+            "created_at": _timestamp(seconds),
+            "revised_at": _timestamp(seconds + 60) if rng.random() < 0.02 else None,
+            "in_reply_to_id": None,
+            "in_reply_to_account_id": None,
+            "sensitive": rng.random() < 0.03,
+            "spoiler_text": "",
+            "visibility": "public",
+            "language": "en",
+            "uri": f"/{account['username']}/posts/{gab_id}",
+            "url": f"https://example.com/{account['username']}/posts/{gab_id}",
+            "replies_count": rng.randrange(20),
+            "reblogs_count": rng.randrange(50),
+            "pinnable": False,
+            "pinnable_by_group": False,
+            "favourites_count": rng.randrange(100),
+            "quote_of_id": quote["id"] if quote else None,
+            "expires_at": None,
+            "has_quote": quote is not None,
+            "bookmark_collection_id": None,
+            "favourited": False,
+            "reblogged": False,
+            "content": f"<p>{content}</p>",
+            "rich_content": f"<p>{content}</p>",
+            "plain_markdown": content,
+            "reblog": None,
+            "quote": quote,
+            "account": account,
+            "group": (
+                _group(rng.randrange(settings.num_groups))
+                if rng.random() < settings.group_rate
+                else None
+            ),
+            "media_attachments": media,
+            "mentions": mentions,
+            "tags": tags,
+            "emojis": emojis,
+            "card": (
+                _card(rng.randrange(settings.num_cards))
+                if rng.random() < settings.card_rate
+                else None
+            ),
+            "poll": None,
+        }
+
+        recent_gabs.append(gab)
+        yield gab
+
+
+def write_jsonl(
+    path: str,
+    num_gabs: int,
+    seed: int = 0,
+    settings: GeneratorSettings = GeneratorSettings(),
+):
+    """Writes generated gabs to a JSONL file, gzip compressed if path ends in .gz"""
+    opener = gzip.open if str(path).endswith(".gz") else open
+
+    with opener(path, "wt", encoding="utf-8") as jsonl_fh:
+        for gab in generate_gabs(num_gabs, seed, settings):
+            jsonl_fh.write(json.dumps(gab))
+            jsonl_fh.write("\n")
+
+
+@click.command()
+@click.argument("num_gabs", type=click.IntRange(min=0))
+@click.argument("output_filename", type=click.Path(dir_okay=False, writable=True))
+@click.option("--seed", type=int, default=0, show_default=True)
+@click.option("--quote-rate", type=click.FloatRange(0, 1))
+@click.option("--group-rate", type=click.FloatRange(0, 1))
+@click.option("--media-rate", type=click.FloatRange(0, 1))
+@click.option("--mention-rate", type=click.FloatRange(0, 1))
+@click.option("--emoji-rate", type=click.FloatRange(0, 1))
+@click.option("--card-rate", type=click.FloatRange(0, 1))
+@click.option("--repeat-account-rate", type=click.FloatRange(0, 1))
+def main(num_gabs, output_filename, seed: Optional[int], **rates):
+    """Writes NUM_GABS synthetic gabs to OUTPUT_FILENAME as Garc style JSONL"""
+    settings = GeneratorSettings()._replace(
+        **{name: rate for name, rate in rates.items() if rate is not None}
+    )
+    write_jsonl(output_filename, num_gabs, seed, settings)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+URL dictionary
+
+In the url_dictionary storage mode (see url_dictionary.sql), the URL columns of some
+tables are stored as the id of the URL's prefix (everything up to and including the
+last "/") in the url_prefix table, plus the rest of the URL. A handful of prefixes
+(Gab's avatar and header directories, media servers, news sites) make up most of the
+length of these URLs, so this stores each of them once rather than in every row.
+
+This file encodes mapped rows that way before they are written to the *_encoded tables.
+The ids of recently used prefixes are kept in a size-bounded cache, so most URLs are
+encoded without going to the database at all.
+"""
+
+import sqlite3
+from logging import getLogger
+from typing import List, Optional, Tuple
+
+import gab_tidy_data.mapping_compiler as mapping_compiler
+
+
+logger = getLogger(__name__)
+
+# Columns stored as a prefix id and the rest of the URL, for each table
+encoded_columns = {
+    "account": ["url", "avatar", "avatar_static", "header", "header_static"],
+    "gab_group": ["cover_image_url", "url"],
+    "media_attachment": ["url", "preview_url", "remote_url", "text_url"],
+    "card": ["url", "provider_url", "image_url", "embed_url"],
+}
+
+# Statements inserting encoded rows (see UrlDictionary.encode_rows)
+encoded_insert_sql = {
+    table: mapping_compiler.compile_insert_sql(
+        table,
+        mapping_compiler.columns[table] + [f"{column}_prefix_id" for column in columns],
+        into=f"{table}_encoded",
+    )
+    for table, columns in encoded_columns.items()
+}
+
+
+def split_url(url: str) -> Tuple[str, str]:
+    """
+    Splits the URL after its last "/". Gives the same split as the SQL used when
+    inserting into the views, rtrim(url, replace(url, '/', '')).
+    """
+    split_at = url.rfind("/") + 1
+    return url[:split_at], url[split_at:]
+
+
+class UrlDictionary:
+    """
+    Encodes the URL columns of rows for the url_dictionary storage mode, adding any new
+    prefixes to the url_prefix table. Remembers the ids of up to max_size prefixes.
+
+    The cache must be thrown away if prefixes it has added are not committed to the
+    database (e.g. after a rollback).
+    """
+
+    def __init__(self, db: sqlite3.Cursor, max_size: int = 100_000):
+        self.db = db
+        self.max_size = max_size
+        self._prefix_ids = {}
+        self._column_indexes = {
+            table: [mapping_compiler.columns[table].index(column) for column in columns]
+            for table, columns in encoded_columns.items()
+        }
+
+    def prefix_id(self, prefix: str) -> int:
+        prefix_id = self._prefix_ids.get(prefix)
+        if prefix_id is not None:
+            return prefix_id
+
+        self.db.execute(
+            "insert or ignore into url_prefix (prefix) values (?)", [prefix]
+        )
+        self.db.execute("select id from url_prefix where prefix = ?", [prefix])
+        prefix_id = self.db.fetchone()[0]
+
+        # Forget the prefix remembered longest ago. There are usually few prefixes, so
+        # this is rare enough not to need tracking which were used most recently.
+        if len(self._prefix_ids) >= self.max_size:
+            del self._prefix_ids[next(iter(self._prefix_ids))]
+        self._prefix_ids[prefix] = prefix_id
+
+        return prefix_id
+
+    def encode_rows(self, table: str, rows: List[tuple]) -> List[tuple]:
+        """
+        Returns the rows with each URL column replaced by the URL after its prefix, and
+        the prefix ids added at the end, as encoded_insert_sql expects.
+        """
+        column_indexes = self._column_indexes[table]
+        cached_prefix_ids = self._prefix_ids
+        encoded_rows = []
+
+        for row in rows:
+            row = list(row)
+            prefix_ids: List[Optional[int]] = []
+            for i in column_indexes:
+                url = row[i]
+                if url is None:
+                    prefix_ids.append(None)
+                    continue
+
+                # Inlined split_url, as this runs for every URL loaded
+                split_at = url.rfind("/") + 1
+                prefix = url[:split_at]
+                row[i] = url[split_at:]
+                prefix_id = cached_prefix_ids.get(prefix)
+                if prefix_id is None:
+                    prefix_id = self.prefix_id(prefix)
+                prefix_ids.append(prefix_id)
+
+            encoded_rows.append(tuple(row + prefix_ids))
+
+        return encoded_rows
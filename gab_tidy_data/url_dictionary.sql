@@ -0,0 +1,372 @@
+-------------------------------------
+-- URL dictionary storage mode     --
+-------------------------------------
+
+-- Applied after gab_schema.sql when a database is created with the url_dictionary
+-- storage mode. The URL columns of the account, gab_group, media_attachment and card
+-- tables repeat the same long prefixes (everything up to the last "/") over and over,
+-- so each prefix is stored once in url_prefix, and the tables only store the rest of
+-- each URL along with the id of its prefix. Views with the names and columns of the
+-- original tables put the URLs back together.
+--
+-- Loading writes to the *_encoded tables directly, with prefixes looked up in an
+-- in-memory cache (see url_dictionary.py). Inserting into the views (as merging does)
+-- splits the URLs in SQL instead.
+
+create table url_prefix (
+    id integer primary key,
+    prefix text not null unique
+);
+
+drop table account;
+
+create table account_encoded (
+    id text, -- Gab-provided user id
+    username text not null,
+    acct text,
+    display_name text,
+    locked integer, -- boolean
+    bot integer, -- boolean
+    created_at text, -- Unparsed ISO datetime
+    created_at_parsed real generated always as (julianday(created_at)) stored, -- created_at in julianday format
+    note text,
+    url text, -- the URL after its prefix
+    avatar text, -- the URL after its prefix
+    avatar_static text, -- the URL after its prefix
+    header text, -- the URL after its prefix
+    header_static text, -- the URL after its prefix
+    is_spam integer, -- boolean
+    followers_count integer,
+    following_count integer,
+    statuses_count integer,
+    is_pro integer, -- boolean
+    is_verified integer, -- boolean
+    is_donor integer, -- boolean
+    is_investor integer, --boolean,
+    _file_id integer references _inserted_files (id),
+    url_prefix_id integer references url_prefix (id),
+    avatar_prefix_id integer references url_prefix (id),
+    avatar_static_prefix_id integer references url_prefix (id),
+    header_prefix_id integer references url_prefix (id),
+    header_static_prefix_id integer references url_prefix (id),
+    primary key (id, _file_id)
+);
+
+create view account as
+select
+    id,
+    username,
+    acct,
+    display_name,
+    locked,
+    bot,
+    created_at,
+    created_at_parsed,
+    note,
+    (select prefix from url_prefix where id = url_prefix_id) || url as url,
+    (select prefix from url_prefix where id = avatar_prefix_id) || avatar as avatar,
+    (select prefix from url_prefix where id = avatar_static_prefix_id) || avatar_static as avatar_static,
+    (select prefix from url_prefix where id = header_prefix_id) || header as header,
+    (select prefix from url_prefix where id = header_static_prefix_id) || header_static as header_static,
+    is_spam,
+    followers_count,
+    following_count,
+    statuses_count,
+    is_pro,
+    is_verified,
+    is_donor,
+    is_investor,
+    _file_id
+from account_encoded;
+
+create trigger account_insert instead of insert on account
+begin
+    insert into url_prefix (prefix)
+    select distinct prefix from (
+        select rtrim(new.url, replace(new.url, '/', '')) as prefix
+        where new.url is not null
+        union all
+        select rtrim(new.avatar, replace(new.avatar, '/', '')) as prefix
+        where new.avatar is not null
+        union all
+        select rtrim(new.avatar_static, replace(new.avatar_static, '/', '')) as prefix
+        where new.avatar_static is not null
+        union all
+        select rtrim(new.header, replace(new.header, '/', '')) as prefix
+        where new.header is not null
+        union all
+        select rtrim(new.header_static, replace(new.header_static, '/', '')) as prefix
+        where new.header_static is not null
+    )
+    where prefix not in (select prefix from url_prefix);
+
+    insert into account_encoded (
+        id, username, acct, display_name, locked, bot, created_at, note, url, avatar,
+        avatar_static, header, header_static, is_spam, followers_count, following_count,
+        statuses_count, is_pro, is_verified, is_donor, is_investor, _file_id,
+        url_prefix_id, avatar_prefix_id, avatar_static_prefix_id, header_prefix_id,
+        header_static_prefix_id
+    )
+    values (
+        new.id,
+        new.username,
+        new.acct,
+        new.display_name,
+        new.locked,
+        new.bot,
+        new.created_at,
+        new.note,
+        substr(new.url, length(rtrim(new.url, replace(new.url, '/', ''))) + 1),
+        substr(new.avatar, length(rtrim(new.avatar, replace(new.avatar, '/', ''))) + 1),
+        substr(new.avatar_static, length(rtrim(new.avatar_static, replace(new.avatar_static, '/', ''))) + 1),
+        substr(new.header, length(rtrim(new.header, replace(new.header, '/', ''))) + 1),
+        substr(new.header_static, length(rtrim(new.header_static, replace(new.header_static, '/', ''))) + 1),
+        new.is_spam,
+        new.followers_count,
+        new.following_count,
+        new.statuses_count,
+        new.is_pro,
+        new.is_verified,
+        new.is_donor,
+        new.is_investor,
+        new._file_id,
+        (select id from url_prefix where prefix = rtrim(new.url, replace(new.url, '/', ''))),
+        (select id from url_prefix where prefix = rtrim(new.avatar, replace(new.avatar, '/', ''))),
+        (select id from url_prefix where prefix = rtrim(new.avatar_static, replace(new.avatar_static, '/', ''))),
+        (select id from url_prefix where prefix = rtrim(new.header, replace(new.header, '/', ''))),
+        (select id from url_prefix where prefix = rtrim(new.header_static, replace(new.header_static, '/', '')))
+    );
+end;
+
+drop table gab_group;
+
+create table gab_group_encoded (
+    id text,
+    title text,
+    description text,
+    description_html text,
+    cover_image_url text, -- the URL after its prefix
+    is_archived integer, -- boolean
+    member_count integer,
+    created_at text,
+    created_at_parsed real generated always as (julianday(created_at)) stored, -- created_at in julianday format
+    is_private integer, -- boolean
+    is_visible integer, -- boolean
+    slug text,
+    url text, -- the URL after its prefix
+    group_category integer references group_category (id),
+    has_password integer, -- boolean
+    _file_id integer references _inserted_files (id),
+    cover_image_url_prefix_id integer references url_prefix (id),
+    url_prefix_id integer references url_prefix (id),
+    primary key (id, _file_id)
+);
+
+create view gab_group as
+select
+    id,
+    title,
+    description,
+    description_html,
+    (select prefix from url_prefix where id = cover_image_url_prefix_id) || cover_image_url as cover_image_url,
+    is_archived,
+    member_count,
+    created_at,
+    created_at_parsed,
+    is_private,
+    is_visible,
+    slug,
+    (select prefix from url_prefix where id = url_prefix_id) || url as url,
+    group_category,
+    has_password,
+    _file_id
+from gab_group_encoded;
+
+create trigger gab_group_insert instead of insert on gab_group
+begin
+    insert into url_prefix (prefix)
+    select distinct prefix from (
+        select rtrim(new.cover_image_url, replace(new.cover_image_url, '/', '')) as prefix
+        where new.cover_image_url is not null
+        union all
+        select rtrim(new.url, replace(new.url, '/', '')) as prefix
+        where new.url is not null
+    )
+    where prefix not in (select prefix from url_prefix);
+
+    insert into gab_group_encoded (
+        id, title, description, description_html, cover_image_url, is_archived,
+        member_count, created_at, is_private, is_visible, slug, url, group_category,
+        has_password, _file_id, cover_image_url_prefix_id, url_prefix_id
+    )
+    values (
+        new.id,
+        new.title,
+        new.description,
+        new.description_html,
+        substr(new.cover_image_url, length(rtrim(new.cover_image_url, replace(new.cover_image_url, '/', ''))) + 1),
+        new.is_archived,
+        new.member_count,
+        new.created_at,
+        new.is_private,
+        new.is_visible,
+        new.slug,
+        substr(new.url, length(rtrim(new.url, replace(new.url, '/', ''))) + 1),
+        new.group_category,
+        new.has_password,
+        new._file_id,
+        (select id from url_prefix where prefix = rtrim(new.cover_image_url, replace(new.cover_image_url, '/', ''))),
+        (select id from url_prefix where prefix = rtrim(new.url, replace(new.url, '/', '')))
+    );
+end;
+
+drop table media_attachment;
+
+create table media_attachment_encoded (
+    id text primary key,
+    type text not null,
+    url text not null, -- the URL after its prefix
+    preview_url text, -- the URL after its prefix
+    source_mp4 text,
+    remote_url text, -- the URL after its prefix
+    text_url text, -- the URL after its prefix
+    description text,
+    blurhash text,
+    file_content_type text,
+    url_prefix_id integer references url_prefix (id),
+    preview_url_prefix_id integer references url_prefix (id),
+    remote_url_prefix_id integer references url_prefix (id),
+    text_url_prefix_id integer references url_prefix (id)
+);
+
+create view media_attachment as
+select
+    id,
+    type,
+    (select prefix from url_prefix where id = url_prefix_id) || url as url,
+    (select prefix from url_prefix where id = preview_url_prefix_id) || preview_url as preview_url,
+    source_mp4,
+    (select prefix from url_prefix where id = remote_url_prefix_id) || remote_url as remote_url,
+    (select prefix from url_prefix where id = text_url_prefix_id) || text_url as text_url,
+    description,
+    blurhash,
+    file_content_type
+from media_attachment_encoded;
+
+create trigger media_attachment_insert instead of insert on media_attachment
+begin
+    insert into url_prefix (prefix)
+    select distinct prefix from (
+        select rtrim(new.url, replace(new.url, '/', '')) as prefix
+        where new.url is not null
+        union all
+        select rtrim(new.preview_url, replace(new.preview_url, '/', '')) as prefix
+        where new.preview_url is not null
+        union all
+        select rtrim(new.remote_url, replace(new.remote_url, '/', '')) as prefix
+        where new.remote_url is not null
+        union all
+        select rtrim(new.text_url, replace(new.text_url, '/', '')) as prefix
+        where new.text_url is not null
+    )
+    where prefix not in (select prefix from url_prefix);
+
+    insert into media_attachment_encoded (
+        id, type, url, preview_url, source_mp4, remote_url, text_url, description,
+        blurhash, file_content_type, url_prefix_id, preview_url_prefix_id,
+        remote_url_prefix_id, text_url_prefix_id
+    )
+    values (
+        new.id,
+        new.type,
+        substr(new.url, length(rtrim(new.url, replace(new.url, '/', ''))) + 1),
+        substr(new.preview_url, length(rtrim(new.preview_url, replace(new.preview_url, '/', ''))) + 1),
+        new.source_mp4,
+        substr(new.remote_url, length(rtrim(new.remote_url, replace(new.remote_url, '/', ''))) + 1),
+        substr(new.text_url, length(rtrim(new.text_url, replace(new.text_url, '/', ''))) + 1),
+        new.description,
+        new.blurhash,
+        new.file_content_type,
+        (select id from url_prefix where prefix = rtrim(new.url, replace(new.url, '/', ''))),
+        (select id from url_prefix where prefix = rtrim(new.preview_url, replace(new.preview_url, '/', ''))),
+        (select id from url_prefix where prefix = rtrim(new.remote_url, replace(new.remote_url, '/', ''))),
+        (select id from url_prefix where prefix = rtrim(new.text_url, replace(new.text_url, '/', '')))
+    );
+end;
+
+drop table card;
+
+create table card_encoded (
+    id text primary key,
+    url text, -- the URL after its prefix
+    title text,
+    description text,
+    type text,
+    provider_name text,
+    provider_url text, -- the URL after its prefix
+    html text,
+    image_url text, -- the URL after its prefix
+    embed_url text, -- the URL after its prefix
+    updated_at text,
+    url_prefix_id integer references url_prefix (id),
+    provider_url_prefix_id integer references url_prefix (id),
+    image_url_prefix_id integer references url_prefix (id),
+    embed_url_prefix_id integer references url_prefix (id)
+);
+
+create view card as
+select
+    id,
+    (select prefix from url_prefix where id = url_prefix_id) || url as url,
+    title,
+    description,
+    type,
+    provider_name,
+    (select prefix from url_prefix where id = provider_url_prefix_id) || provider_url as provider_url,
+    html,
+    (select prefix from url_prefix where id = image_url_prefix_id) || image_url as image_url,
+    (select prefix from url_prefix where id = embed_url_prefix_id) || embed_url as embed_url,
+    updated_at
+from card_encoded;
+
+create trigger card_insert instead of insert on card
+begin
+    insert into url_prefix (prefix)
+    select distinct prefix from (
+        select rtrim(new.url, replace(new.url, '/', '')) as prefix
+        where new.url is not null
+        union all
+        select rtrim(new.provider_url, replace(new.provider_url, '/', '')) as prefix
+        where new.provider_url is not null
+        union all
+        select rtrim(new.image_url, replace(new.image_url, '/', '')) as prefix
+        where new.image_url is not null
+        union all
+        select rtrim(new.embed_url, replace(new.embed_url, '/', '')) as prefix
+        where new.embed_url is not null
+    )
+    where prefix not in (select prefix from url_prefix);
+
+    insert into card_encoded (
+        id, url, title, description, type, provider_name, provider_url, html, image_url,
+        embed_url, updated_at, url_prefix_id, provider_url_prefix_id,
+        image_url_prefix_id, embed_url_prefix_id
+    )
+    values (
+        new.id,
+        substr(new.url, length(rtrim(new.url, replace(new.url, '/', ''))) + 1),
+        new.title,
+        new.description,
+        new.type,
+        new.provider_name,
+        substr(new.provider_url, length(rtrim(new.provider_url, replace(new.provider_url, '/', ''))) + 1),
+        new.html,
+        substr(new.image_url, length(rtrim(new.image_url, replace(new.image_url, '/', ''))) + 1),
+        substr(new.embed_url, length(rtrim(new.embed_url, replace(new.embed_url, '/', ''))) + 1),
+        new.updated_at,
+        (select id from url_prefix where prefix = rtrim(new.url, replace(new.url, '/', ''))),
+        (select id from url_prefix where prefix = rtrim(new.provider_url, replace(new.provider_url, '/', ''))),
+        (select id from url_prefix where prefix = rtrim(new.image_url, replace(new.image_url, '/', ''))),
+        (select id from url_prefix where prefix = rtrim(new.embed_url, replace(new.embed_url, '/', '')))
+    );
+end;
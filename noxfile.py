@@ -16,3 +16,19 @@ def lint(session):
     # to see why it failed:
     #   black . --diff
     session.run("black", ".", "--check")
+
+
+@nox.session(reuse_venv=True)
+def benchmark(session):
+    # Pass options to the benchmarks after --, for example:
+    #   nox -s benchmark -- --lines 100000 --update-baselines
+    session.install(".[fast]")
+    session.run("python", "benchmarks/run_benchmarks.py", *session.posargs)
+
+
+@nox.session(reuse_venv=True)
+def query_benchmark(session):
+    # Times research queries with and without the query indexes, for example:
+    #   nox -s query_benchmark -- --lines 200000
+    session.install(".[fast]")
+    session.run("python", "benchmarks/query_benchmarks.py", *session.posargs)
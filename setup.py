@@ -5,7 +5,13 @@ import pathlib
 
 install_requires = ["click>=8.0.1"]
 
-extras_require = {"test": ["pytest", "nox"], "develop": ["nox", "flake8", "black"]}
+extras_require = {
+    "test": ["pytest", "nox"],
+    "develop": ["nox", "flake8", "black"],
+    "zstd": ["zstandard"],
+    "fast": ["orjson"],
+    "parquet": ["pyarrow"],
+}
 
 
 here = pathlib.Path(__file__).parent.resolve()
@@ -42,5 +48,12 @@ setup(
         "console_scripts": ["gab_tidy_data = gab_tidy_data.__main__:gab_tidy_data"]
     },
     include_package_data=True,
-    package_data={"gab_tidy_data": ["gab_tidy_data/gab_schema.sql"]},
+    package_data={
+        "gab_tidy_data": [
+            "gab_tidy_data/gab_schema.sql",
+            "gab_tidy_data/account_snapshots.sql",
+            "gab_tidy_data/gab_observations.sql",
+            "gab_tidy_data/url_dictionary.sql",
+        ]
+    },
 )
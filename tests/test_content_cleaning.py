@@ -0,0 +1,34 @@
+from gab_tidy_data.content_cleaning import clean_content, html_to_text
+
+
+def test_html_to_text():
+    assert html_to_text(None) is None
+    assert html_to_text("<p>Fish &amp; chips</p><p>Second<br />line</p>") == (
+        "Fish & chips\nSecond\nline"
+    )
+
+
+def test_clean_content():
+    content = (
+        '<p>Look at <a href="https://example.com/a" rel="nofollow">'
+        '<span class="invisible">https://</span><span>example.com/a</span></a> and '
+        "www.example.org/b then https://example.com/a again</p>"
+    )
+
+    text, urls, text_sans_urls = clean_content(content)
+
+    assert text == (
+        "Look at https://example.com/a and www.example.org/b then "
+        "https://example.com/a again"
+    )
+    assert urls == ["https://example.com/a", "www.example.org/b"]
+    assert text_sans_urls == "Look at and then again"
+
+
+def test_clean_content_without_urls():
+    assert clean_content("<p>No links here</p>") == (
+        "No links here",
+        [],
+        "No links here",
+    )
+    assert clean_content(None) == (None, [], None)
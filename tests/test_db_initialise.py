@@ -29,6 +29,20 @@ def test_init_empty_db(new_database_conn):
     logger.info("The database schema has been initialised")
 
 
+def test_init_storage_modes(new_database_conn):
+    gts.initialise_empty_database(new_database_conn, ["account_snapshots"])
+
+    assert gts.database_storage_modes(new_database_conn) == ["account_snapshots"]
+    assert gts.is_view(new_database_conn, "account")
+    assert not gts.is_view(new_database_conn, "gab")
+    assert new_database_conn.execute(
+        "select * from sqlite_master where name = 'account_snapshot'"
+    ).fetchall()
+
+    with pytest.raises(ValueError):
+        gts.initialise_empty_database(new_database_conn, ["no_such_mode"])
+
+
 def test_version_check(new_database_conn, monkeypatch):
     gts.initialise_empty_database(new_database_conn)
 
@@ -37,3 +51,56 @@ def test_version_check(new_database_conn, monkeypatch):
     monkeypatch.setattr(data_mapping, "schema_version", "fake_version")
 
     assert not gts.schema_is_current(new_database_conn)
+
+
+def test_bulk_load_settings(new_database_conn):
+    with gts.bulk_load(new_database_conn, new_database=True):
+        gts.initialise_empty_database(new_database_conn)
+        new_database_conn.execute("create index gab_account on gab (account_id)")
+        new_database_conn.commit()
+
+        assert new_database_conn.execute("pragma synchronous").fetchone()[0] == 0
+
+    assert new_database_conn.execute("pragma synchronous").fetchone()[0] != 0
+    assert new_database_conn.execute("pragma journal_mode").fetchone()[0] == "delete"
+    assert (
+        new_database_conn.execute("pragma page_size").fetchone()[0]
+        == gts.bulk_load_page_size
+    )
+
+    # Secondary indexes are dropped for the load, and rebuilt afterwards
+    with gts.bulk_load(new_database_conn):
+        assert not new_database_conn.execute(
+            "select * from sqlite_master where name = 'gab_account'"
+        ).fetchall()
+
+    assert new_database_conn.execute(
+        "select * from sqlite_master where name = 'gab_account'"
+    ).fetchall()
+
+    # ANALYZE has been run
+    assert new_database_conn.execute(
+        "select * from sqlite_master where name = 'sqlite_stat1'"
+    ).fetchall()
+
+
+def test_create_query_indexes(new_database_conn):
+    gts.initialise_empty_database(new_database_conn)
+
+    assert gts.create_query_indexes(new_database_conn, ["gab_tag_name"]) == [
+        "gab_tag_name"
+    ]
+    built = gts.create_query_indexes(new_database_conn)
+    assert "gab_tag_name" not in built
+    assert len(built) == len(gts.query_indexes) - 1
+    assert gts.create_query_indexes(new_database_conn) == []
+
+    query_plan = new_database_conn.execute(
+        "explain query plan select * from gab where account_id = '1'"
+    ).fetchall()
+    assert "gab_account_id" in str(query_plan)
+
+    # Query indexes are dropped during a bulk load, and rebuilt afterwards
+    with gts.bulk_load(new_database_conn):
+        assert gts.create_query_indexes(new_database_conn, ["gab_tag_name"])
+    assert gts.create_query_indexes(new_database_conn) == []
@@ -0,0 +1,197 @@
+import csv
+import json
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+
+import pytest
+
+import gab_tidy_data.gab_to_sqlite as gts
+import gab_tidy_data.export as export
+
+sample_data_directory = Path(__file__).parent.resolve() / "sample_data"
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    db_path = tmp_path / "export.db"
+    with closing(sqlite3.connect(db_path)) as db_connection:
+        gts.initialise_empty_database(db_connection)
+        for sample in sorted(sample_data_directory.glob("*.json")):
+            with open(sample, "rb") as json_fh:
+                gts.load_file_to_sqlite(json_fh, db_connection)
+        db_connection.execute(
+            "create view example_gab as select * from gab where content like 'Example%'"
+        )
+        db_connection.commit()
+
+    return db_path
+
+
+def export_to(db_path, table, output_path, export_format, **kwargs):
+    with closing(sqlite3.connect(db_path)) as db_connection:
+        return export.export_table(
+            db_connection, table, str(output_path), export_format, **kwargs
+        )
+
+
+def test_boolean_columns():
+    assert "sensitive" in export.boolean_columns["gab"]
+    assert "is_investor" in export.boolean_columns["account_unique"]
+    assert "replies_count" not in export.boolean_columns["gab"]
+
+
+def test_export_csv(db_path, tmp_path):
+    output_path = tmp_path / "gab.csv"
+    assert export_to(db_path, "gab_unique", output_path, "csv", chunk_size=2) == (
+        5,
+        False,
+    )
+
+    with open(output_path, newline="", encoding="utf-8") as csv_fh:
+        rows = list(csv.DictReader(csv_fh))
+    assert len(rows) == 5
+    assert rows[0]["id"] == "100000000000000001"
+    assert "created_at_parsed" in rows[0]
+
+    # Views are exported too
+    assert export_to(db_path, "example_gab", tmp_path / "view.csv", "csv")[0] == 5
+
+    with pytest.raises(ValueError):
+        export_to(db_path, "no_such_table", tmp_path / "missing.csv", "csv")
+
+
+def test_export_jsonl(db_path, tmp_path):
+    output_path = tmp_path / "account.jsonl"
+    export_to(db_path, "account_unique", output_path, "jsonl")
+
+    accounts = [json.loads(line) for line in output_path.read_text().splitlines()]
+    assert len(accounts) == 5
+    assert all(account["bot"] in (True, False) for account in accounts)
+
+
+def test_export_parquet(db_path, tmp_path):
+    pyarrow_parquet = pytest.importorskip("pyarrow.parquet")
+    output_path = tmp_path / "gab"
+    export_to(db_path, "gab", output_path, "parquet", chunk_size=2, rows_per_part=2)
+
+    assert len(list(output_path.glob("part-*.parquet"))) == 3
+    table = pyarrow_parquet.read_table(output_path)
+    assert table.num_rows == 5
+    assert str(table.schema.field("sensitive").type) == "bool"
+    assert str(table.schema.field("created_at_parsed").type) == "timestamp[ms, tz=UTC]"
+    assert table.column("created_at_parsed")[0].as_py().year >= 2016
+
+
+def interrupt_export(monkeypatch, db_path, table, output_path, export_format, **kwargs):
+    """Exports the table a row at a time, crashing part way through the fourth row"""
+    writer_class = {
+        "csv": export._CsvWriter,
+        "jsonl": export._JsonLinesWriter,
+        "parquet": export._ParquetWriter,
+    }[export_format]
+    write = writer_class.write
+    calls = []
+
+    def crash_on_fourth_chunk(self, rows):
+        calls.append(1)
+        if len(calls) == 4:
+            raise RuntimeError("Simulated crash")
+        write(self, rows)
+
+    monkeypatch.setattr(writer_class, "write", crash_on_fourth_chunk)
+    with pytest.raises(RuntimeError):
+        export_to(db_path, table, output_path, export_format, chunk_size=1, **kwargs)
+    monkeypatch.undo()
+
+
+@pytest.mark.parametrize(
+    "table,export_format,kwargs",
+    [
+        ("gab", "csv", {}),
+        ("account", "jsonl", {}),
+        ("gab", "parquet", {"rows_per_part": 2}),
+    ],
+)
+def test_interrupted_export_resumes(
+    db_path, tmp_path, monkeypatch, table, export_format, kwargs
+):
+    if export_format == "parquet":
+        pytest.importorskip("pyarrow")
+
+    def read_output(output_path):
+        if export_format == "parquet":
+            import pyarrow.parquet
+
+            return pyarrow.parquet.read_table(output_path).to_pylist()
+        return output_path.read_text(encoding="utf-8")
+
+    expected_path = tmp_path / f"expected.{export_format}"
+    export_to(db_path, table, expected_path, export_format, chunk_size=1, **kwargs)
+
+    output_path = tmp_path / f"resumed.{export_format}"
+    interrupt_export(monkeypatch, db_path, table, output_path, export_format, **kwargs)
+
+    # Parquet progress is only saved when a part is finished
+    expected_rows = 2 if export_format == "parquet" else 3
+    assert export.read_progress(str(output_path)).rows == expected_rows
+
+    _, resumed = export_to(
+        db_path, table, output_path, export_format, chunk_size=1, **kwargs
+    )
+
+    assert resumed
+    assert read_output(output_path) == read_output(expected_path)
+    assert export.read_progress(str(output_path)) is None
+
+
+@pytest.mark.parametrize("storage_mode", ["account_snapshots", "url_dictionary"])
+def test_interrupted_view_export(db_path, tmp_path, monkeypatch, storage_mode):
+    views_db_path = tmp_path / f"{storage_mode}.db"
+    with closing(sqlite3.connect(views_db_path)) as db_connection:
+        gts.initialise_empty_database(db_connection, [storage_mode])
+        for sample in sorted(sample_data_directory.glob("*.json")):
+            with open(sample, "rb") as json_fh:
+                gts.load_file_to_sqlite(json_fh, db_connection)
+
+        assert gts.is_view(db_connection, "account")
+        assert export.view_key_columns(db_connection, "account") == ["id", "_file_id"]
+
+    # Views made by storage modes are read in key order, so can be resumed
+    expected_path = tmp_path / "expected.csv"
+    export_to(views_db_path, "account", expected_path, "csv", chunk_size=1)
+    output_path = tmp_path / "resumed.csv"
+    interrupt_export(monkeypatch, views_db_path, "account", output_path, "csv")
+
+    _, resumed = export_to(views_db_path, "account", output_path, "csv", chunk_size=1)
+    assert resumed
+    assert output_path.read_text() == expected_path.read_text()
+
+    # Other views have no known order, so are exported again from the start
+    expected_path = tmp_path / "expected_example.csv"
+    export_to(db_path, "example_gab", expected_path, "csv", chunk_size=1)
+    output_path = tmp_path / "restarted.csv"
+    interrupt_export(monkeypatch, db_path, "example_gab", output_path, "csv")
+
+    _, resumed = export_to(db_path, "example_gab", output_path, "csv", chunk_size=1)
+    assert not resumed
+    assert output_path.read_text() == expected_path.read_text()
+    assert export.read_progress(str(output_path)) is None
+
+
+def test_export_parquet_storage_mode_view(tmp_path):
+    pyarrow_parquet = pytest.importorskip("pyarrow.parquet")
+    db_path = tmp_path / "snapshots.db"
+    with closing(sqlite3.connect(db_path)) as db_connection:
+        gts.initialise_empty_database(db_connection, ["account_snapshots"])
+        for sample in sorted(sample_data_directory.glob("*.json")):
+            with open(sample, "rb") as json_fh:
+                gts.load_file_to_sqlite(json_fh, db_connection)
+
+    # The account view computes created_at_parsed, so it has no declared type
+    output_path = tmp_path / "account"
+    export_to(db_path, "account", output_path, "parquet")
+
+    table = pyarrow_parquet.read_table(output_path)
+    assert table.num_rows == 5
+    assert str(table.schema.field("created_at_parsed").type) == "timestamp[ms, tz=UTC]"
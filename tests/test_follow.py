@@ -0,0 +1,112 @@
+import gzip
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from pathlib import Path
+
+import pytest
+
+import gab_tidy_data.gab_to_sqlite as gts
+import gab_tidy_data.gab_data_mapping as data_mapping
+from gab_tidy_data.follow import follow_files
+
+sample_data_directory = Path(__file__).parent.resolve() / "sample_data"
+
+
+@pytest.fixture
+def sample_bytes():
+    return b"".join(
+        sample.read_bytes() for sample in sorted(sample_data_directory.glob("*.json"))
+    )
+
+
+def data_tables(db_connection):
+    return {
+        table: db_connection.execute(f"select * from {table} order by rowid").fetchall()
+        for table in data_mapping.data_table_names
+    }
+
+
+def follow(db_path, paths, idle_timeout=0, **kwargs):
+    db_is_new = not db_path.exists()
+    with closing(sqlite3.connect(db_path)) as db_connection:
+        if db_is_new:
+            gts.initialise_empty_database(db_connection)
+        return follow_files(
+            [str(path) for path in paths],
+            db_connection,
+            poll_interval=0.01,
+            idle_timeout=idle_timeout,
+            **kwargs,
+        )
+
+
+def test_follow_resumes_and_waits_for_complete_lines(tmp_path, sample_bytes):
+    json_path = tmp_path / "growing.jsonl"
+    db_path = tmp_path / "follow.db"
+
+    # The last line is still being written
+    cut = sample_bytes.index(b"\n", len(sample_bytes) // 2) + 20
+    json_path.write_bytes(sample_bytes[:cut])
+    first = follow(db_path, [json_path])
+    assert first[str(json_path)] == sample_bytes[:cut].count(b"\n")
+
+    with closing(sqlite3.connect(db_path)) as db_connection:
+        assert db_connection.execute(
+            "select num_gabs_inserted is null, fingerprint is null from _inserted_files"
+        ).fetchall() == [(0, 1)]
+
+    json_path.write_bytes(sample_bytes)
+    second = follow(db_path, [json_path])
+    assert first[str(json_path)] + second[str(json_path)] == sample_bytes.count(b"\n")
+
+    # The same as loading the finished file in one go
+    with closing(sqlite3.connect(tmp_path / "load.db")) as db_connection:
+        gts.initialise_empty_database(db_connection)
+        with open(json_path, "rb") as json_fh:
+            gts.load_file_to_sqlite(json_fh, db_connection)
+        expected = data_tables(db_connection)
+
+    with closing(sqlite3.connect(db_path)) as db_connection:
+        assert data_tables(db_connection) == expected
+
+        # The finished file is recognised if loaded normally
+        with open(json_path, "rb") as json_fh:
+            assert gts.load_file_to_sqlite(json_fh, db_connection) == (0, 0)
+
+
+def test_follow_directory(tmp_path, sample_bytes):
+    directory = tmp_path / "collection"
+    directory.mkdir()
+    db_path = tmp_path / "follow.db"
+    lines = sample_bytes.splitlines(keepends=True)
+
+    def write_files():
+        for number, line in enumerate(lines):
+            with open(directory / f"part{number // 2}.jsonl", "ab") as json_fh:
+                json_fh.write(line)
+            time.sleep(0.05)
+
+    writer = threading.Thread(target=write_files)
+    writer.start()
+    try:
+        lines_loaded = follow(db_path, [directory], max_latency=0.05, idle_timeout=1)
+    finally:
+        writer.join()
+
+    assert sum(lines_loaded.values()) == len(lines)
+    assert len(lines_loaded) == (len(lines) + 1) // 2
+
+    with closing(sqlite3.connect(db_path)) as db_connection:
+        assert db_connection.execute("select count(*) from gab_unique").fetchone() == (
+            5,
+        )
+
+
+def test_follow_compressed_file(tmp_path, sample_bytes):
+    json_path = tmp_path / "compressed.jsonl"
+    json_path.write_bytes(gzip.compress(sample_bytes))
+
+    with pytest.raises(ValueError):
+        follow(tmp_path / "follow.db", [json_path])
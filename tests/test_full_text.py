@@ -0,0 +1,109 @@
+import json
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+
+import gab_tidy_data.gab_to_sqlite as gts
+import gab_tidy_data.full_text as full_text
+
+sample_data_directory = Path(__file__).parent.resolve() / "sample_data"
+sample_files = sorted(sample_data_directory.glob("*.json"))
+
+
+def load(db_connection, file_path):
+    with open(file_path, "rb") as json_fh:
+        gts.load_file_to_sqlite(json_fh, db_connection, skip_loaded=False)
+
+
+def search(db_connection, fts_table, query):
+    return sorted(
+        rowid
+        for (rowid,) in db_connection.execute(
+            f"select rowid from {fts_table} where {fts_table} match ?", [query]
+        )
+    )
+
+
+def gab_ids(db_connection, query):
+    return sorted(
+        gab_id
+        for (gab_id,) in db_connection.execute(
+            """
+            select gab_unique.id
+            from gab_fts
+            join gab_unique on gab_unique._unique_id = gab_fts.rowid
+            where gab_fts match ?
+            """,
+            [query],
+        )
+    )
+
+
+def test_full_text_index_kept_up_to_date(tmp_path):
+    with closing(sqlite3.connect(tmp_path / "fts.db")) as db_connection:
+        gts.initialise_empty_database(db_connection)
+        load(db_connection, sample_files[0])
+
+        # Filled from the rows already loaded
+        assert full_text.create_full_text_index(db_connection)
+        assert not full_text.create_full_text_index(db_connection)
+        assert gab_ids(db_connection, "elephant") == ["100000000000000001"]
+
+        # Then kept up to date by the triggers
+        for file_path in sample_files[1:]:
+            load(db_connection, file_path)
+        assert gab_ids(db_connection, "unicorn") == ["100000000000000004"]
+        assert len(search(db_connection, "account_fts", "sparrow")) == 1
+
+        # A later copy of a gab with different text replaces the old text
+        edited = json.loads(sample_files[0].read_text(encoding="utf-8").splitlines()[0])
+        edited["content"] = "Edited text about a walrus"
+        edited_path = tmp_path / "edited.jsonl"
+        edited_path.write_text(json.dumps(edited) + "\n", encoding="utf-8")
+        load(db_connection, edited_path)
+
+        assert gab_ids(db_connection, "walrus") == ["100000000000000001"]
+        assert gab_ids(db_connection, "content:elephant") == []
+
+        # Rebuilding the unique tables moves every row, and the index follows
+        gts.rebuild_unique_tables(db_connection)
+        full_text.optimize_full_text_index(db_connection)
+
+        incremental = {
+            query: search(db_connection, fts_table, query)
+            for fts_table in full_text.full_text_tables
+            for query in ["walrus", "elephant", "example", "sparrow"]
+        }
+        full_text.rebuild_full_text_index(db_connection)
+        rebuilt = {
+            query: search(db_connection, fts_table, query)
+            for fts_table in full_text.full_text_tables
+            for query in ["walrus", "elephant", "example", "sparrow"]
+        }
+        assert incremental == rebuilt
+
+        for fts_table in full_text.full_text_tables:
+            db_connection.execute(
+                f"insert into {fts_table} ({fts_table}) values ('integrity-check')"
+            )
+
+
+def test_full_text_index_survives_vacuum(tmp_path):
+    with closing(sqlite3.connect(tmp_path / "fts.db")) as db_connection:
+        gts.initialise_empty_database(db_connection)
+        for file_path in sample_files:
+            load(db_connection, file_path)
+        full_text.create_full_text_index(db_connection)
+
+        # Leave gaps in the rowids, which a vacuum could close up in tables without an
+        # integer primary key
+        db_connection.execute("delete from gab_unique where id = '100000000000000001'")
+        db_connection.commit()
+        db_connection.execute("vacuum")
+
+        assert gab_ids(db_connection, "unicorn") == ["100000000000000004"]
+        assert gab_ids(db_connection, "elephant") == []
+        for fts_table in full_text.full_text_tables:
+            db_connection.execute(
+                f"insert into {fts_table} ({fts_table}) values ('integrity-check')"
+            )
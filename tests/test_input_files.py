@@ -0,0 +1,137 @@
+import bz2
+import gzip
+import io
+import lzma
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+import gab_tidy_data.gab_to_sqlite as gts
+import gab_tidy_data.input_files as input_files
+
+sample_path = Path(__file__).parent.resolve() / "sample_data" / "sample01.json"
+
+
+def zstd_compress(data):
+    zstandard = pytest.importorskip("zstandard")
+    return zstandard.ZstdCompressor().compress(data)
+
+
+compressors = {
+    "gzip": gzip.compress,
+    "bz2": bz2.compress,
+    "xz": lzma.compress,
+    "zstd": zstd_compress,
+}
+
+
+@pytest.mark.parametrize("compression", list(compressors))
+def test_detect_and_decompress(compression):
+    data = sample_path.read_bytes()
+    compressed_fh = io.BufferedReader(io.BytesIO(compressors[compression](data)))
+
+    assert input_files.detect_compression(compressed_fh) == compression
+
+    with input_files.open_binary_input(compressed_fh) as binary_fh:
+        assert binary_fh.read() == data
+
+    # The original handle is left for the caller to close
+    assert not compressed_fh.closed
+
+
+def test_uncompressed_passthrough():
+    data = sample_path.read_bytes()
+    binary_fh = io.BytesIO(data)
+
+    assert input_files.detect_compression(binary_fh) is None
+
+    with input_files.open_input_lines(binary_fh) as lines:
+        assert list(lines) == data.splitlines(keepends=True)
+
+    assert not binary_fh.closed
+
+
+@pytest.mark.parametrize("read_size", [1, 7, 1 << 20])
+def test_iter_lines(read_size):
+    data = b'{"a": 1}\n\n{"b": 2}\r\n{"c": 3}'
+
+    lines = list(input_files.iter_lines(io.BytesIO(data), read_size=read_size))
+
+    assert lines == [b'{"a": 1}\n', b"\n", b'{"b": 2}\r\n', b'{"c": 3}']
+    assert list(input_files.iter_lines(io.BytesIO(data + b"\n"))) == lines[:-1] + [
+        b'{"c": 3}\n'
+    ]
+
+
+@pytest.mark.parametrize("name", input_files.installed_json_decoders())
+def test_json_decoders(tmp_path, name):
+    decode, decode_errors = input_files.get_json_decoder(name)
+
+    assert decode(b'{"a": [1, null, true]}\r') == {"a": [1, None, True]}
+    for invalid in [b"", b"{not json", b'"\xff"']:
+        with pytest.raises(decode_errors):
+            decode(invalid)
+
+    with sqlite3.connect(tmp_path / "decoder.db") as db_connection:
+        gts.initialise_empty_database(db_connection)
+
+        with open(sample_path, "rb") as json_fh:
+            result = gts.load_file_to_sqlite(json_fh, db_connection, json_decoder=name)
+
+        assert result == (2, 0)
+
+
+@pytest.mark.parametrize("compression", list(compressors))
+def test_load_compressed_file(tmp_path, compression):
+    compressed_path = tmp_path / "sample01.json.compressed"
+    compressed_path.write_bytes(compressors[compression](sample_path.read_bytes()))
+
+    with sqlite3.connect(tmp_path / "compressed.db") as db_connection:
+        gts.initialise_empty_database(db_connection)
+
+        with open(compressed_path, "rb") as json_fh:
+            assert gts.load_file_to_sqlite(json_fh, db_connection) == (2, 0)
+
+        filenames = db_connection.execute("select filename from _inserted_files")
+        assert filenames.fetchall() == [(compressed_path.name,)]
+
+
+@pytest.mark.parametrize("range_size", [1, 7, 1000])
+@pytest.mark.parametrize("content", [b"a\nbb\n\nccc\n", b"a\nbb\n\nccc"])
+def test_line_ranges(tmp_path, range_size, content):
+    path = tmp_path / "lines.jsonl"
+    path.write_bytes(content)
+
+    ranges = list(input_files.split_line_ranges(str(path), range_size=range_size))
+    assert ranges[0][0] == 0
+    assert ranges[-1][1] == len(content)
+    assert all(
+        end == next_start for (_, end), (next_start, _) in zip(ranges, ranges[1:])
+    )
+
+    lines = []
+    for start, end in ranges:
+        lines.extend(input_files.read_line_range(str(path), start, end))
+    assert b"".join(lines) == content
+    assert [line.rstrip(b"\n") for line in lines] == [b"a", b"bb", b"", b"ccc"]
+
+    # Starting part way through, from the start of a line
+    assert list(input_files.split_line_ranges(str(path), start=5)) == [
+        (5, len(content))
+    ]
+
+
+def test_mappable_path(tmp_path):
+    path = tmp_path / "lines.jsonl"
+    path.write_bytes(b"{}\n")
+    compressed_path = tmp_path / "lines.jsonl.gz"
+    compressed_path.write_bytes(gzip.compress(b"{}\n"))
+
+    with open(path, "rb") as binary_fh:
+        assert input_files.mappable_path(binary_fh) == str(path)
+    with open(path, "r") as text_fh:
+        assert input_files.mappable_path(text_fh) is None
+    with open(compressed_path, "rb") as binary_fh:
+        assert input_files.mappable_path(binary_fh) is None
+    assert input_files.mappable_path(io.BytesIO(b"{}\n")) is None
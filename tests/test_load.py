@@ -0,0 +1,492 @@
+import gzip
+import json
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+import gab_tidy_data.gab_to_sqlite as gts
+import gab_tidy_data.gab_data_mapping as data_mapping
+import gab_tidy_data.mapping_compiler as mapping_compiler
+from gab_tidy_data.metrics import IngestMetrics
+from gab_tidy_data.quarantine import Quarantine
+from gab_tidy_data.row_cache import WrittenRowCache
+from gab_tidy_data.synthetic_data import GeneratorSettings, generate_gabs
+
+sample_data_directory = Path(__file__).parent.resolve() / "sample_data"
+
+
+@pytest.fixture
+def sample_lines():
+    """
+    All sample gabs in one file, plus a later, edited copy of the first gab (to check
+    that the last row wins) and a line which isn't valid JSON.
+    """
+    lines = []
+    for sample in sorted(sample_data_directory.glob("*.json")):
+        lines.extend(sample.read_text(encoding="utf-8").splitlines())
+
+    edited = json.loads(lines[0])
+    edited["replies_count"] = 99
+    edited["account"]["followers_count"] = 99
+
+    return lines + ["{not json", json.dumps(edited)]
+
+
+@pytest.fixture
+def sample_file(tmp_path, sample_lines):
+    path = tmp_path / "combined.jsonl"
+    path.write_text("\n".join(sample_lines) + "\n", encoding="utf-8")
+    return path
+
+
+def load_and_dump(db_path, json_path, binary=False, **kwargs):
+    """Loads json_path into a new database, and returns the results of the load along
+    with the contents of every data table"""
+    with sqlite3.connect(db_path) as db_connection:
+        gts.initialise_empty_database(db_connection)
+
+        with (
+            open(json_path, "rb") if binary else open(json_path, "r", encoding="utf-8")
+        ) as json_fh:
+            result = gts.load_file_to_sqlite(json_fh, db_connection, **kwargs)
+
+        contents = {
+            table: db_connection.execute(f"select * from {table}").fetchall()
+            for table in data_mapping.data_table_names
+        }
+
+    return result, contents
+
+
+def test_load_counts(tmp_path, sample_file):
+    db_path = tmp_path / "load.db"
+    (added, fails), _ = load_and_dump(db_path, sample_file)
+
+    assert added == 5
+    assert fails == 1
+
+    with sqlite3.connect(db_path) as db_connection:
+        replies_count = db_connection.execute(
+            "select replies_count from gab where id = '100000000000000001'"
+        ).fetchall()
+
+    assert replies_count == [(99,)]
+
+
+@pytest.mark.parametrize("workers,chunk_size", [(2, 1), (3, 2)])
+def test_parallel_load_matches_serial(tmp_path, sample_file, workers, chunk_size):
+    serial = load_and_dump(tmp_path / "serial.db", sample_file)
+    parallel = load_and_dump(
+        tmp_path / "parallel.db", sample_file, workers=workers, chunk_size=chunk_size
+    )
+
+    assert parallel == serial
+
+
+@pytest.mark.parametrize("range_size", [1, 1000, 1 << 22])
+def test_byte_range_load_matches_serial(tmp_path, sample_file, range_size):
+    serial = load_and_dump(tmp_path / "serial.db", sample_file)
+    parallel = load_and_dump(
+        tmp_path / "ranges.db",
+        sample_file,
+        binary=True,
+        workers=2,
+        range_size=range_size,
+        checkpoint_every=2,
+    )
+
+    assert parallel == serial
+
+    with sqlite3.connect(tmp_path / "ranges.db") as db_connection:
+        lines_read, bytes_read = db_connection.execute(
+            "select lines_read, bytes_read from _inserted_files"
+        ).fetchone()
+    assert lines_read == len(sample_file.read_bytes().splitlines())
+    assert bytes_read == sample_file.stat().st_size
+
+
+@pytest.mark.parametrize("binary", [True, False])
+@pytest.mark.parametrize("final_newline", [True, False])
+def test_bytes_read(tmp_path, sample_lines, binary, final_newline):
+    path = tmp_path / "bytes.jsonl"
+    path.write_bytes(
+        "\n".join(sample_lines + ["é"]).encode("utf-8")
+        + (b"\n" if final_newline else b"")
+    )
+
+    metrics = IngestMetrics()
+    load_and_dump(tmp_path / "bytes.db", path, binary=binary, metrics=metrics)
+
+    assert metrics.bytes_read == path.stat().st_size
+
+
+@pytest.mark.parametrize("batch_size", [1, 2, 1000])
+def test_batch_size_does_not_change_result(tmp_path, sample_file, batch_size):
+    unbatched = load_and_dump(tmp_path / "unbatched.db", sample_file, batch_size=1)
+    batched = load_and_dump(tmp_path / "batched.db", sample_file, batch_size=batch_size)
+
+    assert batched == unbatched
+
+
+def test_insert_buffer_flushes_in_table_order():
+    statements = []
+
+    class RecordingCursor:
+        def executemany(self, sql, rows):
+            statements.append(sql)
+
+    insert_buffer = gts.InsertBuffer(RecordingCursor(), batch_size=2)
+    rows = {table: [()] for table in reversed(data_mapping.data_table_names)}
+
+    insert_buffer.add(rows)
+    assert statements == []
+
+    insert_buffer.add(rows)
+    expected = []
+    for table in data_mapping.data_table_names:
+        expected.append(mapping_compiler.insert_sql[table])
+        if table in data_mapping.unique_table_names:
+            expected.append(mapping_compiler.unique_insert_sql[table])
+    assert statements == expected
+
+
+def test_row_cache_does_not_change_result(tmp_path, sample_file):
+    def load_twice(db_path, row_cache):
+        with sqlite3.connect(db_path) as db_connection:
+            gts.initialise_empty_database(db_connection)
+
+            for _ in range(2):
+                with open(sample_file, "rb") as json_fh:
+                    gts.load_file_to_sqlite(json_fh, db_connection, row_cache=row_cache)
+
+            return {
+                table: db_connection.execute(f"select * from {table}").fetchall()
+                for table in data_mapping.data_table_names
+            }
+
+    row_cache = WrittenRowCache()
+    cached = load_twice(tmp_path / "cached.db", row_cache)
+    uncached = load_twice(tmp_path / "uncached.db", WrittenRowCache(max_size=0))
+
+    assert cached == uncached
+    assert row_cache.stats()["card"][0] > 0
+
+
+def test_loaded_file_skipped(tmp_path, sample_file):
+    with sqlite3.connect(tmp_path / "skip.db") as db_connection:
+        gts.initialise_empty_database(db_connection)
+
+        with open(sample_file, "rb") as json_fh:
+            assert gts.load_file_to_sqlite(json_fh, db_connection) == (5, 1)
+        with open(sample_file, "rb") as json_fh:
+            assert gts.load_file_to_sqlite(json_fh, db_connection) == (0, 0)
+
+        assert len(gts.fetch_db_contents(db_connection)) == 1
+
+        with open(sample_file, "rb") as json_fh:
+            result = gts.load_file_to_sqlite(json_fh, db_connection, skip_loaded=False)
+        assert result == (5, 1)
+
+        assert len(gts.fetch_db_contents(db_connection)) == 2
+
+
+def test_interrupted_load_resumes(tmp_path, sample_file, monkeypatch):
+    _, expected = load_and_dump(tmp_path / "expected.db", sample_file)
+
+    map_gab_into = mapping_compiler.map_gab_into
+    calls = []
+
+    def crash_on_fifth_gab(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 5:
+            raise RuntimeError("Simulated crash")
+        map_gab_into(*args, **kwargs)
+
+    with sqlite3.connect(tmp_path / "resumed.db") as db_connection:
+        gts.initialise_empty_database(db_connection)
+
+        monkeypatch.setattr(mapping_compiler, "map_gab_into", crash_on_fifth_gab)
+        with open(sample_file, "rb") as json_fh:
+            with pytest.raises(RuntimeError):
+                gts.load_file_to_sqlite(
+                    json_fh, db_connection, chunk_size=1, checkpoint_every=2
+                )
+        db_connection.rollback()
+        monkeypatch.undo()
+
+        # The first four lines were checkpointed, but the file isn't finished
+        assert db_connection.execute(
+            "select num_gabs_inserted, lines_read from _inserted_files"
+        ).fetchall() == [(None, 4)]
+
+        with open(sample_file, "rb") as json_fh:
+            result = gts.load_file_to_sqlite(json_fh, db_connection, chunk_size=1)
+
+        assert result == (5, 1)
+        assert len(gts.fetch_db_contents(db_connection)) == 1
+
+        resumed = {
+            table: db_connection.execute(f"select * from {table}").fetchall()
+            for table in data_mapping.data_table_names
+        }
+
+    assert resumed == expected
+
+
+@pytest.mark.parametrize(
+    "interval,checkpointed_lines",
+    [
+        ({"checkpoint_every": 3}, [3, 6]),
+        ({"checkpoint_every_bytes": 1}, [1, 2, 3, 4, 5, 6, 7]),
+        ({"checkpoint_every_bytes": 1 << 20}, []),
+    ],
+)
+def test_checkpoint_intervals(
+    tmp_path, sample_file, monkeypatch, interval, checkpointed_lines
+):
+    db_path = tmp_path / "checkpoints.db"
+    checkpoint = gts._checkpoint
+    seen_by_readers = []
+
+    def checkpoint_and_read(*args):
+        checkpoint(*args)
+        # Other connections see what has been committed, but not yet as a finished file
+        with sqlite3.connect(db_path) as reader:
+            seen_by_readers.append(
+                reader.execute(
+                    "select num_gabs_inserted, lines_read from _inserted_files"
+                ).fetchone()
+            )
+
+    monkeypatch.setattr(gts, "_checkpoint", checkpoint_and_read)
+    result, contents = load_and_dump(
+        db_path,
+        sample_file,
+        binary=True,
+        chunk_size=1,
+        **{"checkpoint_every": None, **interval},
+    )
+
+    assert result == (5, 1)
+    assert seen_by_readers == [(None, lines) for lines in checkpointed_lines]
+    assert contents == load_and_dump(tmp_path / "end.db", sample_file)[1]
+
+
+def test_unresumable_input_committed_at_end(tmp_path, sample_file, monkeypatch):
+    map_gab_into = mapping_compiler.map_gab_into
+    calls = []
+
+    def crash_on_fifth_gab(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 5:
+            raise RuntimeError("Simulated crash")
+        map_gab_into(*args, **kwargs)
+
+    monkeypatch.setattr(mapping_compiler, "map_gab_into", crash_on_fifth_gab)
+    with sqlite3.connect(tmp_path / "text.db") as db_connection:
+        gts.initialise_empty_database(db_connection)
+
+        # Text mode input has no fingerprint, so can't be resumed
+        with open(sample_file, "r", encoding="utf-8") as json_fh:
+            with pytest.raises(RuntimeError):
+                gts.load_file_to_sqlite(
+                    json_fh, db_connection, chunk_size=1, checkpoint_every=2
+                )
+        db_connection.rollback()
+
+        # Nothing was committed, so loading it again doesn't duplicate any rows
+        for table in ["_inserted_files", "gab"]:
+            count = db_connection.execute(f"select count(*) from {table}").fetchone()
+            assert count == (0,)
+
+
+@pytest.fixture
+def repeated_embedded_file(tmp_path):
+    """
+    Generated gabs, many quoting the same recent gabs, with some copies of the quoted
+    gabs changed, and some lines reblogging earlier gabs
+    """
+    settings = GeneratorSettings(quote_rate=0.6, num_groups=5, num_cards=5)
+    gabs = list(generate_gabs(200, settings=settings))
+    lines = []
+    for number, gab in enumerate(gabs):
+        if number % 5 == 4:
+            gab = {**gab, "id": str(900_000_000_000_000_000 + number)}
+            gab["reblog"] = gabs[number - 3 - number % 3]
+        elif number % 7 == 0 and gab["quote"] is not None:
+            gab = {**gab, "quote": {**gab["quote"], "favourites_count": number}}
+        lines.append(json.dumps(gab))
+
+    path = tmp_path / "repeated.jsonl"
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return path
+
+
+def test_repeated_embedded_gabs_match_serial(
+    tmp_path, repeated_embedded_file, monkeypatch
+):
+    expected = load_and_dump(tmp_path / "expected.db", repeated_embedded_file)
+
+    serial_chunks = load_and_dump(
+        tmp_path / "serial.db", repeated_embedded_file, chunk_size=7
+    )
+    parallel = load_and_dump(
+        tmp_path / "parallel.db", repeated_embedded_file, workers=3, chunk_size=7
+    )
+    byte_ranges = load_and_dump(
+        tmp_path / "ranges.db",
+        repeated_embedded_file,
+        binary=True,
+        workers=3,
+        range_size=5000,
+    )
+    assert serial_chunks == expected
+    assert parallel == expected
+    assert byte_ranges == expected
+
+    # Interrupted part way through a file, then resumed
+    map_gab_into = mapping_compiler.map_gab_into
+    calls = []
+
+    def crash_on_gab_150(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 150:
+            raise RuntimeError("Simulated crash")
+        map_gab_into(*args, **kwargs)
+
+    with sqlite3.connect(tmp_path / "resumed.db") as db_connection:
+        gts.initialise_empty_database(db_connection)
+
+        monkeypatch.setattr(mapping_compiler, "map_gab_into", crash_on_gab_150)
+        with open(repeated_embedded_file, "rb") as json_fh:
+            with pytest.raises(RuntimeError):
+                gts.load_file_to_sqlite(
+                    json_fh, db_connection, chunk_size=7, checkpoint_every=60
+                )
+        db_connection.rollback()
+        monkeypatch.undo()
+
+        with open(repeated_embedded_file, "rb") as json_fh:
+            gts.load_file_to_sqlite(json_fh, db_connection, chunk_size=7)
+
+        resumed = {
+            table: db_connection.execute(f"select * from {table}").fetchall()
+            for table in data_mapping.data_table_names
+        }
+
+    # Reference rows the row cache skipped before the crash are written again when the
+    # load is resumed (its cache starts empty), so only the order of rows can differ
+    def sorted_rows(tables):
+        return {table: sorted(rows, key=repr) for table, rows in tables.items()}
+
+    assert sorted_rows(resumed) == sorted_rows(expected[1])
+
+
+@pytest.fixture
+def file_with_bad_lines(tmp_path, sample_lines):
+    """
+    The sample lines, plus a gab whose account is missing a field, quoting a gab which
+    is quoted again by a later gab, and a line of JSON which isn't a gab
+    """
+    quoted = json.loads(sample_lines[1])
+    quoted["id"] = "200000000000000001"
+
+    broken = json.loads(sample_lines[2])
+    broken["id"] = "200000000000000002"
+    broken["quote"] = quoted
+    del broken["account"]["is_investor"]
+
+    quoting = json.loads(sample_lines[3])
+    quoting["id"] = "200000000000000003"
+    quoting["quote"] = quoted
+
+    lines = sample_lines + [json.dumps(broken), json.dumps(quoting), "[1, 2]"]
+    path = tmp_path / "bad_lines.jsonl"
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return path
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_bad_lines_quarantined(tmp_path, file_with_bad_lines, workers):
+    quarantine_path = tmp_path / "quarantine.jsonl.gz"
+    with Quarantine(str(quarantine_path)) as quarantine:
+        result, contents = load_and_dump(
+            tmp_path / "quarantine.db",
+            file_with_bad_lines,
+            binary=True,
+            workers=workers,
+            chunk_size=2,
+            range_size=1,
+            quarantine=quarantine,
+        )
+
+    assert result == (7, 3)
+
+    # Nothing from the gab which failed to map is loaded, but the gab it quotes is,
+    # from the later gab quoting it
+    gab_ids = [row[0] for row in contents["gab"]]
+    assert "200000000000000002" not in gab_ids
+    assert gab_ids.count("200000000000000001") == 1
+
+    with sqlite3.connect(tmp_path / "quarantine.db") as db_connection:
+        assert db_connection.execute(
+            "select num_parsing_failures, num_mapping_failures from _inserted_files"
+        ).fetchall() == [(1, 2)]
+
+    with gzip.open(quarantine_path, "rt", encoding="utf-8") as quarantine_fh:
+        records = [json.loads(line) for line in quarantine_fh]
+
+    assert [
+        (record["line"], record["stage"], record["error"]) for record in records
+    ] == [
+        (6, "parse", records[0]["error"]),
+        (8, "map", "KeyError: 'is_investor'"),
+        (10, "map", records[2]["error"]),
+    ]
+    assert records[0]["content"] == "{not json"
+    assert records[2]["content"] == "[1, 2]"
+    assert all(record["file"] == "bad_lines.jsonl" for record in records)
+
+
+def test_unique_tables(tmp_path, sample_file):
+    with sqlite3.connect(tmp_path / "unique.db") as db_connection:
+        gts.initialise_empty_database(db_connection)
+
+        for reload in [False, True]:
+            with open(sample_file, "rb") as json_fh:
+                gts.load_file_to_sqlite(json_fh, db_connection, skip_loaded=not reload)
+
+        def select_columns(table):
+            return ", ".join(
+                gts.unique_table_columns(
+                    db_connection, data_mapping.unique_table_names[table]
+                )
+            )
+
+        def unique_contents():
+            return {
+                unique_table: db_connection.execute(
+                    f"select {select_columns(table)} from {unique_table} order by id"
+                ).fetchall()
+                for table, unique_table in data_mapping.unique_table_names.items()
+            }
+
+        # One row per id, from the latest file, and the last row within that file
+        loaded = unique_contents()
+        for table, unique_table in data_mapping.unique_table_names.items():
+            assert (
+                loaded[unique_table]
+                == db_connection.execute(
+                    f"select {select_columns(table)} from {table} "
+                    "where _file_id = 2 order by id"
+                ).fetchall()
+            )
+        assert db_connection.execute(
+            "select replies_count from gab_unique where id = '100000000000000001'"
+        ).fetchall() == [(99,)]
+
+        # Rebuilding gives the same rows
+        db_connection.execute("delete from gab_unique")
+        gts.rebuild_unique_tables(db_connection)
+        assert unique_contents() == loaded
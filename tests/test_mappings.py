@@ -1,4 +1,11 @@
+import json
+import re
+from pathlib import Path
+
+import pytest
+
 import gab_tidy_data.gab_data_mapping as data_mapping
+import gab_tidy_data.mapping_compiler as mapping_compiler
 from importlib.resources import open_text
 
 
@@ -21,3 +28,204 @@ def test_schema_version_match():
 
     # Does the SQL version match the version in the mapping file?
     assert sql_version == data_mapping.schema_version
+
+
+sample_data_directory = Path(__file__).parent.resolve() / "sample_data"
+
+
+def rich_gab():
+    """
+    A sample gab with every kind of embedded entity filled in: account fields and emoji,
+    a group with a category and tags, media, mentions, emoji, a card, and a quoted gab.
+    """
+    with open(sample_data_directory / "sample01.json", encoding="utf-8") as json_fh:
+        gab, other_gab = [json.loads(line) for line in json_fh]
+    with open(sample_data_directory / "sample02.json", encoding="utf-8") as json_fh:
+        quoted_gab = json.loads(json_fh.readline())
+
+    emoji = {
+        "shortcode": "smile",
+        "url": "https://example.com/smile.png",
+        "static_url": "https://example.com/smile_static.png",
+    }
+    gab["account"]["emojis"] = [emoji]
+    gab["account"]["fields"] = [
+        {"name": "web", "value": "example.com", "verified_at": None},
+        {"name": "city", "value": "Brisbane", "verified_at": "2021-01-01T00:00:00Z"},
+    ]
+    gab["group"] = {
+        "id": "7",
+        "title": "Example group",
+        "description": "A group",
+        "description_html": "<p>A group</p>",
+        "cover_image_url": "https://example.com/cover.png",
+        "is_archived": False,
+        "member_count": 12,
+        "created_at": "2019-01-01T00:00:00.000Z",
+        "is_private": False,
+        "is_visible": True,
+        "slug": "example-group",
+        "url": "https://example.com/groups/7",
+        "has_password": False,
+        "group_category": {
+            "id": 3,
+            "created_at": "2019-01-01T00:00:00.000Z",
+            "updated_at": "2019-01-01T00:00:00.000Z",
+            "text": "News",
+        },
+        "tags": ["news", "example"],
+    }
+    gab["media_attachments"] = [
+        {
+            "id": "m1",
+            "type": "image",
+            "url": "https://example.com/m1.png",
+            "preview_url": "https://example.com/m1_small.png",
+            "source_mp4": None,
+            "remote_url": None,
+            "text_url": None,
+            "description": None,
+            "blurhash": "abc",
+            "file_content_type": "image/png",
+        }
+    ]
+    gab["mentions"] = [
+        {
+            "id": other_gab["account"]["id"],
+            "url": other_gab["account"]["url"],
+            "acct": other_gab["account"]["acct"],
+        }
+    ]
+    gab["emojis"] = [emoji]
+    gab["content"] = (
+        '<p>Read this: <a href="https://example.com/story">https://example.com/story'
+        "</a></p>"
+    )
+    gab["quote_of_id"] = quoted_gab["id"]
+    gab["has_quote"] = True
+    gab["quote"] = quoted_gab
+
+    return gab
+
+
+def as_tuples(reference_mappings):
+    return {
+        table: [
+            tuple(row[column] for column in mapping_compiler.columns[table])
+            for row in rows
+        ]
+        for table, rows in reference_mappings.items()
+    }
+
+
+def test_column_mappings_match_insert_sql():
+    for table in data_mapping.data_table_names:
+        named_parameters = re.findall(r":(\w+)", data_mapping.insert_sql[table])
+        assert mapping_compiler.columns[table] == named_parameters
+
+
+@pytest.mark.parametrize("clean_content", [False, True])
+def test_compiled_mapping_matches_reference(clean_content):
+    gabs = [rich_gab()]
+    for sample in sorted(sample_data_directory.glob("*.json")):
+        with open(sample, encoding="utf-8") as json_fh:
+            gabs.extend(json.loads(line) for line in json_fh)
+
+    for gab in gabs:
+        reference = as_tuples(
+            data_mapping.map_gab_for_insert(1, gab, clean_content=clean_content)
+        )
+
+        compiled = mapping_compiler.empty_rows()
+        mapping_compiler.map_gab_into(compiled, 1, gab, clean_content=clean_content)
+
+        assert compiled == reference
+
+    # Make sure the rich gab really does exercise every table
+    rich_mappings = data_mapping.map_gab_for_insert(1, gabs[0], clean_content=True)
+    assert all(as_tuples(rich_mappings).values())
+
+
+def sample_gabs():
+    with open(sample_data_directory / "sample02.json", encoding="utf-8") as json_fh:
+        return [json.loads(line) for line in json_fh]
+
+
+def test_reblog_mapped_as_embedded_gab():
+    gab, reblogged_gab = sample_gabs()
+    gab["reblog"] = reblogged_gab
+
+    reference = as_tuples(data_mapping.map_gab_for_insert(1, gab))
+    compiled = mapping_compiler.empty_rows()
+    mapping_compiler.map_gab_into(compiled, 1, gab)
+    assert compiled == reference
+
+    gab_columns = mapping_compiler.columns["gab"]
+    id_column = gab_columns.index("id")
+    reblog_column = gab_columns.index("reblog")
+    embedded_column = gab_columns.index("_embedded_gab")
+
+    # The reblogged gab comes first, as an embedded gab
+    assert [row[id_column] for row in compiled["gab"]] == [
+        reblogged_gab["id"],
+        gab["id"],
+    ]
+    assert [row[embedded_column] for row in compiled["gab"]] == [True, False]
+    assert compiled["gab"][1][reblog_column] == reblogged_gab["id"]
+
+
+def test_deeply_embedded_gabs():
+    # Deeper than Python's default recursion limit
+    depth = 2000
+    template = sample_gabs()[0]
+    gab = None
+    for i in range(depth):
+        gab = {**template, "id": str(i), "quote": gab, "reblog": None}
+
+    reference = as_tuples(data_mapping.map_gab_for_insert(1, gab))
+    compiled = mapping_compiler.empty_rows()
+    mapping_compiler.map_gab_into(compiled, 1, gab)
+
+    assert compiled == reference
+    assert [row[0] for row in compiled["gab"]] == [str(i) for i in range(depth)]
+
+
+def test_memo_reuses_embedded_gab_rows(monkeypatch):
+    quoted_gab, other_gab = sample_gabs()
+    # Quoted gab quoting another gab, to check nested gabs are reused with it
+    quoted_gab = {**quoted_gab, "quote": {**other_gab, "id": "3"}}
+    first = {**other_gab, "id": "1", "quote": quoted_gab}
+    second = {**other_gab, "id": "2", "quote": json.loads(json.dumps(quoted_gab))}
+    edited = {**other_gab, "id": "4", "quote": {**quoted_gab, "replies_count": 99}}
+    gabs = [first, second, quoted_gab, edited]
+
+    reference = mapping_compiler.empty_rows()
+    for gab in gabs:
+        mapping_compiler.map_gab_into(reference, 1, gab)
+
+    map_single_gab_into = mapping_compiler._map_single_gab_into
+    mapped_ids = []
+
+    def record_mapped_id(rows, file_id, gab_json, *args):
+        mapped_ids.append(gab_json["id"])
+        map_single_gab_into(rows, file_id, gab_json, *args)
+
+    monkeypatch.setattr(mapping_compiler, "_map_single_gab_into", record_mapped_id)
+    memo = data_mapping.MappedGabMemo()
+    rows = mapping_compiler.empty_rows()
+    for gab in gabs:
+        mapping_compiler.map_gab_into(rows, 1, gab, memo=memo)
+
+    # The same rows as without the memo, but an identical copy of an embedded gab (and
+    # the gab embedded in it) is only mapped once. Gabs which aren't embedded, and
+    # copies which differ, are still mapped.
+    assert rows == reference
+    quoted_id = quoted_gab["id"]
+    assert mapped_ids == ["3", quoted_id, "1", "2", quoted_id, quoted_id, "4"]
+
+    # Only up to max_size gabs are remembered
+    memo = data_mapping.MappedGabMemo(max_size=1)
+    memo.add(first, {})
+    memo.add(second, {})
+    assert memo.get(first) is None
+    assert memo.get(second) == {}
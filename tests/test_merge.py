@@ -0,0 +1,209 @@
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+
+import pytest
+
+import gab_tidy_data.gab_to_sqlite as gts
+import gab_tidy_data.gab_data_mapping as data_mapping
+from gab_tidy_data.merge import merge_database
+from gab_tidy_data.metrics import IngestMetrics
+from gab_tidy_data.shards import load_files_sharded, split_into_shards
+
+sample_data_directory = Path(__file__).parent.resolve() / "sample_data"
+sample_files = sorted(sample_data_directory.glob("*.json"))
+
+
+def load_files(db_path, file_paths, storage_modes=(), skip_loaded=True):
+    with closing(sqlite3.connect(db_path)) as db_connection:
+        gts.initialise_empty_database(db_connection, storage_modes)
+        for file_path in file_paths:
+            with open(file_path, "rb") as json_fh:
+                gts.load_file_to_sqlite(json_fh, db_connection, skip_loaded=skip_loaded)
+
+
+def dump(db_path):
+    """Contents of every table, apart from load times"""
+    with closing(sqlite3.connect(db_path)) as db_connection:
+        contents = {
+            # Sorted, as views have no rowid order
+            table: sorted(
+                db_connection.execute(f"select * from {table}").fetchall(),
+                key=repr,
+            )
+            for table in data_mapping.data_table_names
+            + list(data_mapping.unique_table_names.values())
+        }
+        contents["_inserted_files"] = db_connection.execute(
+            """
+            select id, filename, num_gabs_inserted, num_parsing_failures, file_size,
+                fingerprint, lines_read, bytes_read
+            from _inserted_files
+            """
+        ).fetchall()
+
+    return contents
+
+
+def test_merge_matches_loading_together(tmp_path):
+    load_files(tmp_path / "together.db", sample_files)
+    load_files(tmp_path / "first.db", sample_files[:2])
+    load_files(tmp_path / "second.db", sample_files[2:] + sample_files[:1])
+
+    # The first file is in both databases, so is only merged once
+    load_files(tmp_path / "merged.db", [])
+    with closing(sqlite3.connect(tmp_path / "merged.db")) as db_connection:
+        assert merge_database(db_connection, str(tmp_path / "first.db")) == 2
+        assert merge_database(db_connection, str(tmp_path / "second.db")) == 1
+
+    assert dump(tmp_path / "merged.db") == dump(tmp_path / "together.db")
+
+    # Unless it's merged anyway, as if it had been reloaded
+    load_files(tmp_path / "merged_all.db", [])
+    with closing(sqlite3.connect(tmp_path / "merged_all.db")) as db_connection:
+        for source in ["first.db", "second.db"]:
+            merge_database(db_connection, str(tmp_path / source), skip_loaded=False)
+
+    load_files(tmp_path / "reloaded.db", [])
+    with closing(sqlite3.connect(tmp_path / "reloaded.db")) as db_connection:
+        for file_path in sample_files + sample_files[:1]:
+            with open(file_path, "rb") as json_fh:
+                gts.load_file_to_sqlite(json_fh, db_connection, skip_loaded=False)
+
+    assert dump(tmp_path / "merged_all.db") == dump(tmp_path / "reloaded.db")
+
+
+# Table replaced by each storage mode: (view, table storing each version once)
+storage_mode_tables = {
+    "account_snapshots": ("account", "account_snapshot"),
+    "gab_observations": ("gab", "gab_post"),
+}
+
+
+@pytest.mark.parametrize(
+    "storage_modes",
+    [
+        ["account_snapshots"],
+        ["gab_observations"],
+        ["url_dictionary"],
+        ["account_snapshots", "gab_observations"],
+        ["gab_observations", "url_dictionary"],
+    ],
+)
+def test_storage_modes(tmp_path, storage_modes):
+    # Each file loaded twice, so every account and gab is seen again unchanged
+    reloaded_files = sample_files + sample_files
+    load_files(tmp_path / "default.db", reloaded_files, skip_loaded=False)
+    load_files(
+        tmp_path / "modes.db",
+        reloaded_files,
+        storage_modes=storage_modes,
+        skip_loaded=False,
+    )
+
+    assert dump(tmp_path / "modes.db") == dump(tmp_path / "default.db")
+
+    with closing(sqlite3.connect(tmp_path / "modes.db")) as db_connection:
+        assert gts.database_storage_modes(db_connection) == storage_modes
+        for mode in set(storage_modes) & set(storage_mode_tables):
+            view, table = storage_mode_tables[mode]
+            num_rows = db_connection.execute(f"select count(*) from {view}").fetchone()
+            num_stored = db_connection.execute(
+                f"select count(*) from {table}"
+            ).fetchone()
+            assert num_stored[0] * 2 == num_rows[0]
+
+        gts.rebuild_unique_tables(db_connection)
+        assert gts.create_query_indexes(db_connection)
+    assert dump(tmp_path / "modes.db") == dump(tmp_path / "default.db")
+
+
+@pytest.mark.parametrize(
+    "source_modes,target_modes",
+    [
+        ((), ["account_snapshots", "gab_observations"]),
+        (["account_snapshots", "gab_observations"], ()),
+        ((), ["url_dictionary"]),
+        (["url_dictionary"], ["account_snapshots"]),
+    ],
+)
+def test_merge_between_storage_modes(tmp_path, source_modes, target_modes):
+    load_files(tmp_path / "together.db", sample_files)
+    load_files(tmp_path / "first.db", sample_files[:2], storage_modes=source_modes)
+    load_files(tmp_path / "second.db", sample_files[2:], storage_modes=source_modes)
+
+    load_files(tmp_path / "merged.db", [], storage_modes=target_modes)
+    with closing(sqlite3.connect(tmp_path / "merged.db")) as db_connection:
+        for source in ["first.db", "second.db"]:
+            merge_database(db_connection, str(tmp_path / source))
+        # Also merge the first file again, so the skipped file path is used
+        merge_database(db_connection, str(tmp_path / "first.db"))
+
+    assert dump(tmp_path / "merged.db") == dump(tmp_path / "together.db")
+
+
+def test_merge_checks_schema_version(tmp_path):
+    load_files(tmp_path / "old.db", sample_files[:1])
+    with closing(sqlite3.connect(tmp_path / "old.db")) as db_connection:
+        db_connection.execute(
+            "update _gab_tidy_data set metadata_value = 'old' "
+            "where metadata_key = 'schema_version'"
+        )
+        db_connection.commit()
+
+    load_files(tmp_path / "merged.db", [])
+    with closing(sqlite3.connect(tmp_path / "merged.db")) as db_connection:
+        with pytest.raises(ValueError):
+            merge_database(db_connection, str(tmp_path / "old.db"))
+
+
+@pytest.mark.parametrize("num_shards", [1, 2, 3, 5])
+def test_split_into_shards(num_shards):
+    shards = split_into_shards([str(path) for path in sample_files], num_shards)
+
+    assert 1 <= len(shards) <= num_shards
+    assert [path for shard in shards for path in shard] == [
+        str(path) for path in sample_files
+    ]
+
+
+@pytest.mark.parametrize("num_shards", [2, 3])
+def test_sharded_load_matches_serial(tmp_path, num_shards):
+    load_files(tmp_path / "serial.db", sample_files)
+    load_files(tmp_path / "sharded.db", [])
+
+    metrics = IngestMetrics()
+    with closing(sqlite3.connect(tmp_path / "sharded.db")) as db_connection:
+        results = load_files_sharded(
+            [str(path) for path in sample_files],
+            db_connection,
+            num_shards,
+            shard_directory=str(tmp_path),
+            metrics=metrics,
+        )
+
+    assert [filename for filename, _, _ in results] == [
+        str(path) for path in sample_files
+    ]
+    assert dump(tmp_path / "sharded.db") == dump(tmp_path / "serial.db")
+    assert metrics.files == len(sample_files)
+    assert list(tmp_path.glob("tmp*")) == []
+
+
+def test_sharded_load_skips_repeated_files(tmp_path):
+    # The same contents under two names, in different shards
+    copy_path = tmp_path / "copy.json"
+    copy_path.write_bytes(sample_files[0].read_bytes())
+    file_paths = [str(path) for path in sample_files] + [str(copy_path)]
+
+    load_files(tmp_path / "serial.db", file_paths)
+    load_files(tmp_path / "sharded.db", [])
+
+    with closing(sqlite3.connect(tmp_path / "sharded.db")) as db_connection:
+        results = load_files_sharded(
+            file_paths, db_connection, 2, shard_directory=str(tmp_path)
+        )
+
+    assert [filename for filename, _, _ in results] == file_paths
+    assert results[-1] == (str(copy_path), 0, 0)
+    assert dump(tmp_path / "sharded.db") == dump(tmp_path / "serial.db")
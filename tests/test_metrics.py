@@ -0,0 +1,83 @@
+import io
+import json
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+import gab_tidy_data.gab_to_sqlite as gts
+from gab_tidy_data.metrics import IngestMetrics, ProgressReporter
+
+sample_data_directory = Path(__file__).parent.resolve() / "sample_data"
+
+
+@pytest.fixture
+def sample_file(tmp_path):
+    lines = []
+    for sample in sorted(sample_data_directory.glob("*.json")):
+        lines.extend(sample.read_text(encoding="utf-8").splitlines())
+
+    path = tmp_path / "combined.jsonl"
+    path.write_text("\n".join(lines + ["{not json"]) + "\n", encoding="utf-8")
+    return path
+
+
+def load_with_metrics(tmp_path, json_path, metrics, **kwargs):
+    with sqlite3.connect(tmp_path / "metrics.db") as db_connection:
+        gts.initialise_empty_database(db_connection)
+
+        with open(json_path, "rb") as json_fh:
+            return gts.load_file_to_sqlite(
+                json_fh, db_connection, metrics=metrics, **kwargs
+            )
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_load_metrics(tmp_path, sample_file, workers):
+    metrics = IngestMetrics(profile=True)
+    added, fails = load_with_metrics(tmp_path, sample_file, metrics, workers=workers)
+
+    num_lines = len(sample_file.read_bytes().splitlines())
+
+    results = metrics.as_dict()
+    assert results["files"] == 1
+    assert results["lines_read"] == num_lines
+    assert results["bytes_read"] == sample_file.stat().st_size
+    assert results["parsing_failures"] == fails == 1
+    assert results["gabs_mapped"] == num_lines - 1
+    assert set(results["stages"]) >= {"read", "decode", "map", "insert", "commit"}
+    assert results["stages"]["decode"]["count"] == num_lines
+    assert results["tables"]["gab"]["rows"] == added
+
+    # Written out as plain JSON
+    metrics_path = tmp_path / "metrics.json"
+    metrics.write_json(metrics_path)
+    assert json.loads(metrics_path.read_text())["lines_read"] == num_lines
+
+
+def test_decode_and_map_timed_together_without_profile(tmp_path, sample_file):
+    metrics = IngestMetrics()
+    load_with_metrics(tmp_path, sample_file, metrics)
+
+    stages = metrics.as_dict()["stages"]
+    assert "decode_and_map" in stages
+    assert "decode" not in stages
+
+
+def test_progress_reporter():
+    stream = io.StringIO()
+    reporter = ProgressReporter(
+        "test.jsonl", total_bytes=1000, stream=stream, interval=3600
+    )
+
+    reporter.update(10, 250)
+    assert "test.jsonl: 10 lines" in stream.getvalue()
+    assert "25.0%" in stream.getvalue()
+    assert "ETA" in stream.getvalue()
+
+    # Updates are only shown once per interval, apart from the final one
+    reporter.update(20, 500)
+    assert "20 lines" not in stream.getvalue()
+    reporter.update(40, 1000, final=True)
+    assert stream.getvalue().endswith("\n")
+    assert "100.0%" in stream.getvalue()
@@ -1,8 +1,11 @@
 import pytest
 from click.testing import CliRunner
 from gab_tidy_data.__main__ import gab_tidy_data as cli_main
+import gab_tidy_data.gab_to_sqlite as gts
 from pathlib import Path
 import sqlite3
+import gzip
+import json
 
 
 # Sample json files
@@ -47,3 +50,408 @@ def test_cli(tmp_path, samples_to_use):
             db.execute("select count(*) from gab")
             expected_posts = sum([s["num_posts"] for s in samples_to_use])
             assert db.fetchone()[0] == expected_posts
+
+
+def test_cli_bulk_load(tmp_path):
+    runner = CliRunner()
+    db_path = tmp_path / "cli_bulk_test.db"
+
+    args = [str(s["path"]) for s in sample_data] + ["--bulk-load", str(db_path)]
+    result = runner.invoke(cli_main, args)
+    assert result.exit_code == 0
+
+    with sqlite3.connect(db_path) as db_connection:
+        db = db_connection.cursor()
+
+        db.execute("select count(*) from gab")
+        assert db.fetchone()[0] == sum([s["num_posts"] for s in sample_data])
+
+
+def test_cli_compressed_input(tmp_path):
+    runner = CliRunner()
+    db_path = tmp_path / "cli_compressed_test.db"
+
+    compressed_path = tmp_path / "sample01.jsonl.gz"
+    compressed_path.write_bytes(gzip.compress(sample_data[0]["path"].read_bytes()))
+
+    result = runner.invoke(cli_main, [str(compressed_path), str(db_path)])
+    assert result.exit_code == 0
+
+    with sqlite3.connect(db_path) as db_connection:
+        db = db_connection.cursor()
+
+        db.execute("select count(*) from gab")
+        assert db.fetchone()[0] == sample_data[0]["num_posts"]
+
+
+def test_cli_skips_loaded_files(tmp_path):
+    runner = CliRunner()
+    db_path = tmp_path / "cli_reload_test.db"
+    args = [str(sample_data[0]["path"]), str(db_path)]
+
+    assert runner.invoke(cli_main, args).exit_code == 0
+
+    result = runner.invoke(cli_main, args)
+    assert result.exit_code == 0
+    assert "skipped: already loaded" in result.output
+
+    with sqlite3.connect(db_path) as db_connection:
+        db = db_connection.cursor()
+
+        db.execute("select count(*) from gab")
+        assert db.fetchone()[0] == sample_data[0]["num_posts"]
+
+    assert runner.invoke(cli_main, ["--reload"] + args).exit_code == 0
+
+    with sqlite3.connect(db_path) as db_connection:
+        db = db_connection.cursor()
+
+        db.execute("select count(*) from gab")
+        assert db.fetchone()[0] == 2 * sample_data[0]["num_posts"]
+
+
+def test_cli_metrics_out(tmp_path):
+    runner = CliRunner()
+    db_path = tmp_path / "cli_metrics_test.db"
+    metrics_path = tmp_path / "metrics.json"
+
+    args = [str(s["path"]) for s in sample_data]
+    args += ["--profile", "--metrics-out", str(metrics_path), str(db_path)]
+    result = runner.invoke(cli_main, args)
+    assert result.exit_code == 0
+
+    metrics = json.loads(metrics_path.read_text())
+    assert metrics["files"] == len(sample_data)
+    num_posts = sum([s["num_posts"] for s in sample_data])
+    assert metrics["tables"]["gab"]["rows"] == num_posts
+
+
+def test_cli_shards(tmp_path):
+    runner = CliRunner()
+    db_path = tmp_path / "cli_shards_test.db"
+
+    args = [str(s["path"]) for s in sample_data] + ["--shards", "2", str(db_path)]
+    result = runner.invoke(cli_main, args)
+    assert result.exit_code == 0
+
+    with sqlite3.connect(db_path) as db_connection:
+        db = db_connection.cursor()
+
+        db.execute("select count(*) from gab")
+        assert db.fetchone()[0] == sum([s["num_posts"] for s in sample_data])
+
+        db.execute("select count(distinct _file_id) from gab")
+        assert db.fetchone()[0] == len(sample_data)
+
+
+def test_cli_shards_skip_repeated_files(tmp_path):
+    runner = CliRunner()
+    db_path = tmp_path / "cli_shards_repeated_test.db"
+    copy_path = tmp_path / "copy.json"
+    copy_path.write_bytes(sample_data[0]["path"].read_bytes())
+
+    args = [str(s["path"]) for s in sample_data] + [str(copy_path)]
+    result = runner.invoke(cli_main, args + ["--shards", "2", str(db_path)])
+    assert result.exit_code == 0
+    assert f"- {copy_path} skipped: already loaded" in result.output
+
+    with sqlite3.connect(db_path) as db_connection:
+        db = db_connection.cursor()
+
+        db.execute("select count(*) from gab")
+        assert db.fetchone()[0] == sum([s["num_posts"] for s in sample_data])
+
+
+@pytest.mark.parametrize("shards", ["1", "2"])
+def test_cli_quarantine(tmp_path, shards):
+    runner = CliRunner()
+    db_path = tmp_path / "cli_quarantine_test.db"
+    quarantine_path = tmp_path / "quarantine.jsonl.gz"
+
+    bad_paths = []
+    for number, bad_line in enumerate(["{not json", '{"id": "1"}']):
+        bad_path = tmp_path / f"bad{number}.json"
+        bad_path.write_text(
+            sample_data[0]["path"].read_text() + bad_line + "\n", encoding="utf-8"
+        )
+        bad_paths.append(str(bad_path))
+
+    args = bad_paths + [
+        "--quarantine",
+        str(quarantine_path),
+        "--shards",
+        shards,
+        str(db_path),
+    ]
+    result = runner.invoke(cli_main, args)
+    assert result.exit_code == 0
+    assert "1 posts failed to parse, and 1 failed to map" in result.output
+
+    with gzip.open(quarantine_path, "rt") as quarantine_fh:
+        records = [json.loads(line) for line in quarantine_fh]
+    assert [(record["file"], record["stage"]) for record in records] == [
+        ("bad0.json", "parse"),
+        ("bad1.json", "map"),
+    ]
+
+
+@pytest.mark.parametrize(
+    "options,exit_code",
+    [
+        (["--commit-every", "256MB"], 0),
+        (["--commit-every", "1 lines"], 0),
+        (["--checkpoint-every", "0"], 0),
+        (["--commit-every", "256 furlongs"], 2),
+    ],
+)
+def test_cli_commit_every(tmp_path, options, exit_code):
+    runner = CliRunner()
+    db_path = tmp_path / "cli_commit_test.db"
+
+    args = [str(s["path"]) for s in sample_data] + options + [str(db_path)]
+    result = runner.invoke(cli_main, args)
+    assert result.exit_code == exit_code
+
+    if exit_code == 0:
+        with sqlite3.connect(db_path) as db_connection:
+            unfinished = db_connection.execute(
+                "select id from _inserted_files where num_gabs_inserted is null"
+            ).fetchall()
+            assert unfinished == []
+
+
+def test_cli_merge(tmp_path):
+    runner = CliRunner()
+    source_paths = []
+
+    for number, sample in enumerate(sample_data):
+        source_path = tmp_path / f"source{number}.db"
+        result = runner.invoke(cli_main, [str(sample["path"]), str(source_path)])
+        assert result.exit_code == 0
+        source_paths.append(str(source_path))
+
+    db_path = tmp_path / "cli_merge_test.db"
+    result = runner.invoke(cli_main, ["merge"] + source_paths + [str(db_path)])
+    assert result.exit_code == 0
+
+    # Merging again adds nothing, as the files are already in the database
+    result = runner.invoke(cli_main, ["merge"] + source_paths + [str(db_path)])
+    assert result.exit_code == 0
+
+    with sqlite3.connect(db_path) as db_connection:
+        db = db_connection.cursor()
+
+        db.execute("select count(*) from gab")
+        assert db.fetchone()[0] == sum([s["num_posts"] for s in sample_data])
+
+        db.execute("select count(*) from _inserted_files")
+        assert db.fetchone()[0] == len(sample_data)
+
+
+def test_cli_rebuild_unique(tmp_path):
+    runner = CliRunner()
+    db_path = tmp_path / "cli_rebuild_test.db"
+
+    args = [str(s["path"]) for s in sample_data] + [str(db_path)]
+    assert runner.invoke(cli_main, args).exit_code == 0
+
+    with sqlite3.connect(db_path) as db_connection:
+        db_connection.execute("delete from gab_unique")
+        db_connection.commit()
+
+    result = runner.invoke(cli_main, ["rebuild-unique", str(db_path)])
+    assert result.exit_code == 0
+
+    with sqlite3.connect(db_path) as db_connection:
+        db = db_connection.cursor()
+
+        db.execute("select count(*) from gab_unique")
+        assert db.fetchone()[0] == sum([s["num_posts"] for s in sample_data])
+
+
+def test_cli_rebuild_unique_upgrades_old_schema(tmp_path):
+    runner = CliRunner()
+    current_path = tmp_path / "current.db"
+    old_path = tmp_path / "old.db"
+
+    args = [str(s["path"]) for s in sample_data[:2]]
+    assert runner.invoke(cli_main, args + [str(current_path)]).exit_code == 0
+
+    # The same data, in a database with the schema from before the one row per id
+    # tables, which had group by views instead
+    old_schema = sample_data_directory / "gab_schema_2021-08-30.sql"
+    with sqlite3.connect(old_path) as db_connection:
+        db_connection.executescript(old_schema.read_text())
+        db_connection.execute("attach database ? as current", [str(current_path)])
+        old_tables = db_connection.execute(
+            """
+            select name from sqlite_master
+            where type = 'table' and name != '_gab_tidy_data'
+            """
+        ).fetchall()
+        for (table,) in old_tables:
+            columns = ", ".join(gts.stored_columns(db_connection, table))
+            db_connection.execute(
+                f"insert into main.{table} ({columns}) "
+                f"select {columns} from current.{table}"
+            )
+        db_connection.commit()
+        db_connection.execute("detach database current")
+
+    # Refused until it has been upgraded
+    result = runner.invoke(cli_main, [str(sample_data[2]["path"]), str(old_path)])
+    assert result.exit_code != 0
+    assert "rebuild-unique" in result.output
+
+    result = runner.invoke(cli_main, ["rebuild-unique", str(old_path)])
+    assert result.exit_code == 0
+    assert "Upgraded" in result.output
+
+    # Then loads like a database made with the current schema
+    for db_path in [old_path, current_path]:
+        result = runner.invoke(cli_main, [str(sample_data[2]["path"]), str(db_path)])
+        assert result.exit_code == 0
+
+    def unique_rows(db_path):
+        with sqlite3.connect(db_path) as db_connection:
+            assert gts.schema_is_current(db_connection)
+            rows = {}
+            for table in ["gab_unique", "account_unique", "gab_group_unique"]:
+                columns = ", ".join(gts.unique_table_columns(db_connection, table))
+                rows[table] = db_connection.execute(
+                    f"select {columns} from {table} order by id"
+                ).fetchall()
+            return rows
+
+    assert unique_rows(old_path) == unique_rows(current_path)
+    assert len(unique_rows(old_path)["gab_unique"]) == sum(
+        s["num_posts"] for s in sample_data
+    )
+
+
+def test_cli_indexes(tmp_path):
+    runner = CliRunner()
+    db_path = tmp_path / "cli_indexes_test.db"
+
+    def index_names():
+        with sqlite3.connect(db_path) as db_connection:
+            return {
+                name
+                for (name,) in db_connection.execute(
+                    "select name from sqlite_master where type = 'index' "
+                    "and sql is not null"
+                )
+            }
+
+    args = [str(s["path"]) for s in sample_data] + [str(db_path)]
+    result = runner.invoke(cli_main, args + ["--indexes", "gab_account_id"])
+    assert result.exit_code == 0
+    assert "gab_account_id" in index_names()
+    assert "gab_tag_name" not in index_names()
+
+    result = runner.invoke(cli_main, ["index", str(db_path), "--indexes", "all"])
+    assert result.exit_code == 0
+    assert index_names() >= set(gts.query_indexes)
+
+    result = runner.invoke(cli_main, ["index", str(db_path), "--indexes", "nonsense"])
+    assert result.exit_code != 0
+
+
+def test_cli_full_text(tmp_path):
+    runner = CliRunner()
+    db_path = tmp_path / "cli_full_text_test.db"
+
+    args = [str(s["path"]) for s in sample_data[:1]] + [str(db_path), "--full-text"]
+    assert runner.invoke(cli_main, args).exit_code == 0
+
+    # Later loads keep the index up to date
+    args = [str(s["path"]) for s in sample_data[1:]] + [str(db_path)]
+    assert runner.invoke(cli_main, args).exit_code == 0
+
+    result = runner.invoke(cli_main, ["full-text", str(db_path), "--rebuild"])
+    assert result.exit_code == 0
+
+    with sqlite3.connect(db_path) as db_connection:
+        db = db_connection.cursor()
+
+        db.execute("select count(*) from gab_fts where gab_fts match 'example'")
+        assert db.fetchone()[0] == sum([s["num_posts"] for s in sample_data])
+
+
+def test_cli_clean_content(tmp_path):
+    runner = CliRunner()
+    db_path = tmp_path / "cli_clean_content_test.db"
+
+    args = [str(s["path"]) for s in sample_data] + [str(db_path), "--clean-content"]
+    assert runner.invoke(cli_main, args).exit_code == 0
+
+    with sqlite3.connect(db_path) as db_connection:
+        db = db_connection.cursor()
+
+        db.execute("select count(*) from gab_unique where content_text is not null")
+        assert db.fetchone()[0] == sum([s["num_posts"] for s in sample_data])
+
+
+def test_cli_storage_mode(tmp_path):
+    runner = CliRunner()
+    db_path = tmp_path / "cli_storage_mode_test.db"
+
+    args = [str(s["path"]) for s in sample_data] + [str(db_path)]
+    result = runner.invoke(cli_main, args + ["--storage-mode", "account_snapshots"])
+    assert result.exit_code == 0
+
+    with sqlite3.connect(db_path) as db_connection:
+        db = db_connection.cursor()
+
+        db.execute("select count(distinct id) from account")
+        assert db.fetchone()[0] == sum([s["num_authors"] for s in sample_data])
+
+    # Later loads don't need to give the storage modes again, but can't change them
+    assert runner.invoke(cli_main, args).exit_code == 0
+    result = runner.invoke(cli_main, args + ["--storage-mode", "account_snapshots"])
+    assert result.exit_code == 0
+    with sqlite3.connect(tmp_path / "other.db") as db_connection:
+        gts.initialise_empty_database(db_connection)
+    result = runner.invoke(
+        cli_main,
+        [str(sample_data[0]["path"]), str(tmp_path / "other.db")]
+        + ["--storage-mode", "account_snapshots"],
+    )
+    assert result.exit_code != 0
+
+
+def test_cli_export(tmp_path):
+    runner = CliRunner()
+    db_path = tmp_path / "cli_export_test.db"
+    output_path = tmp_path / "gabs.csv"
+
+    args = [str(s["path"]) for s in sample_data] + [str(db_path)]
+    assert runner.invoke(cli_main, args).exit_code == 0
+
+    result = runner.invoke(
+        cli_main, ["export", str(db_path), "gab_unique", str(output_path)]
+    )
+    assert result.exit_code == 0
+
+    num_posts = sum([s["num_posts"] for s in sample_data])
+    assert len(output_path.read_text(encoding="utf-8").splitlines()) == num_posts + 1
+
+    result = runner.invoke(
+        cli_main, ["export", str(db_path), "gab_unique", str(tmp_path / "gabs.txt")]
+    )
+    assert result.exit_code != 0
+
+
+def test_cli_follow(tmp_path):
+    runner = CliRunner()
+    db_path = tmp_path / "cli_follow_test.db"
+
+    args = ["follow", str(sample_data_directory), str(db_path), "--idle-timeout", "0"]
+    result = runner.invoke(cli_main, args)
+    assert result.exit_code == 0
+
+    with sqlite3.connect(db_path) as db_connection:
+        db = db_connection.cursor()
+
+        db.execute("select count(*) from gab_unique")
+        assert db.fetchone()[0] == sum([s["num_posts"] for s in sample_data])
@@ -0,0 +1,53 @@
+import gab_tidy_data.mapping_compiler as mapping_compiler
+from gab_tidy_data.row_cache import WrittenRowCache
+
+
+def emoji_row(shortcode, url):
+    return (shortcode, url, url + "_static")
+
+
+def test_unchanged_rows_skipped():
+    cache = WrittenRowCache()
+
+    first = [emoji_row("a", "1"), emoji_row("b", "1"), emoji_row("a", "1")]
+    assert cache.filter_unwritten("emoji", first) == first[:2]
+
+    # Changed rows are written again, unchanged ones aren't
+    second = [emoji_row("a", "2"), emoji_row("b", "1")]
+    assert cache.filter_unwritten("emoji", second) == [emoji_row("a", "2")]
+
+    assert cache.stats()["emoji"] == (2, 3)
+
+
+def test_uncached_tables_untouched():
+    cache = WrittenRowCache()
+    rows = [("1",)] * 3
+
+    assert cache.filter_unwritten("gab_tag", rows) == rows
+    assert sum(hits + misses for hits, misses in cache.stats().values()) == 0
+
+
+def test_group_key_includes_file():
+    cache = WrittenRowCache()
+    group_columns = mapping_compiler.columns["gab_group"]
+
+    def group_row(file_id):
+        row = [None] * len(group_columns)
+        row[group_columns.index("id")] = "7"
+        row[group_columns.index("_file_id")] = file_id
+        return tuple(row)
+
+    assert cache.filter_unwritten("gab_group", [group_row(1)]) == [group_row(1)]
+    assert cache.filter_unwritten("gab_group", [group_row(2)]) == [group_row(2)]
+    assert cache.filter_unwritten("gab_group", [group_row(2)]) == []
+
+
+def test_bounded_size():
+    cache = WrittenRowCache(max_size=2)
+
+    rows = [emoji_row(shortcode, "1") for shortcode in "abc"]
+    assert cache.filter_unwritten("emoji", rows) == rows
+
+    # "a" was evicted to make room for "c", so is written again
+    assert cache.filter_unwritten("emoji", rows[:1]) == rows[:1]
+    assert cache.filter_unwritten("emoji", rows[2:]) == []
@@ -0,0 +1,60 @@
+import json
+
+import gab_tidy_data.gab_data_mapping as data_mapping
+import gab_tidy_data.mapping_compiler as mapping_compiler
+from gab_tidy_data.synthetic_data import GeneratorSettings, generate_gabs, write_jsonl
+
+
+def test_generation_is_deterministic():
+    assert list(generate_gabs(50, seed=1)) == list(generate_gabs(50, seed=1))
+    assert list(generate_gabs(50, seed=1)) != list(generate_gabs(50, seed=2))
+
+
+def test_generated_gabs_map_like_real_gabs():
+    # Every generated gab maps the same way with the reference and compiled mappings
+    for gab in generate_gabs(200):
+        reference = data_mapping.map_gab_for_insert(1, gab)
+        rows = mapping_compiler.empty_rows()
+        mapping_compiler.map_gab_into(rows, 1, gab)
+
+        for table in data_mapping.data_table_names:
+            assert rows[table] == [
+                tuple(row[column] for column in mapping_compiler.columns[table])
+                for row in reference.get(table, [])
+            ]
+
+
+def test_settings_control_the_mix():
+    gabs = list(generate_gabs(1000, settings=GeneratorSettings()))
+    assert 50 < sum(gab["quote"] is not None for gab in gabs) < 150
+    assert 100 < sum(gab["group"] is not None for gab in gabs) < 300
+    assert len({gab["account"]["id"] for gab in gabs}) < 400
+
+    plain = GeneratorSettings(
+        quote_rate=0,
+        group_rate=0,
+        media_rate=0,
+        mention_rate=0,
+        emoji_rate=0,
+        card_rate=0,
+        repeat_account_rate=0,
+    )
+    gabs = list(generate_gabs(100, settings=plain))
+    assert all(
+        gab["quote"] is None
+        and gab["group"] is None
+        and gab["card"] is None
+        and not gab["media_attachments"]
+        and not gab["mentions"]
+        and not gab["emojis"]
+        for gab in gabs
+    )
+    assert len({gab["account"]["id"] for gab in gabs}) == 100
+
+
+def test_write_jsonl(tmp_path):
+    path = tmp_path / "synthetic.jsonl"
+    write_jsonl(path, 10, seed=3)
+
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line) for line in lines] == list(generate_gabs(10, seed=3))
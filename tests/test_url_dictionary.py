@@ -0,0 +1,60 @@
+import sqlite3
+
+import pytest
+
+import gab_tidy_data.gab_to_sqlite as gts
+import gab_tidy_data.mapping_compiler as mapping_compiler
+from gab_tidy_data.url_dictionary import UrlDictionary, split_url
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "https://gab.com/avatars/original/missing.png",
+        "https://example.com/",
+        "https://example.com",
+        "no slashes",
+        "",
+    ],
+)
+def test_split_url_matches_sql(url):
+    prefix, rest = split_url(url)
+
+    assert prefix + rest == url
+    sql_prefix = (
+        sqlite3.connect(":memory:")
+        .execute("select rtrim(?1, replace(?1, '/', ''))", [url])
+        .fetchone()[0]
+    )
+    assert prefix == sql_prefix
+
+
+def test_encode_rows():
+    db_connection = sqlite3.connect(":memory:")
+    gts.initialise_empty_database(db_connection, ["url_dictionary"])
+    url_dictionary = UrlDictionary(db_connection.cursor(), max_size=1)
+
+    columns = mapping_compiler.columns["card"]
+    row = tuple(
+        f"https://example.com/cards/{column}" if column.endswith("url") else column
+        for column in columns
+    )
+    encoded = url_dictionary.encode_rows("card", [row, row])
+
+    assert encoded[0] == encoded[1]
+    assert len(encoded[0]) == len(columns) + 4
+    assert encoded[0][columns.index("url")] == "url"
+    assert db_connection.execute("select * from url_prefix").fetchall() == [
+        (1, "https://example.com/cards/")
+    ]
+
+    # Prefixes dropped from the cache are found again in the database
+    assert url_dictionary.prefix_id("https://example.com/") == 2
+    assert url_dictionary.prefix_id("https://example.com/cards/") == 1
+
+
+def test_conflicting_storage_modes():
+    with pytest.raises(ValueError):
+        gts.initialise_empty_database(
+            sqlite3.connect(":memory:"), ["account_snapshots", "url_dictionary"]
+        )